@@ -1,10 +1,10 @@
-import asyncio
 import io
 import json
-from concurrent.futures import ThreadPoolExecutor
-from typing import Any, Dict, List
+import threading
+from typing import Any, Dict, List, Tuple
 from uuid import UUID
 
+import requests
 from bisheng.api.errcode.finetune import (CancelJobError, ChangeModelNameError, CreateFinetuneError,
                                           DeleteJobError, ExportJobError, InvalidExtraParamsError,
                                           JobStatusError, NotFoundJobError, TrainDataNoneError,
@@ -16,6 +16,7 @@ from bisheng.api.services.sft_backend import SFTBackend
 from bisheng.api.utils import parse_server_host
 from bisheng.api.v1.schemas import FinetuneInfoResponse, UnifiedResponseModel, resp_200
 from bisheng.cache import InMemoryCache
+from bisheng.cache.redis import redis_client
 from bisheng.database.models.finetune import (Finetune, FinetuneChangeModelName, FinetuneDao,
                                               FinetuneExtraParams, FinetuneList, FinetuneStatus)
 from bisheng.database.models.model_deploy import ModelDeploy, ModelDeployDao
@@ -24,11 +25,12 @@ from bisheng.utils.logger import logger
 from bisheng.utils.minio_client import MinioClient
 from pydantic import ValidationError
 
-sync_job_thread_pool = ThreadPoolExecutor(3)
-
 
 class FinetuneService:
     ServerCache: InMemoryCache = InMemoryCache()
+    # 训练日志的增量解析进度 {'size': 已上传的日志字节数, 'offset': 已解析的字节数, 'loss_data': 已解析的loss曲线}
+    LogTailKey = 'finetune:log_tail:{}'
+    LogTailExpire = 7 * 24 * 3600
 
     @classmethod
     def validate_params(cls, finetune: Finetune) -> UnifiedResponseModel | None:
@@ -188,6 +190,7 @@ class FinetuneService:
         logger.info('delete sft job data')
         # 清理minio上的日志文件
         FinetuneDao.delete_job(finetune)
+        redis_client.delete(cls.LogTailKey.format(finetune.id.hex))
         logger.info(f'delete sft job success, data: {finetune.dict}')
         return resp_200(data=None)
 
@@ -204,18 +207,68 @@ class FinetuneService:
         return log_path
 
     @classmethod
-    def get_job_log(cls, finetune: Finetune) -> str | None:
+    def get_job_log(cls, finetune: Finetune, offset: int = 0) -> Tuple[str | None, int]:
+        """ 读取日志文件offset字节之后的内容, 返回日志内容和新的offset """
         minio_client = MinioClient()
-        resp = minio_client.download_minio(finetune.log_path)
+        if offset > 0:
+            size = minio_client.object_size(finetune.log_path)
+            if size is None:
+                return None, offset
+            if offset == size:
+                # 没有新增的日志
+                return '', offset
+            if offset > size:
+                # 日志被重新生成，文件变小了，从头读取
+                logger.warning(f'job log size {size} is less than offset {offset}, read from start')
+                offset = 0
+        resp = minio_client.download_minio(finetune.log_path, offset=offset)
         if resp is None:
-            return None
+            return None, offset
         new_data = io.BytesIO()
         for d in resp.stream(32 * 1024):
             new_data.write(d)
         resp.close()
         resp.release_conn()
         new_data.seek(0)
-        return new_data.read().decode('utf-8')
+        log_bytes = new_data.read()
+        return log_bytes.decode('utf-8', errors='ignore'), offset + len(log_bytes)
+
+    @classmethod
+    def get_log_tail(cls, finetune: Finetune) -> Dict:
+        tail = redis_client.get(cls.LogTailKey.format(finetune.id.hex))
+        return tail if tail else {'size': 0, 'offset': 0, 'loss_data': []}
+
+    @classmethod
+    def save_log_tail(cls, finetune: Finetune, tail: Dict):
+        redis_client.set(cls.LogTailKey.format(finetune.id.hex), tail, cls.LogTailExpire)
+
+    @classmethod
+    def tail_log_data(cls, tail: Dict, log_data: bytes, final: bool = False) -> Dict:
+        """ 只解析上次offset之后新增的完整日志行，追加到loss曲线里。final为True时解析到日志末尾 """
+        if len(log_data) < tail['offset']:
+            # 任务重新训练后日志变短，重新解析
+            tail['offset'], tail['loss_data'] = 0, []
+        end = len(log_data) if final else log_data.rfind(b'\n') + 1
+        if end <= tail['offset']:
+            return tail
+        new_lines = log_data[tail['offset']:end].decode('utf-8')
+        tail['loss_data'].extend(cls.parse_log_data(new_lines))
+        tail['offset'] = end
+        return tail
+
+    @classmethod
+    def get_loss_data(cls, finetune: Finetune) -> List[Dict[str, str]]:
+        """ 获取已解析好的loss曲线，没有解析记录时读取一次完整日志重建 """
+        tail = cls.get_log_tail(finetune)
+        if tail['offset'] == 0:
+            log_data, size = cls.get_job_log(finetune)
+            if log_data is None:
+                return []
+            tail['size'] = size
+            tail = cls.tail_log_data(tail, log_data.encode('utf-8'),
+                                     final=finetune.status != FinetuneStatus.TRAINING.value)
+            cls.save_log_tail(finetune, tail)
+        return tail['loss_data']
 
     @classmethod
     def delete_published_model(cls, finetune: Finetune, server_endpoint: str) -> str | None:
@@ -331,28 +384,41 @@ class FinetuneService:
             if job_server:
                 tmp.server_name = job_server.server
             ret.append(tmp)
-        # 异步线程更新任务状态
-        asyncio.get_event_loop().run_in_executor(sync_job_thread_pool, cls.sync_all_job_status, job_list)
+        # 任务状态由后台轮询线程统一更新
         return resp_200(data={'data': ret, 'total': total})
 
     @classmethod
-    def sync_all_job_status(cls, job_list: List[Finetune]) -> None:
-        # 异步线程更新批量任务的状态
-        server_cache = {}
-        for finetune in job_list:
-            if finetune.server in server_cache.keys():
-                server = server_cache.get(finetune.server)
-            else:
-                server = ServerDao.find_server(finetune.server)
-                server_cache[finetune.server] = server
+    def sync_training_jobs(cls) -> None:
+        """ 同步所有训练中任务的状态，同一个SFT服务上的任务合并为一次查询 """
+        server_jobs: Dict[int, List[Finetune]] = {}
+        for finetune in FinetuneDao.find_training_jobs():
+            server_jobs.setdefault(finetune.server, []).append(finetune)
+        for server_id, job_list in server_jobs.items():
+            server = cls.get_server_by_cache(server_id)
             if not server:
-                logger.error(f'server not found: {finetune.server}')
+                logger.error(f'server not found: {server_id}')
+                continue
+            try:
+                sft_ret = SFTBackend.get_job_status_batch(host=parse_server_host(server.endpoint),
+                                                          job_ids=[one.id.hex for one in job_list])
+            except requests.RequestException as e:
+                logger.error(f'get sft job status batch error: server: {server_id}, err: {e}')
                 continue
-            cls.sync_job_status(finetune, server.endpoint)
+            if not sft_ret[0]:
+                logger.error(f'get sft job status batch error: server: {server_id}, err: {sft_ret[1]}')
+                continue
+            for finetune in job_list:
+                job_status = sft_ret[1].get(finetune.id.hex)
+                if not job_status:
+                    continue
+                try:
+                    cls.update_job_status(finetune, server.endpoint, job_status)
+                except Exception as e:
+                    logger.exception(f'update sft job status error: job_id: {finetune.id.hex}, err: {e}')
 
     @classmethod
-    def get_job_info(cls, job_id: UUID) -> UnifiedResponseModel:
-        """ 获取训练中任务的实时信息 """
+    def get_job_info(cls, job_id: UUID, log_offset: int = 0) -> UnifiedResponseModel:
+        """ 获取训练中任务的实时信息, log_offset为前端已获取到的日志字节数，只返回之后新增的日志 """
         # 查看job任务信息
         finetune = FinetuneDao.find_job(job_id)
         if not finetune:
@@ -367,19 +433,18 @@ class FinetuneService:
             if base_model:
                 base_model_name = base_model.model
 
-        # 同步任务执行情况
-        cls.sync_job_status(finetune, server.endpoint)
-
-        # 获取日志文件
+        # 任务状态和日志由后台轮询线程同步，这里只读取
+        # 获取新增的日志内容和已解析好的loss曲线
         log_data = None
         res_data = list()
         if finetune.log_path:
-            log_data = cls.get_job_log(finetune)
-            res_data = cls.parse_log_data(log_data)
+            log_data, log_offset = cls.get_job_log(finetune, log_offset)
+            res_data = cls.get_loss_data(finetune)
 
         return resp_200(data={
             'finetune': FinetuneInfoResponse(**finetune.dict(), base_model_name=base_model_name),
             'log': log_data,
+            'log_offset': log_offset,  # 下次请求时传入，只获取新增的日志
             'loss_data': res_data,  # like [{"step": 10, "loss": 0.5}, {"step": 20, "loss": 0.3}]
             'report': finetune.report if finetune.report else None,
         })
@@ -414,12 +479,17 @@ class FinetuneService:
         if not sft_ret[0]:
             logger.error(f'get sft job status error: job_id: {finetune.id.hex}, err: {sft_ret[1]}')
             return False
-        if sft_ret[1]['status'] == SFTBackend.JOB_FINISHED:
+        return cls.update_job_status(finetune, server_endpoint, sft_ret[1])
+
+    @classmethod
+    def update_job_status(cls, finetune: Finetune, server_endpoint: str, job_status: Dict) -> bool:
+        """ 根据SFT-backend返回的任务状态更新任务，并增量同步日志和报告 """
+        if job_status['status'] == SFTBackend.JOB_FINISHED:
             finetune.status = FinetuneStatus.SUCCESS.value
-            FinetuneDao.change_status(finetune.id, finetune.status, FinetuneStatus.SUCCESS.value)
-        elif sft_ret[1]['status'] == SFTBackend.JOB_FAILED:
+            FinetuneDao.change_status(finetune.id, FinetuneStatus.TRAINING.value, FinetuneStatus.SUCCESS.value)
+        elif job_status['status'] == SFTBackend.JOB_FAILED:
             finetune.status = FinetuneStatus.FAILED.value
-            finetune.reason = sft_ret[1]['reason']
+            finetune.reason = job_status['reason']
             FinetuneDao.update_job(finetune)
 
         # 执行失败无需查询日志和报告
@@ -432,10 +502,16 @@ class FinetuneService:
         sft_ret = SFTBackend.get_job_log(host=parse_server_host(server_endpoint), job_id=finetune.id.hex)
         if not sft_ret[0]:
             logger.error(f'get sft job log error: job_id: {finetune.id.hex}, err: {sft_ret[1]}')
+            return False
         log_data = sft_ret[1]['log_data'].encode('utf-8')
-        # 上传日志文件到minio上
-        log_path = cls.upload_job_log(finetune, io.BytesIO(log_data), len(log_data))
-        finetune.log_path = log_path
+        tail = cls.get_log_tail(finetune)
+        # 日志有变化时才重新上传到minio上
+        if not finetune.log_path or len(log_data) != tail['size']:
+            finetune.log_path = cls.upload_job_log(finetune, io.BytesIO(log_data), len(log_data))
+            tail['size'] = len(log_data)
+        # 只解析新增的日志行
+        tail = cls.tail_log_data(tail, log_data, final=finetune.status != FinetuneStatus.TRAINING.value)
+        cls.save_log_tail(finetune, tail)
 
         # 查询任务评估报告
         logger.info('start query sft job report')
@@ -488,3 +564,38 @@ class FinetuneService:
         published_model.model = model_name
         ModelDeployDao.update_model(published_model)
         return True
+
+
+class FinetuneStatusPoller:
+    """ 后台轮询训练中任务状态的线程，多个worker之间通过redis锁保证同一周期只有一个在轮询 """
+
+    LockKey = 'finetune:status_poller'
+
+    def __init__(self, interval: int = 30):
+        self.interval = interval
+        self._stop_event = threading.Event()
+        self._thread: threading.Thread | None = None
+
+    def start(self):
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, name='finetune_status_poller', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop_event.set()
+
+    def _run(self):
+        # 锁的过期时间略短于轮询间隔，保证下一轮开始前锁已释放
+        lock_ttl = max(self.interval - 1, 1)
+        while not self._stop_event.wait(self.interval):
+            try:
+                if not redis_client.setNxEx(self.LockKey, 1, expiration=lock_ttl):
+                    continue
+                FinetuneService.sync_training_jobs()
+            except Exception as e:
+                logger.exception(f'finetune status poller error: {e}')
+
+
+finetune_status_poller = FinetuneStatusPoller()
@@ -1,4 +1,4 @@
-from typing import Dict
+from typing import Dict, List, Set
 
 import requests
 
@@ -13,6 +13,11 @@ class SFTBackend:
     JOB_FINISHED = 'FINISHED'
     JOB_FAILED = 'FAILED'
 
+    # 不支持批量查询任务状态的SFT服务地址
+    _no_batch_hosts: Set[str] = set()
+    # 后台轮询使用的请求超时时间，单位秒，避免SFT服务无响应时轮询线程一直持有锁
+    poll_timeout = 30
+
     @classmethod
     def handle_response(cls, res) -> (bool, str | None | Dict):
         if res.status_code != 200 or res.json()['status_code'] != 200:
@@ -80,6 +85,47 @@ class SFTBackend:
         res = requests.post(f'{host}{url}', json={'uri': uri, 'job_id': job_id})
         return cls.handle_response(res)
 
+    @classmethod
+    def get_job_status_batch(cls, host: str, job_ids: List[str]) -> (bool, str | Dict):
+        """
+         批量获取同一个SFT服务上的训练任务状态
+         接口返回格式：
+         {
+            "job_id": {"status": "FINISHED", "reason": "失败原因"}
+         }
+         SFT-backend不支持批量接口时，退化为复用同一连接逐个查询
+        """
+        uri = '/v2.1/sft/job/status/batch'
+        url = '/v2.1/models/sft_elem/infer'
+        if host not in cls._no_batch_hosts:
+            res = requests.post(f'{host}{url}', json={'uri': uri, 'job_ids': job_ids}, timeout=cls.poll_timeout)
+            ret = cls.handle_response(res)
+            if ret[0] and isinstance(ret[1], dict):
+                return ret
+            # 只有明确不支持批量接口时才不再尝试，其他错误本次退化为逐个查询
+            if cls._unsupported(res):
+                cls._no_batch_hosts.add(host)
+
+        uri = '/v2.1/sft/job/status'
+        result = {}
+        with requests.Session() as session:
+            for job_id in job_ids:
+                ret = cls.handle_response(
+                    session.post(f'{host}{url}', json={'uri': uri, 'job_id': job_id}, timeout=cls.poll_timeout))
+                if not ret[0]:
+                    return ret
+                result[job_id] = ret[1]
+        return True, result
+
+    @staticmethod
+    def _unsupported(res) -> bool:
+        if res.status_code in (404, 405):
+            return True
+        try:
+            return res.json().get('status_code') in (404, 405)
+        except ValueError:
+            return False
+
     @classmethod
     def get_job_log(cls, host: str, job_id: str) -> (bool, str | Dict):
         """
@@ -92,7 +138,7 @@ class SFTBackend:
         """
         uri = '/v2.1/sft/job/log'
         url = '/v2.1/models/sft_elem/infer'
-        res = requests.post(f'{host}{url}', json={'uri': uri, 'job_id': job_id})
+        res = requests.post(f'{host}{url}', json={'uri': uri, 'job_id': job_id}, timeout=cls.poll_timeout)
         return cls.handle_response(res)
 
     @classmethod
@@ -1,6 +1,8 @@
 import asyncio
-from typing import Any, Dict, List, Union
+import time
+from typing import Any, Dict, List, Optional, Union
 
+import orjson
 from bisheng.api.v1.schemas import ChatResponse
 from bisheng.utils.logger import logger
 from fastapi import WebSocket
@@ -15,17 +17,72 @@ from langchain.schema.messages import BaseMessage
 class AsyncStreamingLLMCallbackHandler(AsyncCallbackHandler):
     """Callback handler for streaming LLM responses."""
 
-    def __init__(self, websocket: WebSocket, flow_id: str, chat_id: str):
+    # token合并发送的默认配置，interval_ms或max_chars为0时每个token单独发送
+    default_coalesce = {'interval_ms': 20, 'max_chars': 64, 'max_pending_chars': 2048}
+
+    def __init__(self, websocket: WebSocket, flow_id: str, chat_id: str, coalesce: Optional[dict] = None):
         self.websocket = websocket
         self.flow_id = flow_id
         self.chat_id = chat_id
 
+        coalesce = {**self.default_coalesce, **(coalesce or {})}
+        self.stream_interval = coalesce['interval_ms'] / 1000
+        self.stream_max_chars = coalesce['max_chars']
+        # 客户端发送缓慢时最多积压的字符数，超过后阻塞token的产生
+        self.stream_max_pending = max(coalesce['max_pending_chars'], self.stream_max_chars)
+        # stream帧的固定模板，发送时只替换message
+        self._stream_frame = ChatResponse(message='', type='stream', flow_id=flow_id, chat_id=chat_id).dict()
+        self._tokens: List[str] = []
+        self._pending_chars = 0
+        self._flush_task: Optional[asyncio.Task] = None
+        self._send_lock = asyncio.Lock()
+
     async def on_llm_new_token(self, token: str, **kwargs: Any) -> None:
-        resp = ChatResponse(message=token,
-                            type='stream',
-                            flow_id=self.flow_id,
-                            chat_id=self.chat_id)
-        await self.websocket.send_json(resp.dict())
+        if not self.stream_interval or not self.stream_max_chars:
+            await self._send_stream(token)
+            return
+        self._tokens.append(token)
+        self._pending_chars += len(token)
+        # 上一帧还在发送时继续合并，由延迟任务在发送完成后发出，积压过多时等待客户端消费
+        if self._pending_chars >= self.stream_max_chars and (not self._send_lock.locked()
+                                                             or self._pending_chars >= self.stream_max_pending):
+            await self.flush_tokens()
+        elif self._flush_task is None:
+            self._flush_task = asyncio.ensure_future(self._flush_later())
+
+    async def _flush_later(self):
+        await asyncio.sleep(self.stream_interval)
+        self._flush_task = None
+        await self.flush_tokens()
+
+    async def flush_tokens(self):
+        """把已合并的token作为一帧发出，其他消息发送前需要先调用以保证顺序"""
+        if self._flush_task is not None and self._flush_task is not asyncio.current_task():
+            self._flush_task.cancel()
+        self._flush_task = None
+        async with self._send_lock:
+            if not self._tokens:
+                return
+            message = ''.join(self._tokens)
+            self._tokens.clear()
+            self._pending_chars = 0
+            await self._send_stream_frame(message)
+
+    async def _send_stream(self, message: str):
+        async with self._send_lock:
+            await self._send_stream_frame(message)
+
+    async def _send_stream_frame(self, message: str):
+        start = time.perf_counter()
+        await self.websocket.send_text(orjson.dumps({**self._stream_frame, 'message': message}).decode())
+        cost = time.perf_counter() - start
+        if cost > 1:
+            logger.warning(f'stream_send_slow chat_id={self.chat_id} cost={cost:.3f}s chars={len(message)}')
+
+    async def send_json(self, data: dict):
+        await self.flush_tokens()
+        async with self._send_lock:
+            await self.websocket.send_json(data)
 
     async def on_llm_start(self, serialized: Dict[str, Any], prompts: List[str],
                            **kwargs: Any) -> Any:
@@ -34,10 +91,12 @@ class AsyncStreamingLLMCallbackHandler(AsyncCallbackHandler):
 
     async def on_llm_end(self, response: LLMResult, **kwargs: Any) -> Any:
         """Run when LLM ends running."""
+        await self.flush_tokens()
         logger.debug(f'llm_end response={response}')
 
     async def on_llm_error(self, error: Union[Exception, KeyboardInterrupt], **kwargs: Any) -> Any:
         """Run when LLM errors."""
+        await self.flush_tokens()
 
     async def on_chain_start(self, serialized: Dict[str, Any], inputs: Dict[str, Any],
                              **kwargs: Any) -> Any:
@@ -51,6 +110,7 @@ class AsyncStreamingLLMCallbackHandler(AsyncCallbackHandler):
     async def on_chain_error(self, error: Union[Exception, KeyboardInterrupt],
                              **kwargs: Any) -> Any:
         """Run when chain errors."""
+        await self.flush_tokens()
 
     async def on_tool_start(self, serialized: Dict[str, Any], input_str: str,
                             **kwargs: Any) -> Any:
@@ -59,7 +119,7 @@ class AsyncStreamingLLMCallbackHandler(AsyncCallbackHandler):
                             intermediate_steps=f'Tool input: {input_str}',
                             flow_id=self.flow_id,
                             chat_id=self.chat_id)
-        await self.websocket.send_json(resp.dict())
+        await self.send_json(resp.dict())
 
     async def on_tool_end(self, output: str, **kwargs: Any) -> Any:
         """Run when tool ends running."""
@@ -79,7 +139,7 @@ class AsyncStreamingLLMCallbackHandler(AsyncCallbackHandler):
 
         try:
             # This is to emulate the stream of tokens
-            await self.websocket.send_json(resp.dict())
+            await self.send_json(resp.dict())
         except Exception as e:
             logger.error(e)
 
@@ -108,17 +168,17 @@ class AsyncStreamingLLMCallbackHandler(AsyncCallbackHandler):
                                  chat_id=self.chat_id)
 
             if receiver and receiver.get('is_self'):
-                await self.websocket.send_json(log.dict())
+                await self.send_json(log.dict())
             else:
-                await self.websocket.send_json(log.dict())
-                await self.websocket.send_json(start.dict())
+                await self.send_json(log.dict())
+                await self.send_json(start.dict())
         elif 'category' in kwargs:
             if 'autogen' == kwargs['category']:
                 log = ChatResponse(message=text,
                                    type='stream',
                                    flow_id=self.flow_id,
                                    chat_id=self.chat_id)
-                await self.websocket.send_json(log.dict())
+                await self.send_json(log.dict())
                 if kwargs.get('type'):
                     # 兼容下
                     start = ChatResponse(type='start',
@@ -130,8 +190,8 @@ class AsyncStreamingLLMCallbackHandler(AsyncCallbackHandler):
                                        category=kwargs.get('type'),
                                        flow_id=self.flow_id,
                                        chat_id=self.chat_id)
-                    await self.websocket.send_json(start.dict())
-                    await self.websocket.send_json(end.dict())
+                    await self.send_json(start.dict())
+                    await self.send_json(end.dict())
             else:
                 log = ChatResponse(message=text,
                                    intermediate_steps=kwargs['log'],
@@ -139,7 +199,7 @@ class AsyncStreamingLLMCallbackHandler(AsyncCallbackHandler):
                                    category=kwargs['category'],
                                    flow_id=self.flow_id,
                                    chat_id=self.chat_id)
-                await self.websocket.send_json(log.dict())
+                await self.send_json(log.dict())
         logger.debug(f'on_text text={text} kwargs={kwargs}')
 
     async def on_agent_action(self, action: AgentAction, **kwargs: Any):
@@ -153,13 +213,13 @@ class AsyncStreamingLLMCallbackHandler(AsyncCallbackHandler):
                                     intermediate_steps=log,
                                     flow_id=self.flow_id,
                                     chat_id=self.chat_id)
-                await self.websocket.send_json(resp.dict())
+                await self.send_json(resp.dict())
         else:
             resp = ChatResponse(type='stream',
                                 intermediate_steps=log,
                                 flow_id=self.flow_id,
                                 chat_id=self.chat_id)
-            await self.websocket.send_json(resp.dict())
+            await self.send_json(resp.dict())
 
     async def on_agent_finish(self, finish: AgentFinish, **kwargs: Any) -> Any:
         """Run on agent end."""
@@ -167,7 +227,7 @@ class AsyncStreamingLLMCallbackHandler(AsyncCallbackHandler):
                             chat_id=self.chat_id,
                             type='stream',
                             intermediate_steps=finish.log)
-        await self.websocket.send_json(resp.dict())
+        await self.send_json(resp.dict())
 
     async def on_retriever_start(self, serialized: Dict[str, Any], query: str,
                                  **kwargs: Any) -> Any:
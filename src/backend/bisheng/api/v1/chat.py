@@ -6,7 +6,7 @@ from bisheng.api.services.chat_imp import comment_answer
 from bisheng.api.utils import build_flow, build_input_keys_response
 from bisheng.api.v1.schemas import (BuildStatus, BuiltResponse, ChatInput, ChatList, InitResponse,
                                     StreamData, UnifiedResponseModel, resp_200)
-from bisheng.cache.redis import redis_client
+from bisheng.cache.redis import redis_async_client, redis_client
 from bisheng.chat.manager import ChatManager
 from bisheng.database.base import session_getter
 from bisheng.database.models.flow import Flow
@@ -22,7 +22,7 @@ from sqlalchemy import delete, func
 from sqlmodel import select
 
 router = APIRouter(tags=['Chat'])
-chat_manager = ChatManager()
+chat_manager = ChatManager('v1')
 flow_data_store = redis_client
 expire = 600  # reids 60s 过期
 
@@ -153,14 +153,14 @@ async def chat(
             graph_data = db_flow.data
         else:
             flow_data_key = 'flow_data_' + flow_id
-            if not flow_data_store.exists(flow_data_key) or str(
-                    flow_data_store.hget(flow_data_key, 'status'),
-                    'utf-8') != BuildStatus.SUCCESS.value:
+            # 状态和技能数据一次读取
+            build_status, graph_data = await redis_async_client.hmget(flow_data_key, ['status', 'graph_data'])
+            if not build_status or str(build_status, 'utf-8') != BuildStatus.SUCCESS.value:
                 await websocket.accept()
                 message = '当前编译没通过'
                 await websocket.close(code=status.WS_1013_TRY_AGAIN_LATER, reason=message)
                 return
-            graph_data = json.loads(flow_data_store.hget(flow_data_key, 'graph_data'))
+            graph_data = json.loads(graph_data)
 
         if not chat_id:
             # 调试时，每次都初始化对象
@@ -168,7 +168,7 @@ async def chat(
 
         with logger.contextualize(trace_id=chat_id):
             logger.info('websocket_verify_ok begin=handle_websocket')
-            await chat_manager.handle_websocket(flow_id,
+            await chat_manager.dispatch_websocket(flow_id,
                                                 chat_id,
                                                 websocket,
                                                 user_id,
@@ -200,16 +200,17 @@ async def init_build(*, graph_data: dict, flow_id: str):
             raise ValueError('No ID provided')
         # Check if already building
         flow_data_key = 'flow_data_' + flow_id
-        if flow_data_store.hget(flow_data_key, 'status') == BuildStatus.IN_PROGRESS.value:
+        build_status = await redis_async_client.hget(flow_data_key, 'status')
+        if build_status and str(build_status, 'utf-8') == BuildStatus.IN_PROGRESS.value:
             return resp_200(InitResponse(flowId=flow_id))
 
         # Delete from cache if already exists
-        flow_data_store.hset(flow_data_key,
-                             map={
-                                 'graph_data': json.dumps(graph_data),
-                                 'status': BuildStatus.STARTED.value
-                             },
-                             expiration=expire)
+        await redis_async_client.hset(flow_data_key,
+                                      map={
+                                          'graph_data': json.dumps(graph_data),
+                                          'status': BuildStatus.STARTED.value
+                                      },
+                                      expiration=expire)
 
         return resp_200(InitResponse(flowId=flow_id))
     except Exception as exc:
@@ -222,7 +223,8 @@ async def build_status(flow_id: str):
     """Check the flow_id is in the flow_data_store."""
     try:
         flow_data_key = 'flow_data_' + flow_id
-        built = (flow_data_store.hget(flow_data_key, 'status') == BuildStatus.SUCCESS.value)
+        build_status = await redis_async_client.hget(flow_data_key, 'status')
+        built = bool(build_status) and str(build_status, 'utf-8') == BuildStatus.SUCCESS.value
         return resp_200(BuiltResponse(built=built, ))
 
     except Exception as exc:
@@ -1,5 +1,7 @@
+import asyncio
 import copy
 import json
+import time
 from typing import Annotated, Optional, Union
 
 import yaml
@@ -9,6 +11,7 @@ from bisheng.api.v1.schemas import (ProcessResponse, UnifiedResponseModel, Uploa
                                     resp_200)
 from bisheng.cache.redis import redis_client
 from bisheng.cache.utils import save_uploaded_file
+from bisheng.chat.answer_cache import answer_cache
 from bisheng.chat.utils import judge_source, process_source_document
 from bisheng.database.base import session_getter
 from bisheng.database.models.config import Config
@@ -145,8 +148,22 @@ async def process_flow(
             except Exception as exc:
                 logger.error(f'Error processing tweaks: {exc}')
 
+        # 新会话没有历史消息，可以使用问答缓存
+        answer_scope, cached = None, None
+        if sync and session_id is None and inputs:
+            answer_scope = await asyncio.to_thread(answer_cache.scope, flow_id, graph_data)
+            if answer_scope:
+                cached = await asyncio.to_thread(answer_cache.lookup, answer_scope, inputs)
+
         # process
-        if sync:
+        if cached:
+            session_id = get_session_service().generate_key(session_id=session_id, data_graph=graph_data)
+            task_result = {
+                cached.output_key or 'answer': cached.answer,
+                'source_documents': cached.source_documents
+            }
+        elif sync:
+            start_time = time.time()
             result = await process_graph_cached(graph_data,
                                                 inputs,
                                                 clear_cache,
@@ -159,6 +176,12 @@ async def process_flow(
             elif hasattr(result, 'result') and hasattr(result, 'session_id'):
                 task_result = result.result
                 session_id = result.session_id
+            output_key = next((k for k in task_result if k != 'source_documents'),
+                              None) if isinstance(task_result, dict) else None
+            if answer_scope and output_key:
+                await asyncio.to_thread(answer_cache.store, answer_scope, inputs, task_result[output_key],
+                                        task_result.get('source_documents'), time.time() - start_time,
+                                        output_key)
         else:
             logger.warning('This is an experimental feature and may not work as expected.'
                            'Please report any issues to our GitHub repository.')
@@ -90,14 +90,15 @@ async def get_job(*,
     return FinetuneService.get_all_job(req_data)
 
 
-# 获取任务最新详细信息，此接口会同步查询SFT-backend侧将任务状态更新到最新
+# 获取任务最新详细信息，任务状态由后台轮询线程同步，日志只返回log_offset之后新增的内容
 @router.get('/job/info', response_model=UnifiedResponseModel[Finetune])
 async def get_job_info(*,
                        job_id: UUID,
+                       log_offset: int = Query(default=0, description='已获取到的日志字节数'),
                        Authorize: AuthJWT = Depends()):
     # get login user
     Authorize.jwt_required()
-    return FinetuneService.get_job_info(job_id)
+    return FinetuneService.get_job_info(job_id, log_offset)
 
 
 @router.patch('/job/model', response_model=UnifiedResponseModel)
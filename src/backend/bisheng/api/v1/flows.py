@@ -5,6 +5,7 @@ from uuid import UUID
 from bisheng.api.utils import (access_check, build_flow_no_yield, get_L2_param_from_flow,
                                remove_api_keys)
 from bisheng.api.v1.schemas import FlowListCreate, FlowListRead, UnifiedResponseModel, resp_200
+from bisheng.chat.answer_cache import answer_cache
 from bisheng.database.base import session_getter
 from bisheng.database.models.flow import Flow, FlowCreate, FlowRead, FlowReadWithStyle, FlowUpdate
 from bisheng.database.models.role_access import AccessType, RoleAccess
@@ -118,6 +119,12 @@ def read_flow(*, flow_id: UUID):
     raise HTTPException(status_code=404, detail='Flow not found')
 
 
+@router.get('/{flow_id}/answer_cache', status_code=200)
+def read_answer_cache_stats(*, flow_id: UUID):
+    """问答缓存的命中率和节省的耗时"""
+    return resp_200(answer_cache.stats(flow_id))
+
+
 @router.patch('/{flow_id}', response_model=UnifiedResponseModel[FlowRead], status_code=200)
 async def update_flow(*, flow_id: UUID, flow: FlowUpdate, Authorize: AuthJWT = Depends()):
     """Update a flow."""
@@ -1,6 +1,9 @@
 import base64
 import json
+import os
+import random
 import re
+import tempfile
 import time
 from typing import List, Optional
 from uuid import uuid4
@@ -8,6 +11,8 @@ from uuid import uuid4
 import requests
 from bisheng.api.utils import access_check
 from bisheng.api.v1.schemas import UnifiedResponseModel, UploadFileResponse, resp_200
+from bisheng.cache.redis import redis_client
+from bisheng.cache.parse_cache import parse_cache
 from bisheng.cache.utils import file_download, save_uploaded_file
 from bisheng.database.base import session_getter
 from bisheng.database.models.knowledge import Knowledge, KnowledgeCreate, KnowledgeRead
@@ -35,7 +40,7 @@ from langchain.embeddings.openai import OpenAIEmbeddings
 from langchain.schema import Document
 from langchain.text_splitter import CharacterTextSplitter
 from langchain.vectorstores.base import VectorStore
-from pymilvus import Collection
+from pymilvus import Collection, MilvusException
 from sqlalchemy import delete, func, or_
 from sqlmodel import select
 
@@ -71,7 +76,7 @@ async def upload_file(*, file: UploadFile = File(...)):
 async def get_embedding():
     try:
         # 获取本地配置的名字
-        model_list = settings.get_knowledge().get('embeddings')
+        model_list = (await settings.aget_knowledge()).get('embeddings')
         if model_list:
             models = list(model_list.keys())
         else:
@@ -123,10 +128,10 @@ async def process_knowledge(*,
     for path in file_path:
         filepath, file_name = file_download(path)
         md5_ = filepath.rsplit('/', 1)[1].split('.')[0].split('_')[0]
-        # 是否包含重复文件
+        # 是否包含重复文件，解析中(1)的文件也算重复，避免同一文件并发入库
         with session_getter() as session:
             repeat = session.exec(
-                select(KnowledgeFile).where(KnowledgeFile.md5 == md5_, KnowledgeFile.status == 2,
+                select(KnowledgeFile).where(KnowledgeFile.md5 == md5_, KnowledgeFile.status.in_([1, 2]),
                                             KnowledgeFile.knowledge_id == knowledge_id)).all()
         status = 3 if repeat else 1
         remark = 'file repeat' if repeat else ''
@@ -147,8 +152,8 @@ async def process_knowledge(*,
         result.append(db_file.copy())
 
     if files:
-        background_tasks.add_task(
-            addEmbedding,
+        dispatch_embedding(
+            background_tasks,
             collection_name=collection_name,
             index_name=knowledge.index_name or knowledge.collection_name,
             knowledge_id=knowledge_id,
@@ -381,26 +386,16 @@ def delete_knowledge_file(*, file_id: int, Authorize: AuthJWT = Depends()):
     collection_name = knowledge.collection_name
     embeddings = FakeEmbedding()
     vectore_client = decide_vectorstores(collection_name, 'Milvus', embeddings)
-    if isinstance(vectore_client, Milvus) and vectore_client.col:
-        pk = vectore_client.col.query(expr=f'file_id == {file_id}', output_fields=['pk'])
-        res = vectore_client.col.delete(f"pk in {[p['pk'] for p in pk]}")
-        logger.info(f'act=delete_vector file_id={file_id} res={res}')
+    # elastic
+    index_name = knowledge.index_name or collection_name
+    esvectore_client = decide_vectorstores(index_name, 'ElasticKeywordsSearch', embeddings)
+    _delete_file_vectors(vectore_client, esvectore_client, file_id)
 
     # minio
     minio_client = MinioClient()
     minio_client.delete_minio(str(knowledge_file.id))
     if knowledge_file.object_name:
         minio_client.delete_minio(str(knowledge_file.object_name))
-    # elastic
-    index_name = knowledge.index_name or collection_name
-    esvectore_client = decide_vectorstores(index_name, 'ElasticKeywordsSearch', embeddings)
-
-    if esvectore_client:
-        res = esvectore_client.client.delete_by_query(
-            index=index_name, query={'match': {
-                'metadata.file_id': file_id
-            }})
-        logger.info(f'act=delete_es file_id={file_id} res={res}')
 
     with session_getter() as session:
         session.delete(knowledge_file)
@@ -437,13 +432,11 @@ def decide_vectorstores(collection_name: str, vector_store: str,
     return instantiate_vectorstore(class_object=class_obj, params=param)
 
 
-def addEmbedding(collection_name, index_name, knowledge_id: int, model: str, chunk_size: int,
-                 separator: str, chunk_overlap: int, file_paths: List[str],
-                 knowledge_files: List[KnowledgeFile], callback: str):
+def _embedding_clients(collection_name: str, index_name: str, model: str):
+    """ 返回 (milvus, es, 错误信息)，两者都创建失败时文件无法入库 """
     error_msg = ''
+    vectore_client, es_client, embeddings = None, None, None
     try:
-        vectore_client, es_client = None, None
-        minio_client = MinioClient()
         embeddings = decide_embeddings(model)
         vectore_client = decide_vectorstores(collection_name, 'Milvus', embeddings)
     except Exception as e:
@@ -455,92 +448,256 @@ def addEmbedding(collection_name, index_name, knowledge_id: int, model: str, chu
     except Exception as e:
         error_msg = error_msg + 'ESException:' + str(e)
         logger.exception(e)
+    return vectore_client, es_client, error_msg
+
+
+def _update_file(file_id: int, **fields) -> Optional[KnowledgeFile]:
+    with session_getter() as session:
+        db_file = session.get(KnowledgeFile, file_id)
+        if not db_file:
+            return None
+        for key, value in fields.items():
+            setattr(db_file, key, value)
+        session.add(db_file)
+        session.commit()
+        session.refresh(db_file)
+        return db_file.copy()
+
+
+def _file_callback(callback: Optional[str], db_file: Optional[KnowledgeFile]):
+    if not callback or not db_file:
+        return
+    inp = {
+        'file_name': db_file.file_name,
+        'file_status': db_file.status,
+        'file_id': db_file.id,
+        'error_msg': db_file.remark
+    }
+    logger.info(f'add_complete callback={callback} file_name={db_file.file_name} status={db_file.status}')
+    requests.post(url=callback, json=inp, timeout=3)
+
+
+def _delete_file_vectors(vectore_client, es_client, file_id: int):
+    """ 删除文件在向量库和es中已写入的数据 """
+    if isinstance(vectore_client, Milvus) and vectore_client.col:
+        pk = vectore_client.col.query(expr=f'file_id == {file_id}', output_fields=['pk'])
+        res = vectore_client.col.delete(f"pk in {[p['pk'] for p in pk]}")
+        logger.info(f'act=delete_vector file_id={file_id} res={res}')
+    if es_client:
+        res = es_client.client.delete_by_query(index=es_client.index_name,
+                                               query={'match': {
+                                                   'metadata.file_id': file_id
+                                               }})
+        logger.info(f'act=delete_es file_id={file_id} res={res}')
+
+
+def _embed_file(vectore_client, es_client, minio_client: MinioClient, knowledge_id: int,
+                knowledge_file: KnowledgeFile, path: str, chunk_size: int, chunk_overlap: int,
+                separator, upload_original: bool = True, refresh_indices: bool = False) -> KnowledgeFile:
+    """ 解析、切分文件并写入向量库和es，处理进度写入文件的 remark，失败时抛出异常 """
+    ts1 = time.time()
+    file_id = knowledge_file.id
+    # 原文件
+    object_name_original = f'original/{file_id}'
+    _update_file(file_id, object_name=object_name_original, remark='parsing')
+    if upload_original:
+        minio_client.upload_minio(object_name_original, path)
+    texts, metadatas = _read_chunk_text(path, knowledge_file.file_name, chunk_size, chunk_overlap,
+                                        separator)
+
+    if len(texts) == 0:
+        raise ValueError('文件解析为空')
+    # 溯源必须依赖minio, 后期替换更通用的oss
+    minio_client.upload_minio(str(file_id), path)
+
+    logger.info(f'chunk_split file_name={knowledge_file.file_name} size={len(texts)}')
+    for metadata in metadatas:
+        metadata.update({'file_id': file_id, 'knowledge_id': f'{knowledge_id}'})
+
+    if vectore_client:
+        file_name, total = knowledge_file.file_name, len(texts)
+
+        def progress(done: int):
+            logger.info(f'milvus_insert file_name={file_name} progress={done}/{total}')
+            _update_file(file_id, remark=f'embedding {done}/{total}')
+
+        vectore_client.add_texts(texts=texts, metadatas=metadatas, progress_callback=progress)
+
+    if es_client:
+        es_client.add_texts(texts=texts, metadatas=metadatas, refresh_indices=refresh_indices)
+
+    db_file = _update_file(file_id, status=2, remark='')
+    logger.info('process_file_done file_name={} file_id={} time_cost={}', knowledge_file.file_name,
+                file_id,
+                time.time() - ts1)
+    return db_file
+
+
+def addEmbedding(collection_name, index_name, knowledge_id: int, model: str, chunk_size: int,
+                 separator: str, chunk_overlap: int, file_paths: List[str],
+                 knowledge_files: List[KnowledgeFile], callback: str):
+    minio_client = MinioClient()
+    vectore_client, es_client, error_msg = _embedding_clients(collection_name, index_name, model)
 
-    callback_obj = {}
     for index, path in enumerate(file_paths):
-        ts1 = time.time()
         knowledge_file = knowledge_files[index]
         logger.info('process_file_begin knowledge_id={} file_name={} file_size={} ',
                     knowledge_files[0].knowledge_id, knowledge_file.file_name, len(file_paths))
 
         if not vectore_client and not es_client:
             # 设置错误
-            with session_getter() as session:
-                db_file = session.get(KnowledgeFile, knowledge_file.id)
-                setattr(db_file, 'status', 3)
-                setattr(db_file, 'remark', error_msg[:500])
-                session.add(db_file)
-                callback_obj = db_file.copy()
-                session.commit()
-            if callback:
-                inp = {
-                    'file_name': knowledge_file.file_name,
-                    'file_status': knowledge_file.status,
-                    'file_id': callback_obj.id,
-                    'error_msg': callback_obj.remark
-                }
-                logger.error('add_fail callback={} file_name={} status={}', callback,
-                             callback_obj.file_name, callback_obj.status)
-                requests.post(url=callback, json=inp, timeout=3)
+            db_file = _update_file(knowledge_file.id, status=3, remark=error_msg[:500])
+            logger.error('add_fail file_name={} error={}', knowledge_file.file_name, error_msg)
+            _file_callback(callback, db_file)
             continue
         try:
-            # 存储 mysql
-            with session_getter() as session:
-                db_file = session.get(KnowledgeFile, knowledge_file.id)
-                setattr(db_file, 'status', 2)
-                # 原文件
-                object_name_original = f'original/{db_file.id}'
-                setattr(db_file, 'object_name', object_name_original)
-                session.add(db_file)
-                session.commit()
-                session.refresh(db_file)
-
-            minio_client.upload_minio(object_name_original, path)
-            texts, metadatas = _read_chunk_text(path, knowledge_file.file_name, chunk_size,
-                                                chunk_overlap, separator)
-
-            if len(texts) == 0:
-                raise ValueError('文件解析为空')
-            # 溯源必须依赖minio, 后期替换更通用的oss
-            minio_client.upload_minio(str(db_file.id), path)
-
-            logger.info(f'chunk_split file_name={knowledge_file.file_name} size={len(texts)}')
-            for metadata in metadatas:
-                metadata.update({'file_id': knowledge_file.id, 'knowledge_id': f'{knowledge_id}'})
-
-            if vectore_client:
-                vectore_client.add_texts(texts=texts, metadatas=metadatas)
-
-            # 存储es
-            if es_client:
-                es_client.add_texts(texts=texts, metadatas=metadatas)
-
-            callback_obj = db_file.copy()
-            logger.info('process_file_done file_name={} file_id={} time_cost={}',
-                        knowledge_file.file_name, knowledge_file.id,
-                        time.time() - ts1)
-
+            # 存储es, 整批文件处理完后再统一refresh
+            db_file = _embed_file(vectore_client, es_client, minio_client, knowledge_id,
+                                  knowledge_file, path, chunk_size, chunk_overlap, separator)
         except Exception as e:
-            logger.error('insert_metadata={} ', metadatas, e)
-            with session_getter() as session:
-                db_file = session.get(KnowledgeFile, knowledge_file.id)
-                setattr(db_file, 'status', 3)
-                setattr(db_file, 'remark', str(e)[:500])
-                session.add(db_file)
-                callback_obj = db_file.copy()
-                session.commit()
-        if callback:
-            # asyn
-            inp = {
-                'file_name': callback_obj.file_name,
-                'file_status': callback_obj.status,
-                'file_id': callback_obj.id,
-                'error_msg': callback_obj.remark
+            logger.exception(f'process_file_fail file_name={knowledge_file.file_name} error={e}')
+            db_file = _update_file(knowledge_file.id, status=3, remark=str(e)[:500])
+        _file_callback(callback, db_file)
+    if es_client:
+        try:
+            es_client.client.indices.refresh(index=es_client.index_name)
+        except Exception as e:
+            logger.error(f'es_refresh_error index={es_client.index_name} error={e}')
+
+
+# 可重试的入库错误: 服务暂时不可用或超时
+RETRYABLE_INGEST_ERRORS = (requests.exceptions.ConnectionError, requests.exceptions.Timeout,
+                           ConnectionError, TimeoutError, MilvusException)
+
+
+def ingest_conf() -> dict:
+    return settings.get_knowledge().get('celery_ingestion') or {}
+
+
+def ingest_rate_wait(model: str, conf: dict) -> int:
+    """ 模型每分钟入库的文件数超过上限时，返回需要等待的秒数 """
+    limit = (conf.get('rate_limits') or {}).get(model)
+    if not limit:
+        return 0
+    now = int(time.time())
+    count = redis_client.incr(f'knowledge_ingest:rate:{model}:{now // 60}', expiration=120)
+    if count <= int(limit):
+        return 0
+    # 等到下一个窗口，加上随机偏移避免同时重试
+    return 60 - now % 60 + random.randint(1, 10)
+
+
+def dispatch_embedding(background_tasks: BackgroundTasks, collection_name, index_name,
+                       knowledge_id: int, model: str, chunk_size: int, separator,
+                       chunk_overlap: int, file_paths: List[str],
+                       knowledge_files: List[KnowledgeFile], callback: Optional[str]):
+    """ 开启 celery 入库时每个文件一个任务，发送到入库队列由独立的 worker 处理;
+    未开启或消息队列不可用时，在当前进程的后台任务中入库 """
+    conf = ingest_conf()
+    dispatched = 0
+    if conf.get('enable'):
+        try:
+            from bisheng.worker import file_embedding_task
+            queue = (conf.get('model_queues') or {}).get(model) or conf.get('queue', 'knowledge_ingest')
+            params = {
+                'collection_name': collection_name,
+                'index_name': index_name,
+                'knowledge_id': knowledge_id,
+                'model': model,
+                'chunk_size': chunk_size,
+                'separator': separator,
+                'chunk_overlap': chunk_overlap,
+                'callback': callback,
             }
-            logger.info(
-                f'add_complete callback={callback} file_name={callback_obj.file_name} status={callback_obj.status}'
-            )
-            requests.post(url=callback, json=inp, timeout=3)
+            minio_client = MinioClient()
+            for path, knowledge_file in zip(file_paths, knowledge_files):
+                # worker 在其他节点时从 minio 获取原文件
+                object_name = f'original/{knowledge_file.id}'
+                minio_client.upload_minio(object_name, path)
+                _update_file(knowledge_file.id, object_name=object_name, remark='queued')
+                file_embedding_task.apply_async(kwargs={
+                    'file_id': knowledge_file.id,
+                    'file_path': path,
+                    'params': params
+                },
+                                                queue=queue)
+                dispatched += 1
+            logger.info(f'celery_ingest_dispatch knowledge_id={knowledge_id} queue={queue} '
+                        f'files={dispatched}')
+            return
+        except Exception as e:
+            logger.exception(f'celery_ingest_dispatch_fail dispatched={dispatched} error={e}')
+    background_tasks.add_task(addEmbedding,
+                              collection_name=collection_name,
+                              index_name=index_name,
+                              knowledge_id=knowledge_id,
+                              model=model,
+                              chunk_size=chunk_size,
+                              separator=separator,
+                              chunk_overlap=chunk_overlap,
+                              file_paths=file_paths[dispatched:],
+                              knowledge_files=knowledge_files[dispatched:],
+                              callback=callback)
+
+
+def _ingest_local_file(file_id: int, file_path: str) -> str:
+    """ 原文件不在当前节点时从 minio 下载到临时文件 """
+    if os.path.exists(file_path):
+        return file_path
+    response = MinioClient().download_minio(f'original/{file_id}')
+    if response is None:
+        raise FileNotFoundError(f'file not found file_id={file_id} path={file_path}')
+    fd, local_path = tempfile.mkstemp(suffix=os.path.splitext(file_path)[1])
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            for chunk in response.stream(1024 * 1024):
+                f.write(chunk)
+    finally:
+        response.close()
+        response.release_conn()
+    return local_path
+
+
+def ingest_file(file_id: int, file_path: str, collection_name, index_name, knowledge_id: int,
+                model: str, chunk_size: int, separator, chunk_overlap: int,
+                callback: Optional[str] = None, final: bool = True):
+    """ celery worker 中处理单个文件，final 为 False 时可重试的错误会抛出，由任务稍后重试 """
+    with session_getter() as session:
+        knowledge_file = session.get(KnowledgeFile, file_id)
+    if not knowledge_file or knowledge_file.status != 1:
+        # 文件已删除或已处理完成(任务重复投递)
+        logger.info(f'ingest_file_skip file_id={file_id}')
+        return
+    knowledge_file = knowledge_file.copy()
+    logger.info(f'process_file_begin knowledge_id={knowledge_id} file_name={knowledge_file.file_name}')
+
+    vectore_client, es_client, error_msg = _embedding_clients(collection_name, index_name, model)
+    if not vectore_client and not es_client:
+        if not final:
+            raise ConnectionError(error_msg)
+        _file_callback(callback, _update_file(file_id, status=3, remark=error_msg[:500]))
+        return
+
+    local_path = None
+    try:
+        local_path = _ingest_local_file(file_id, file_path)
+        db_file = _embed_file(vectore_client, es_client, MinioClient(), knowledge_id, knowledge_file,
+                              local_path, chunk_size, chunk_overlap, separator,
+                              upload_original=False, refresh_indices=True)
+    except Exception as e:
+        logger.exception(f'process_file_fail file_name={knowledge_file.file_name} error={e}')
+        try:
+            _delete_file_vectors(vectore_client, es_client, file_id)
+        except Exception as delete_error:
+            logger.error(f'delete_partial_vectors_fail file_id={file_id} error={delete_error}')
+        if not final and isinstance(e, RETRYABLE_INGEST_ERRORS):
+            _update_file(file_id, remark=f'retry: {str(e)[:400]}')
+            raise
+        db_file = _update_file(file_id, status=3, remark=str(e)[:500])
+    finally:
+        if local_path and local_path != file_path:
+            os.remove(local_path)
+    _file_callback(callback, db_file)
 
 
 def _read_chunk_text(input_file, file_name, size, chunk_overlap, separator):
@@ -554,7 +711,16 @@ def _read_chunk_text(input_file, file_name, size, chunk_overlap, separator):
                                               chunk_size=size,
                                               chunk_overlap=chunk_overlap,
                                               add_start_index=True)
-        documents = loader.load()
+        # 相同文件的解析结果可复用，切分参数不影响缓存
+        cache_key = parse_cache.key(input_file, f'local:{type(loader).__name__}', file_type)
+        cached = parse_cache.get(cache_key)
+        if cached:
+            documents = cached[0]
+            for doc in documents:
+                doc.metadata['source'] = input_file
+        else:
+            documents = loader.load()
+            parse_cache.put(cache_key, documents)
         texts = text_splitter.split_documents(documents)
         raw_texts = [t.page_content for t in texts]
         metadatas = [{
@@ -564,27 +730,45 @@ def _read_chunk_text(input_file, file_name, size, chunk_overlap, separator):
             'extra': ''
         } for t in texts]
     else:
-        # 如果文件不是pdf 需要内部转pdf
-        if file_name.rsplit('.', 1)[-1] != 'pdf':
-            b64_data = base64.b64encode(open(input_file, 'rb').read()).decode()
-            inp = dict(filename=file_name, b64_data=[b64_data], mode='topdf')
-            resp = requests.post(settings.get_knowledge().get('unstructured_api_url'), json=inp)
-            if not resp or resp.status_code != 200:
-                logger.error(f'file_pdf=not_success resp={resp.text}')
-                raise Exception(f"当前文件无法解析， {resp['status_message']}")
-            if len(resp.text) < 300:
-                logger.error(f'file_pdf=not_success resp={resp.text}')
-            b64_data = resp.json()['b64_pdf']
-            # 替换历史文件
-            with open(input_file, 'wb') as fout:
-                fout.write(base64.b64decode(b64_data))
-            file_name = file_name.rsplit('.', 1)[0] + '.pdf'
-
-        loader = ElemUnstructuredLoader(
-            file_name,
-            input_file,
-            unstructured_api_url=settings.get_knowledge().get('unstructured_api_url'))
-        documents = loader.load()
+        unstructured_api_url = settings.get_knowledge().get('unstructured_api_url')
+        # key 使用原文件的内容计算，命中时同时跳过转pdf
+        cache_key = parse_cache.key(input_file, unstructured_api_url, 'partition')
+        cached = parse_cache.get(cache_key)
+        if cached:
+            documents, converted = cached
+            if converted is not None:
+                # 溯源使用转换后的pdf，替换历史文件
+                with open(input_file, 'wb') as fout:
+                    fout.write(converted)
+                file_name = file_name.rsplit('.', 1)[0] + '.pdf'
+            for doc in documents:
+                doc.metadata['source'] = file_name
+        else:
+            converted = None
+            # 如果文件不是pdf 需要内部转pdf
+            if file_name.rsplit('.', 1)[-1] != 'pdf':
+                b64_data = base64.b64encode(open(input_file, 'rb').read()).decode()
+                inp = dict(filename=file_name, b64_data=[b64_data], mode='topdf')
+                resp = requests.post(unstructured_api_url, json=inp)
+                if not resp or resp.status_code != 200:
+                    logger.error(f'file_pdf=not_success resp={resp.text}')
+                    raise Exception(f"当前文件无法解析， {resp['status_message']}")
+                if len(resp.text) < 300:
+                    logger.error(f'file_pdf=not_success resp={resp.text}')
+                b64_data = resp.json()['b64_pdf']
+                converted = base64.b64decode(b64_data)
+                # 替换历史文件
+                with open(input_file, 'wb') as fout:
+                    fout.write(converted)
+                file_name = file_name.rsplit('.', 1)[0] + '.pdf'
+
+            loader = ElemUnstructuredLoader(file_name,
+                                            input_file,
+                                            unstructured_api_url=unstructured_api_url)
+            documents = loader.load()
+            # 解析服务返回失败时不缓存，避免临时故障的结果被复用
+            if loader.status_code == 200:
+                parse_cache.put(cache_key, documents, converted)
         text_splitter = ElemCharacterTextSplitter(separators=separator,
                                                   chunk_size=size,
                                                   chunk_overlap=chunk_overlap)
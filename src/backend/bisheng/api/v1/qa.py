@@ -3,6 +3,7 @@ import json
 from typing import List
 
 from bisheng.api.v1.schemas import UnifiedResponseModel, resp_200
+from bisheng.chat.keywords import keyword_extractor
 from bisheng.database.base import session_getter
 from bisheng.database.models.knowledge_file import KnowledgeFile
 from bisheng.database.models.recall_chunk import RecallChunk
@@ -19,13 +20,10 @@ async def get_answer_keyword(message_id: int):
     # 获取命中的key
     conter = 3
     while True:
-        with session_getter() as session:
-            chunks = session.exec(
-                select(RecallChunk).where(RecallChunk.message_id == message_id)).first()
-        # keywords
-        if chunks:
-            keywords = chunks.keywords
-            return resp_200(json.loads(keywords))
+        # 后台还未抽取完成时在当前请求中抽取
+        keywords = await asyncio.to_thread(keyword_extractor.get_keywords, message_id)
+        if keywords is not None:
+            return resp_200(keywords)
         else:
             # 延迟循环
             if conter <= 0:
@@ -15,7 +15,7 @@ from bisheng.utils.logger import logger
 from fastapi import APIRouter, WebSocket, status
 
 router = APIRouter(prefix='/chat', tags=['Chat'])
-chat_manager = ChatManager()
+chat_manager = ChatManager('v2')
 flow_data_store = redis_client
 expire = 600  # reids 60s 过期
 
@@ -56,11 +56,11 @@ async def union_websocket(flow_id: str,
                             'collection_id'] = knowledge_id
         trace_id = str(uuid4().hex)
         with logger.contextualize(trace_id=trace_id):
-            await chat_manager.handle_websocket(
+            await chat_manager.dispatch_websocket(
                 flow_id,
                 chat_id,
                 websocket,
-                settings.get_from_db('default_operator').get('user'),
+                (await settings.aget_from_db('default_operator')).get('user'),
                 gragh_data=graph_data)
     except Exception as exc:
         logger.error(exc)
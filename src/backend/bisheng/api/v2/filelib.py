@@ -1,7 +1,7 @@
 from typing import Optional
 
 from bisheng.api.services import knowledge_imp
-from bisheng.api.v1.knowledge import (addEmbedding, decide_vectorstores, file_knowledge,
+from bisheng.api.v1.knowledge import (decide_vectorstores, dispatch_embedding, file_knowledge,
                                       text_knowledge)
 from bisheng.api.v1.schemas import ChunkInput, UnifiedResponseModel, resp_200
 from bisheng.cache.utils import save_download_file
@@ -158,17 +158,17 @@ async def upload_file(*,
     logger.info(f'fileName={file_name} col={collection_name} file_id={db_file.id}')
     try:
         index_name = knowledge.index_name or knowledge.collection_name
-        background_tasks.add_task(addEmbedding,
-                                  collection_name=collection_name,
-                                  index_name=index_name,
-                                  knowledge_id=knowledge_id,
-                                  model=knowledge.model,
-                                  chunk_size=chunk_size,
-                                  separator=separator,
-                                  chunk_overlap=chunk_overlap,
-                                  file_paths=[file_path],
-                                  knowledge_files=[db_file],
-                                  callback=callback_url)
+        dispatch_embedding(background_tasks,
+                           collection_name=collection_name,
+                           index_name=index_name,
+                           knowledge_id=knowledge_id,
+                           model=knowledge.model,
+                           chunk_size=chunk_size,
+                           separator=separator,
+                           chunk_overlap=chunk_overlap,
+                           file_paths=[file_path],
+                           knowledge_files=[db_file],
+                           callback=callback_url)
     except Exception:
         # 失败，需要删除数据
         logger.info(f'delete file_id={db_file.id} status={db_file.status} reason={db_file.remark}')
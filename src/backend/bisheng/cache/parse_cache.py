@@ -0,0 +1,160 @@
+"""
+文件解析结果缓存
+同一文件重复入库（上传到其他知识库、修改切分参数重新入库）时跳过转pdf和解析服务的调用。
+缓存的是切分前的文档，key 为 (文件内容sha256, 解析服务, 解析模式, 解析版本)，
+存储在本地磁盘，总大小超过上限时按最久未使用淘汰。
+"""
+import hashlib
+import json
+import os
+import tempfile
+import threading
+from pathlib import Path
+from typing import List, Optional, Tuple
+
+from bisheng.cache.utils import CACHE_DIR
+from bisheng.settings import settings
+from bisheng.utils.logger import logger
+from langchain.docstore.document import Document
+
+# 解析结果的结构(如 merge_partitions)变化时修改，使旧缓存失效
+PARSE_CACHE_VERSION = 1
+
+
+def file_sha256(file_path: str) -> str:
+    sha256_hash = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        while chunk := f.read(1024 * 1024):
+            sha256_hash.update(chunk)
+    return sha256_hash.hexdigest()
+
+
+class ParseCache:
+    """ 解析结果的本地磁盘缓存，每个key对应 <key>.json 以及可选的转换后的 <key>.pdf """
+
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _conf() -> dict:
+        return settings.get_knowledge().get('parse_cache') or {}
+
+    def _cache_dir(self, conf: dict) -> Path:
+        cache_dir = Path(conf.get('cache_dir') or os.path.join(CACHE_DIR, 'parse_cache'))
+        cache_dir.mkdir(parents=True, exist_ok=True)
+        return cache_dir
+
+    def key(self, file_path: str, parser: str, mode: str) -> Optional[str]:
+        """ 计算文件的缓存key，未开启缓存时返回None """
+        conf = self._conf()
+        if not conf.get('enable', True):
+            return None
+        version = f"{PARSE_CACHE_VERSION}:{conf.get('parser_version', '')}"
+        raw = f'{file_sha256(file_path)}:{parser}:{mode}:{version}'
+        return hashlib.sha256(raw.encode()).hexdigest()
+
+    def get(self, key: Optional[str]) -> Optional[Tuple[List[Document], Optional[bytes]]]:
+        """ 返回 (文档列表, 转换后的pdf内容)，未命中返回None """
+        if key is None:
+            return None
+        cache_dir = self._cache_dir(self._conf())
+        data_path = cache_dir / f'{key}.json'
+        try:
+            with open(data_path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            pdf_path = cache_dir / f'{key}.pdf'
+            converted = pdf_path.read_bytes() if data.get('converted') else None
+        except (OSError, ValueError):
+            self._record(False, key)
+            return None
+        # 更新访问时间，淘汰时按最久未使用
+        os.utime(data_path)
+        self._record(True, key)
+        documents = [Document(page_content=doc['page_content'], metadata=doc['metadata']) for doc in data['documents']]
+        return documents, converted
+
+    def put(self, key: Optional[str], documents: List[Document], converted: Optional[bytes] = None):
+        if key is None:
+            return
+        if not any(doc.page_content and doc.page_content.strip() for doc in documents):
+            # 解析结果为空可能是解析服务临时故障，不缓存
+            logger.warning(f'parse_cache skip empty result key={key}')
+            return
+        conf = self._conf()
+        cache_dir = self._cache_dir(conf)
+        try:
+            data = json.dumps({
+                'documents': [{'page_content': doc.page_content, 'metadata': doc.metadata} for doc in documents],
+                'converted': converted is not None,
+            }, ensure_ascii=False)
+        except (TypeError, ValueError) as e:
+            # metadata 中有无法序列化的内容时不缓存
+            logger.warning(f'parse_cache skip key={key} err={e}')
+            return
+        try:
+            if converted is not None:
+                self._write(cache_dir / f'{key}.pdf', converted)
+            # json 最后写入，读到 json 时 pdf 一定已经完整
+            self._write(cache_dir / f'{key}.json', data.encode('utf-8'))
+        except OSError as e:
+            logger.warning(f'parse_cache write failed key={key} err={e}')
+            return
+        self._evict(cache_dir, int(conf.get('max_size_mb', 2048)) * 1024 * 1024)
+
+    @staticmethod
+    def _write(path: Path, content: bytes):
+        fd, tmp_path = tempfile.mkstemp(dir=path.parent, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(content)
+            os.replace(tmp_path, path)
+        except OSError:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+    def _evict(self, cache_dir: Path, max_size: int):
+        """ 总大小超过上限时，按 json 的访问时间删除最久未使用的缓存 """
+        entries = {}
+        total = 0
+        for item in os.scandir(cache_dir):
+            stem, suffix = os.path.splitext(item.name)
+            if suffix not in ('.json', '.pdf') or not item.is_file():
+                continue
+            stat = item.stat()
+            size, mtime = entries.get(stem, (0, 0))
+            entries[stem] = (size + stat.st_size, stat.st_mtime if suffix == '.json' else mtime)
+            total += stat.st_size
+        if total <= max_size:
+            return
+        for stem, (size, _) in sorted(entries.items(), key=lambda x: x[1][1]):
+            for suffix in ('.json', '.pdf'):
+                try:
+                    os.remove(cache_dir / f'{stem}{suffix}')
+                except FileNotFoundError:
+                    pass
+            total -= size
+            with self._lock:
+                self.evictions += 1
+            if total <= max_size:
+                break
+
+    def _record(self, hit: bool, key: str):
+        with self._lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+            hits, misses = self.hits, self.misses
+        logger.info(f'parse_cache {"hit" if hit else "miss"} key={key[:16]} '
+                    f'hits={hits} misses={misses} hit_rate={hits / (hits + misses):.2f}')
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {'hits': self.hits, 'misses': self.misses, 'evictions': self.evictions}
+
+
+parse_cache = ParseCache()
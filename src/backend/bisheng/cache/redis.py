@@ -1,10 +1,16 @@
+import asyncio
 import pickle
-from typing import Dict
+import weakref
+from typing import Dict, List
 
 import redis
 from bisheng.settings import settings
 from loguru import logger
 from redis import ConnectionPool, RedisCluster
+from redis import asyncio as aioredis
+from redis.asyncio.cluster import ClusterNode as AsyncClusterNode
+from redis.asyncio.cluster import RedisCluster as AsyncRedisCluster
+from redis.asyncio.sentinel import Sentinel as AsyncSentinel
 from redis.cluster import ClusterNode
 from redis.sentinel import Sentinel
 
@@ -65,6 +71,17 @@ class RedisClient:
         finally:
             self.close()
 
+    def setNxEx(self, key, value, expiration=3600) -> bool:
+        """ 原子的 SET NX EX，只有key不存在时才写入并设置过期时间，已存在时不会刷新过期时间 """
+        try:
+            if pickled := pickle.dumps(value):
+                self.cluster_nodes(key)
+                return bool(self.connection.set(key, pickled, nx=True, ex=expiration))
+        except TypeError as exc:
+            raise TypeError('RedisCache only accepts values that can be pickled. ') from exc
+        finally:
+            self.close()
+
     def hsetkey(self, name, key, value, expiration=3600):
         try:
             self.cluster_nodes(key)
@@ -92,6 +109,44 @@ class RedisClient:
         finally:
             self.close()
 
+    def hgetall(self, name):
+        try:
+            self.cluster_nodes(name)
+            return self.connection.hgetall(name)
+        finally:
+            self.close()
+
+    def hlen(self, name):
+        try:
+            self.cluster_nodes(name)
+            return self.connection.hlen(name)
+        finally:
+            self.close()
+
+    def hdel(self, name, *keys):
+        try:
+            self.cluster_nodes(name)
+            return self.connection.hdel(name, *keys)
+        finally:
+            self.close()
+
+    def hincrby(self, name, key, amount=1):
+        try:
+            self.cluster_nodes(name)
+            return self.connection.hincrby(name, key, amount)
+        finally:
+            self.close()
+
+    def incr(self, key, expiration=3600):
+        try:
+            self.cluster_nodes(key)
+            value = self.connection.incr(key)
+            if value == 1:
+                self.connection.expire(key, expiration)
+            return value
+        finally:
+            self.close()
+
     def get(self, key):
         try:
             self.cluster_nodes(key)
@@ -114,6 +169,17 @@ class RedisClient:
         finally:
             self.close()
 
+    def publish(self, channel, message):
+        try:
+            self.cluster_nodes(channel)
+            return self.connection.publish(channel, message)
+        finally:
+            self.close()
+
+    def pubsub(self):
+        """获取独立连接的pubsub对象，由调用方负责关闭"""
+        return self.connection.pubsub(ignore_subscribe_messages=True)
+
     def close(self):
         self.connection.close()
 
@@ -144,5 +210,119 @@ class RedisClient:
             self.connection.set_default_node(target)
 
 
+class RedisAsyncClient:
+    """
+    RedisClient的asyncio版本，供async接口使用，避免阻塞事件循环。
+    支持单机/哨兵/集群三种模式，值的序列化方式和RedisClient一致，两者可以读写同一批key。
+    连接池长期复用，不在每次调用后关闭；每个事件循环使用独立的连接池。
+    """
+
+    def __init__(self, url, max_connections=10):
+        self.url = url
+        self.max_connections = max_connections
+        self._connections = weakref.WeakKeyDictionary()
+
+    def _create_connection(self):
+        if isinstance(self.url, Dict):
+            redis_conf = dict(self.url)
+            mode = redis_conf.pop('mode', 'sentinel')
+            if mode == 'cluster':
+                # 集群模式
+                if 'startup_nodes' in redis_conf:
+                    redis_conf['startup_nodes'] = [
+                        AsyncClusterNode(node.get('host'), node.get('port'))
+                        for node in redis_conf['startup_nodes']
+                    ]
+                return AsyncRedisCluster(**redis_conf)
+            # 哨兵模式
+            hosts = [eval(x) for x in redis_conf.pop('sentinel_hosts')]
+            password = redis_conf.pop('sentinel_password')
+            master = redis_conf.pop('sentinel_master')
+            sentinel = AsyncSentinel(sentinels=hosts, socket_timeout=0.1, password=password)
+            return sentinel.master_for(master, socket_timeout=0.1, **redis_conf)
+        # 单机模式
+        return aioredis.Redis.from_url(self.url, max_connections=self.max_connections)
+
+    @property
+    def connection(self):
+        loop = asyncio.get_running_loop()
+        connection = self._connections.get(loop)
+        if connection is None:
+            connection = self._create_connection()
+            self._connections[loop] = connection
+        return connection
+
+    @property
+    def is_cluster(self) -> bool:
+        return isinstance(self.url, Dict) and self.url.get('mode') == 'cluster'
+
+    async def set(self, key, value, expiration=3600):
+        try:
+            pickled = pickle.dumps(value)
+        except TypeError as exc:
+            raise TypeError('RedisCache only accepts values that can be pickled. ') from exc
+        if not await self.connection.setex(key, expiration, pickled):
+            raise ValueError('RedisCache could not set the value.')
+
+    async def setNx(self, key, value, expiration=3600):
+        try:
+            pickled = pickle.dumps(value)
+        except TypeError as exc:
+            raise TypeError('RedisCache only accepts values that can be pickled. ') from exc
+        return bool(await self.connection.set(key, pickled, ex=expiration, nx=True))
+
+    async def get(self, key):
+        value = await self.connection.get(key)
+        return pickle.loads(value) if value else None
+
+    async def mget(self, keys: List[str]) -> List:
+        """一次请求读取多个key，不存在的key返回None"""
+        if not keys:
+            return []
+        if self.is_cluster:
+            values = await self.connection.mget_nonatomic(keys)
+        else:
+            values = await self.connection.mget(keys)
+        return [pickle.loads(value) if value else None for value in values]
+
+    async def hget(self, name, key):
+        return await self.connection.hget(name, key)
+
+    async def hmget(self, name, keys: List[str]) -> List:
+        """一次请求读取hash的多个字段"""
+        return await self.connection.hmget(name, keys)
+
+    async def hset(self, name, map: dict, expiration=3600):
+        async with self.connection.pipeline(transaction=False) as pipe:
+            pipe.hset(name, mapping=map)
+            if expiration:
+                pipe.expire(name, expiration)
+            return (await pipe.execute())[0]
+
+    async def hsetkey(self, name, key, value, expiration=3600):
+        return await self.hset(name, {key: value}, expiration)
+
+    async def delete(self, key):
+        return await self.connection.delete(key)
+
+    async def exists(self, key):
+        return await self.connection.exists(key)
+
+    async def publish(self, channel, message):
+        return await self.connection.publish(channel, message)
+
+    def pipeline(self, transaction=False):
+        """多个命令合并为一次往返，用法: async with redis_async_client.pipeline() as pipe"""
+        return self.connection.pipeline(transaction=transaction)
+
+    async def close(self):
+        """关闭当前事件循环上的连接池"""
+        loop = asyncio.get_running_loop()
+        connection = self._connections.pop(loop, None)
+        if connection is not None:
+            await connection.close()
+
+
 # 示例用法
 redis_client = RedisClient(settings.redis_url)
+redis_async_client = RedisAsyncClient(settings.redis_url)
@@ -0,0 +1,284 @@
+import asyncio
+import json
+import os
+import socket
+import threading
+from typing import Any, Dict, Optional
+from uuid import uuid4
+
+from bisheng.cache.redis import redis_async_client, redis_client
+from bisheng.settings import settings
+from bisheng.utils.util import get_cache_key
+from fastapi import WebSocket, WebSocketDisconnect
+from loguru import logger
+from starlette.websockets import WebSocketState
+
+
+class RemoteWebSocket:
+    """
+    会话所属worker上使用的websocket代理，真实的websocket连接在另一个worker上。
+    收到的消息来自redis转发，发送的消息通过redis发布回持有连接的worker。
+    """
+
+    def __init__(self, conn_id: str, reply_to: str, affinity: 'SessionAffinity'):
+        self.conn_id = conn_id
+        self.reply_to = reply_to
+        self.affinity = affinity
+        self.client_state = WebSocketState.CONNECTED
+        self.queue: asyncio.Queue = asyncio.Queue()
+
+    async def accept(self, *args, **kwargs):
+        pass
+
+    async def receive_text(self) -> str:
+        data = await self.queue.get()
+        if data is None:
+            self.client_state = WebSocketState.DISCONNECTED
+            raise WebSocketDisconnect(code=1000)
+        return data
+
+    async def receive_json(self, mode: str = 'text') -> Any:
+        return json.loads(await self.receive_text())
+
+    async def send_text(self, data: str):
+        await self.affinity.apublish(self.reply_to, {'type': 'send_text', 'conn_id': self.conn_id, 'data': data})
+
+    async def send_json(self, data: Any, mode: str = 'text'):
+        await self.affinity.apublish(self.reply_to, {'type': 'send_json', 'conn_id': self.conn_id, 'data': data})
+
+    async def close(self, code: int = 1000, reason: Optional[str] = None):
+        if self.client_state == WebSocketState.DISCONNECTED:
+            return
+        self.client_state = WebSocketState.DISCONNECTED
+        await self.affinity.apublish(self.reply_to, {
+            'type': 'close',
+            'conn_id': self.conn_id,
+            'code': code,
+            'reason': reason
+        })
+
+
+class SessionAffinity:
+    """
+    多worker部署时websocket会话的路由层。
+    redis中记录每个会话(flow_id, chat_id)的所属worker，已构建的技能对象只保存在所属worker的内存中。
+    连接落在其他worker上时，该worker只负责通过redis pub/sub把消息转发给所属worker，不再重复构建技能。
+    worker下线时释放所属会话，并把转发中的连接交还给持有连接的worker继续处理。
+    """
+
+    OwnerKey = 'chat:affinity:owner:{}'
+    AliveKey = 'chat:affinity:alive:{}'
+    Channel = 'chat:affinity:worker:{}'
+
+    # 会话归属的过期时间，和ChatManager中已构建对象的缓存时间保持一致
+    owner_expire = 3600
+    heartbeat_interval = 10
+
+    def __init__(self):
+        self.worker_id = f'{socket.gethostname()}:{os.getpid()}:{uuid4().hex[:8]}'
+        self.enabled = False
+        self.managers: Dict[str, Any] = {}
+        # 本worker作为所属worker, 正在处理的转发连接
+        self.remote_connections: Dict[str, RemoteWebSocket] = {}
+        # 本worker持有真实连接, 等待所属worker回复的消息队列
+        self.proxy_queues: Dict[str, asyncio.Queue] = {}
+        self.owned_keys = set()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._stop_event = threading.Event()
+        self._pubsub = None
+
+    def register(self, name: str, manager: Any):
+        self.managers[name] = manager
+
+    def start(self):
+        """在事件循环内调用，开启消息监听和心跳线程"""
+        self.enabled = bool(settings.get_from_db('chat_affinity').get('enabled', False))
+        if not self.enabled:
+            return
+        self._loop = asyncio.get_running_loop()
+        self._stop_event.clear()
+        self._pubsub = redis_client.pubsub()
+        self._pubsub.subscribe(self.Channel.format(self.worker_id))
+        self.heartbeat()
+        threading.Thread(target=self._listen, name='chat_affinity_listener', daemon=True).start()
+        threading.Thread(target=self._heartbeat_loop, name='chat_affinity_heartbeat', daemon=True).start()
+        logger.info(f'chat_affinity_start worker={self.worker_id}')
+
+    def drain(self):
+        """worker退出时释放所属会话，转发中的连接交还给持有连接的worker"""
+        if not self.enabled:
+            return
+        self._stop_event.set()
+        for key in list(self.owned_keys):
+            self.release(key)
+        for conn_id, remote_ws in list(self.remote_connections.items()):
+            self.publish(remote_ws.reply_to, {'type': 'handoff', 'conn_id': conn_id})
+        redis_client.delete(self.AliveKey.format(self.worker_id))
+        if self._pubsub:
+            self._pubsub.close()
+        logger.info(f'chat_affinity_drain worker={self.worker_id} owned={len(self.owned_keys)}')
+
+    def heartbeat(self):
+        redis_client.set(self.AliveKey.format(self.worker_id), 1, self.heartbeat_interval * 3)
+
+    async def is_alive(self, worker_id: str) -> bool:
+        return bool(await redis_async_client.exists(self.AliveKey.format(worker_id)))
+
+    async def get_owner(self, key: str) -> Optional[str]:
+        owner = await redis_async_client.get(self.OwnerKey.format(key))
+        if owner and owner != self.worker_id and not await self.is_alive(owner):
+            return None
+        return owner
+
+    async def claim(self, flow_id: str, chat_id: str):
+        """把会话归属到当前worker"""
+        if not self.enabled or not chat_id:
+            return
+        key = get_cache_key(flow_id, chat_id)
+        await redis_async_client.set(self.OwnerKey.format(key), self.worker_id, self.owner_expire)
+        self.owned_keys.add(key)
+
+    def release(self, key: str):
+        if redis_client.get(self.OwnerKey.format(key)) == self.worker_id:
+            redis_client.delete(self.OwnerKey.format(key))
+        self.owned_keys.discard(key)
+
+    def publish(self, worker_id: str, message: Dict):
+        redis_client.publish(self.Channel.format(worker_id), json.dumps(message, ensure_ascii=False))
+
+    async def apublish(self, worker_id: str, message: Dict):
+        """事件循环内使用，逐token转发时不阻塞其他会话"""
+        await redis_async_client.publish(self.Channel.format(worker_id), json.dumps(message, ensure_ascii=False))
+
+    async def handle_websocket(self, name: str, flow_id: str, chat_id: str, websocket: WebSocket,
+                               user_id: int, gragh_data: dict = None):
+        manager = self.managers[name]
+        owner = await self.get_owner(get_cache_key(flow_id, chat_id))
+        if owner and owner != self.worker_id:
+            logger.info(f'chat_affinity_forward key={get_cache_key(flow_id, chat_id)} owner={owner}')
+            handoff = await self._proxy(name, owner, flow_id, chat_id, websocket, user_id, gragh_data)
+            if not handoff:
+                return
+            logger.info(f'chat_affinity_handoff key={get_cache_key(flow_id, chat_id)} from={owner}')
+        await self.claim(flow_id, chat_id)
+        await manager.handle_websocket(flow_id, chat_id, websocket, user_id, gragh_data=gragh_data)
+
+    async def _proxy(self, name: str, owner: str, flow_id: str, chat_id: str, websocket: WebSocket,
+                     user_id: int, gragh_data: dict) -> bool:
+        """把连接上的消息转发给所属worker，返回True表示所属worker下线，需要在本worker接管"""
+        conn_id = uuid4().hex
+        queue = asyncio.Queue()
+        self.proxy_queues[conn_id] = queue
+        if websocket.client_state == WebSocketState.CONNECTING:
+            await websocket.accept()
+        await self.apublish(
+            owner, {
+                'type': 'connect',
+                'conn_id': conn_id,
+                'reply_to': self.worker_id,
+                'manager': name,
+                'flow_id': flow_id,
+                'chat_id': chat_id,
+                'user_id': user_id,
+                'graph_data': gragh_data,
+            })
+
+        async def forward_client():
+            try:
+                while True:
+                    data = await websocket.receive_text()
+                    await self.apublish(owner, {'type': 'message', 'conn_id': conn_id, 'data': data})
+            except WebSocketDisconnect:
+                await self.apublish(owner, {'type': 'disconnect', 'conn_id': conn_id})
+
+        forward_task = asyncio.ensure_future(forward_client())
+        handoff = False
+        try:
+            while not forward_task.done():
+                get_task = asyncio.ensure_future(queue.get())
+                await asyncio.wait([get_task, forward_task],
+                                   timeout=self.heartbeat_interval * 3,
+                                   return_when=asyncio.FIRST_COMPLETED)
+                if not get_task.done():
+                    get_task.cancel()
+                    if forward_task.done():
+                        break
+                    # 所属worker异常退出，没有来得及交还连接
+                    if not await self.is_alive(owner):
+                        handoff = True
+                        break
+                    continue
+                message = get_task.result()
+                if message['type'] == 'send_json':
+                    await websocket.send_json(message['data'])
+                elif message['type'] == 'send_text':
+                    await websocket.send_text(message['data'])
+                elif message['type'] == 'close':
+                    await websocket.close(code=message['code'], reason=message['reason'])
+                    break
+                elif message['type'] == 'handoff':
+                    handoff = True
+                    break
+        finally:
+            forward_task.cancel()
+            self.proxy_queues.pop(conn_id, None)
+        return handoff
+
+    async def _serve_remote(self, message: Dict):
+        remote_ws = RemoteWebSocket(message['conn_id'], message['reply_to'], self)
+        self.remote_connections[remote_ws.conn_id] = remote_ws
+        flow_id, chat_id = message['flow_id'], message['chat_id']
+        try:
+            await self.claim(flow_id, chat_id)
+            with logger.contextualize(trace_id=chat_id):
+                await self.managers[message['manager']].handle_websocket(flow_id,
+                                                                         chat_id,
+                                                                         remote_ws,
+                                                                         message['user_id'],
+                                                                         gragh_data=message['graph_data'])
+        except Exception as e:
+            logger.exception(f'chat_affinity_remote_error conn={remote_ws.conn_id} error={e}')
+        finally:
+            await remote_ws.close()
+            self.remote_connections.pop(remote_ws.conn_id, None)
+
+    def _dispatch(self, message: Dict):
+        """在事件循环线程内分发收到的redis消息"""
+        conn_id = message.get('conn_id')
+        msg_type = message.get('type')
+        if msg_type == 'connect':
+            asyncio.ensure_future(self._serve_remote(message))
+        elif msg_type == 'message':
+            if remote_ws := self.remote_connections.get(conn_id):
+                remote_ws.queue.put_nowait(message['data'])
+        elif msg_type == 'disconnect':
+            if remote_ws := self.remote_connections.get(conn_id):
+                remote_ws.queue.put_nowait(None)
+        elif conn_id in self.proxy_queues:
+            self.proxy_queues[conn_id].put_nowait(message)
+
+    def _listen(self):
+        while not self._stop_event.is_set():
+            try:
+                message = self._pubsub.get_message(timeout=1.0)
+                if not message or message['type'] != 'message':
+                    continue
+                self._loop.call_soon_threadsafe(self._dispatch, json.loads(message['data']))
+            except Exception as e:
+                if self._stop_event.is_set():
+                    break
+                logger.exception(f'chat_affinity_listen_error error={e}')
+
+    def _heartbeat_loop(self):
+        while not self._stop_event.wait(self.heartbeat_interval):
+            try:
+                self.heartbeat()
+                # 清理已被其他worker接管的会话
+                for key in list(self.owned_keys):
+                    if redis_client.get(self.OwnerKey.format(key)) != self.worker_id:
+                        self.owned_keys.discard(key)
+            except Exception as e:
+                logger.exception(f'chat_affinity_heartbeat_error error={e}')
+
+
+session_affinity = SessionAffinity()
@@ -0,0 +1,306 @@
+"""
+已上线技能的问答缓存
+配置中开启缓存的技能，归一化后完全相同的问题，或者语义相近的问题（使用技能知识库的embedding模型，
+相似度超过阈值）直接返回缓存的答案和溯源文档，不再执行检索和大模型调用。
+缓存的命名空间由技能的 graph_data 和知识库文件的变化决定，技能或知识库变化后旧缓存不再命中，由redis过期清理。
+"""
+import hashlib
+import json
+import re
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from typing import Any, Dict, List, NamedTuple, Optional, Tuple
+from uuid import UUID
+
+import numpy as np
+from bisheng.cache.redis import redis_client
+from bisheng.database.base import session_getter
+from bisheng.database.models.flow import Flow
+from bisheng.database.models.knowledge import Knowledge
+from bisheng.database.models.knowledge_file import KnowledgeFile
+from bisheng.settings import settings
+from bisheng.utils.logger import logger
+from sqlalchemy import func
+from sqlmodel import select
+
+_PREFIX = 'answer_cache'
+# 语义索引中记录版本号的字段，淘汰条目后递增，各进程据此刷新内存中的索引
+_VERSION_FIELD = '_version'
+# 索引中每个问题的值为 写入时间(float64) + 归一化向量(float32)
+_STAMP_BYTES = 8
+_TRAILING_PUNCTUATION = '?？。.!！~～ '
+_WHITESPACE = re.compile(r'\s+')
+
+
+class AnswerScope(NamedTuple):
+    """ 技能实例的缓存范围，构建技能时计算 """
+    flow_id: str
+    graph_hash: str
+    knowledge_ids: Tuple[int, ...]
+    embedding_model: Optional[str]
+    # 开启文件权限时缓存按用户隔离
+    user_id: Optional[int]
+
+
+class CachedAnswer(NamedTuple):
+    question: str
+    answer: Any
+    source_documents: list
+    output_key: Optional[str]
+    # 生成答案的耗时，用于统计节省的时间
+    cost: float
+
+
+def normalize_question(text: str) -> str:
+    text = unicodedata.normalize('NFKC', text).lower()
+    return _WHITESPACE.sub(' ', text).strip().rstrip(_TRAILING_PUNCTUATION)
+
+
+def _knowledge_ids(graph_data: dict) -> Tuple[int, ...]:
+    """ 技能中知识库节点引用的知识库 """
+    knowledge_ids = set()
+    for node in graph_data.get('nodes', []):
+        template = node.get('data', {}).get('node', {}).get('template', {})
+        for value in template.values():
+            if isinstance(value, dict) and value.get('collection_id'):
+                knowledge_ids.add(int(value['collection_id']))
+    return tuple(sorted(knowledge_ids))
+
+
+class AnswerCache:
+
+    # 进程内缓存的语义索引数量
+    max_indexes = 64
+
+    def __init__(self):
+        self._embeddings: Dict[str, Any] = {}
+        # 向量索引 redis key -> ((条数, 版本号), 问题hash列表, 写入时间, 归一化的向量矩阵)
+        self._indexes: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _conf() -> dict:
+        return settings.get_from_db('answer_cache') or {}
+
+    def scope(self, flow_id: str, graph_data: dict, user_id: Optional[int] = None) -> Optional[AnswerScope]:
+        """ 技能未开启缓存或未上线时返回None """
+        conf = self._conf()
+        try:
+            flow_ids = {UUID(str(f)).hex for f in conf.get('flow_ids') or []}
+            flow_id = UUID(str(flow_id)).hex
+        except ValueError as e:
+            logger.warning(f'answer_cache flow_ids config error err={e}')
+            return None
+        if flow_id not in flow_ids:
+            return None
+        with session_getter() as session:
+            flow = session.get(Flow, UUID(flow_id))
+        if not flow or flow.status != 2:
+            return None
+
+        knowledge_ids = _knowledge_ids(graph_data)
+        embedding_model = None
+        if knowledge_ids:
+            with session_getter() as session:
+                knowledge = session.get(Knowledge, knowledge_ids[0])
+            embedding_model = knowledge.model if knowledge else None
+        graph_hash = hashlib.sha1(json.dumps(graph_data, sort_keys=True, default=str).encode()).hexdigest()
+        if not settings.get_from_db('file_access'):
+            user_id = None
+        return AnswerScope(flow_id, graph_hash, knowledge_ids, embedding_model, user_id)
+
+    @staticmethod
+    def cacheable(langchain_object) -> bool:
+        """ 有对话历史时答案依赖上下文，不使用缓存 """
+        memory = getattr(langchain_object, 'memory', None)
+        chat_memory = getattr(memory, 'chat_memory', None)
+        return not (chat_memory and chat_memory.messages)
+
+    @staticmethod
+    def save_memory(langchain_object, inputs: dict, answer: Any):
+        """ 命中缓存时技能没有执行，问答需要写入技能的对话记忆，后续轮次才能带上上下文 """
+        memory = getattr(langchain_object, 'memory', None)
+        if memory is None:
+            return
+        output_keys = getattr(langchain_object, 'output_keys', None) or ['output']
+        inputs = {k: v for k, v in inputs.items() if k != 'id'}
+        try:
+            memory.save_context(inputs, {output_keys[0]: answer})
+        except Exception as e:
+            logger.warning(f'answer_cache save memory failed err={e}')
+
+    @staticmethod
+    def _namespace(scope: AnswerScope) -> str:
+        # 知识库中的文件增删后命名空间随之变化
+        knowledge_version = ''
+        if scope.knowledge_ids:
+            with session_getter() as session:
+                rows = session.exec(
+                    select(KnowledgeFile.knowledge_id, func.count(KnowledgeFile.id),
+                           func.max(KnowledgeFile.update_time)).where(
+                               KnowledgeFile.knowledge_id.in_(scope.knowledge_ids)).group_by(
+                                   KnowledgeFile.knowledge_id)).all()
+            knowledge_version = json.dumps(sorted(rows), default=str)
+        raw = f'{scope.graph_hash}:{knowledge_version}:{scope.user_id}'
+        return f'{_PREFIX}:{scope.flow_id}:{hashlib.sha1(raw.encode()).hexdigest()[:16]}'
+
+    @staticmethod
+    def _question(inputs: dict) -> Optional[str]:
+        """ 输入都是文本时返回用于匹配的问题，多个输入按key拼接 """
+        inputs = {k: v for k, v in inputs.items() if k != 'id'}
+        if not inputs or not all(isinstance(v, str) for v in inputs.values()):
+            return None
+        if len(inputs) == 1:
+            return normalize_question(next(iter(inputs.values())))
+        return json.dumps({k: normalize_question(v) for k, v in sorted(inputs.items())}, ensure_ascii=False)
+
+    def _embedding(self, model: str):
+        embedding = self._embeddings.get(model)
+        if embedding is None:
+            from bisheng.api.v1.knowledge import decide_embeddings
+            embedding = self._embeddings[model] = decide_embeddings(model)
+        return embedding
+
+    def _embed(self, scope: AnswerScope, question: str) -> Optional[np.ndarray]:
+        try:
+            vector = np.asarray(self._embedding(scope.embedding_model).embed_query(question), dtype=np.float32)
+        except Exception as e:
+            logger.warning(f'answer_cache embed failed model={scope.embedding_model} err={e}')
+            return None
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else None
+
+    def _load_index(self, name: str) -> Tuple[List[str], Optional[np.ndarray], Optional[np.ndarray]]:
+        """ 返回 问题hash列表, 写入时间, 向量矩阵 """
+        version = (redis_client.hlen(name), redis_client.hget(name, _VERSION_FIELD))
+        with self._lock:
+            cached = self._indexes.get(name)
+            if cached and cached[0] == version:
+                self._indexes.move_to_end(name)
+                return cached[1], cached[2], cached[3]
+        items = {(k.decode() if isinstance(k, bytes) else k): v
+                 for k, v in (redis_client.hgetall(name) or {}).items()}
+        items.pop(_VERSION_FIELD, None)
+        if not items:
+            return [], None, None
+        keys = list(items.keys())
+        stamps = np.array([np.frombuffer(v, dtype=np.float64, count=1)[0] for v in items.values()])
+        matrix = np.stack([np.frombuffer(v, dtype=np.float32, offset=_STAMP_BYTES) for v in items.values()])
+        with self._lock:
+            self._indexes[name] = (version, keys, stamps, matrix)
+            while len(self._indexes) > self.max_indexes:
+                self._indexes.popitem(last=False)
+        return keys, stamps, matrix
+
+    def _evict(self, name: str, max_entries: int, ttl: int):
+        """ 索引已满时先淘汰答案已过期的问题，仍然超出时淘汰最早写入的问题 """
+        keys, stamps, _ = self._load_index(name)
+        if len(keys) < max_entries:
+            return
+        expired = stamps < time.time() - ttl
+        evicted = [keys[i] for i in np.flatnonzero(expired)]
+        overflow = len(keys) - len(evicted) - max_entries + 1
+        if overflow > 0:
+            alive = np.flatnonzero(~expired)
+            evicted.extend(keys[i] for i in alive[np.argsort(stamps[alive])[:overflow]])
+        redis_client.hdel(name, *evicted)
+        redis_client.hincrby(name, _VERSION_FIELD)
+
+    def lookup(self, scope: AnswerScope, inputs: dict) -> Optional[CachedAnswer]:
+        """ redis或数据库异常时按未命中处理，不影响正常问答 """
+        try:
+            return self._lookup(scope, inputs)
+        except Exception as e:
+            logger.exception(f'answer_cache lookup failed flow_id={scope.flow_id} err={e}')
+            return None
+
+    def _lookup(self, scope: AnswerScope, inputs: dict) -> Optional[CachedAnswer]:
+        question = self._question(inputs)
+        if question is None:
+            return None
+        start = time.perf_counter()
+        conf = self._conf()
+        namespace = self._namespace(scope)
+        question_hash = hashlib.sha1(question.encode()).hexdigest()
+        entry = redis_client.get(f'{namespace}:q:{question_hash}')
+        match = 'exact'
+        if entry is None and scope.embedding_model and conf.get('semantic', True):
+            match = 'semantic'
+            vector = self._embed(scope, question)
+            name = f'{namespace}:index'
+            keys, _, matrix = self._load_index(name)
+            if vector is not None and matrix is not None and matrix.shape[1] == vector.shape[0]:
+                scores = matrix @ vector
+                best = int(np.argmax(scores))
+                if scores[best] >= float(conf.get('similarity_threshold', 0.95)):
+                    entry = redis_client.get(f'{namespace}:q:{keys[best]}')
+                    if entry is None:
+                        # 答案已过期，索引中的问题一并清理
+                        redis_client.hdel(name, keys[best])
+        elapsed = time.perf_counter() - start
+        self._record(scope.flow_id, entry, elapsed, match)
+        return CachedAnswer(**entry) if entry else None
+
+    def store(self, scope: AnswerScope, inputs: dict, answer: Any, source_documents: Optional[list], cost: float,
+              output_key: Optional[str] = None):
+        """ 写入失败时跳过，不影响已生成的答案 """
+        try:
+            self._store(scope, inputs, answer, source_documents, cost, output_key)
+        except Exception as e:
+            logger.exception(f'answer_cache store failed flow_id={scope.flow_id} err={e}')
+
+    def _store(self, scope: AnswerScope, inputs: dict, answer: Any, source_documents: Optional[list], cost: float,
+               output_key: Optional[str] = None):
+        question = self._question(inputs)
+        if question is None or not answer:
+            return
+        conf = self._conf()
+        ttl = int(conf.get('ttl', 86400))
+        namespace = self._namespace(scope)
+        question_hash = hashlib.sha1(question.encode()).hexdigest()
+        entry = CachedAnswer(question, answer, list(source_documents or []), output_key, cost)
+        try:
+            redis_client.set(f'{namespace}:q:{question_hash}', entry._asdict(), expiration=ttl)
+        except TypeError as e:
+            logger.warning(f'answer_cache skip flow_id={scope.flow_id} err={e}')
+            return
+        if scope.embedding_model and conf.get('semantic', True):
+            vector = self._embed(scope, question)
+            if vector is None:
+                return
+            name = f'{namespace}:index'
+            self._evict(name, int(conf.get('max_entries', 1000)), ttl)
+            # 每次写入都会刷新索引的过期时间，和最后写入的答案同时过期
+            redis_client.hsetkey(name, question_hash,
+                                 np.float64(time.time()).tobytes() + vector.tobytes(),
+                                 expiration=ttl)
+
+    @staticmethod
+    def _record(flow_id: str, entry: Optional[dict], elapsed: float, match: str):
+        name = f'{_PREFIX}:stats:{flow_id}'
+        if entry:
+            saved_ms = max(int((entry['cost'] - elapsed) * 1000), 0)
+            redis_client.hincrby(name, 'hits')
+            redis_client.hincrby(name, 'saved_ms', saved_ms)
+            logger.info(f'answer_cache hit flow_id={flow_id} match={match} '
+                        f'lookup={elapsed * 1000:.0f}ms saved={saved_ms}ms')
+        else:
+            redis_client.hincrby(name, 'misses')
+
+    @staticmethod
+    def stats(flow_id: str) -> dict:
+        """ 命中率以及命中后节省的总耗时 """
+        raw = redis_client.hgetall(f'{_PREFIX}:stats:{UUID(str(flow_id)).hex}') or {}
+        stats = {(k.decode() if isinstance(k, bytes) else k): int(v) for k, v in raw.items()}
+        hits, misses = stats.get('hits', 0), stats.get('misses', 0)
+        return {
+            'hits': hits,
+            'misses': misses,
+            'hit_ratio': hits / (hits + misses) if hits + misses else 0,
+            'saved_ms': stats.get('saved_ms', 0),
+        }
+
+
+answer_cache = AnswerCache()
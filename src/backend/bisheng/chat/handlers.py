@@ -1,8 +1,10 @@
+import asyncio
 import json
 import time
 from typing import Dict
 
 from bisheng.api.v1.schemas import ChatMessage, ChatResponse
+from bisheng.chat.answer_cache import answer_cache
 from bisheng.chat.manager import ChatManager
 from bisheng.chat.utils import judge_source, process_graph, process_source_document
 from bisheng.database.base import session_getter
@@ -12,6 +14,7 @@ from bisheng.utils.logger import logger
 from bisheng.utils.minio_client import MinioClient
 from bisheng.utils.util import get_cache_key
 from bisheng_langchain.chains.autogen.auto_gen import AutoGenChain
+from bisheng_langchain.utils import tracing
 from sqlmodel import select
 
 
@@ -34,8 +37,10 @@ class Handler:
             if action not in self.handler_dict:
                 raise Exception(f'unknown action {action}')
 
-            await self.handler_dict[action](session, client_id, chat_id, payload, user_id)
-            logger.info(f'dispatch_task done timecost={time.time() - start_time}')
+            with tracing.span('chat.turn', trace_id=chat_id, action=action) as turn:
+                await self.handler_dict[action](session, client_id, chat_id, payload, user_id)
+            logger.info(f'dispatch_task done timecost={time.time() - start_time} '
+                        f'stages={turn.stage_summary()}')
         return client_id, chat_id
 
     async def process_report(self,
@@ -134,13 +139,30 @@ class Handler:
         try:
             logger.debug(f'Generating result and thought key={key}')
             langchain_object = session.in_memory_cache.get(key)
-            result, intermediate_steps, source_doucment = await process_graph(
-                langchain_object=langchain_object,
-                chat_inputs=chat_inputs,
-                websocket=session.active_connections[get_cache_key(client_id, chat_id)],
-                flow_id=client_id,
-                chat_id=chat_id,
-            )
+            answer_scope = session.in_memory_cache.get(key + '_answer_scope')
+            if not (is_begin and answer_cache.cacheable(langchain_object)):
+                answer_scope = None
+            cached = None
+            if answer_scope:
+                cached = await asyncio.to_thread(answer_cache.lookup, answer_scope,
+                                                 chat_inputs.message)
+            if cached:
+                result, intermediate_steps, source_doucment = cached.answer, '', cached.source_documents
+                answer_cache.save_memory(langchain_object, chat_inputs.message, cached.answer)
+            else:
+                start_time = time.time()
+                result, intermediate_steps, source_doucment = await process_graph(
+                    langchain_object=langchain_object,
+                    chat_inputs=chat_inputs,
+                    websocket=session.active_connections[get_cache_key(client_id, chat_id)],
+                    flow_id=client_id,
+                    chat_id=chat_id,
+                )
+                if answer_scope:
+                    # 和 /process 接口共用缓存，记录技能真实的输出key
+                    output_key = (getattr(langchain_object, 'output_keys', None) or [None])[0]
+                    await asyncio.to_thread(answer_cache.store, answer_scope, chat_inputs.message, result,
+                                            source_doucment, time.time() - start_time, output_key)
         except Exception as e:
             # Log stack trace
             logger.exception(e)
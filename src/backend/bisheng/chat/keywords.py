@@ -0,0 +1,272 @@
+"""
+回答关键词的后台抽取
+回答结束后只写入溯源用的chunk，关键词由后台线程攒批调用大模型抽取后回填到 RecallChunk。
+溯源接口在后台任务完成前被访问时，直接在当前请求中抽取并回填，后续访问直接读取。
+"""
+import ast
+import json
+import queue
+import re
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+from bisheng.database.base import session_getter
+from bisheng.database.models.message import ChatMessage
+from bisheng.database.models.model_deploy import ModelDeploy
+from bisheng.database.models.recall_chunk import RecallChunk
+from bisheng.settings import settings
+from bisheng.utils.logger import logger
+from bisheng_langchain.chat_models import HostQwenChat
+from langchain.chains import LLMChain
+from langchain.prompts import PromptTemplate
+from sqlmodel import select
+
+# 关键词尚未抽取的 RecallChunk.keywords
+PENDING_KEYWORDS = ''
+
+prompt_template = '''分析给定Question，提取Question中包含的KeyWords，输出列表形式
+
+Examples:
+Question: 达梦公司在过去三年中的流动比率如下：2021年：3.74倍；2020年：2.82倍；2019年：2.05倍。
+KeyWords: ['过去三年', '流动比率', '2021', '3.74', '2020', '2.82', '2019', '2.05']
+
+----------------
+Question: {question}'''
+
+batch_prompt_template = '''分析给定的每个Question，分别提取Question中包含的KeyWords，每个Question输出一行，格式为 序号. KeyWords: 列表
+
+Examples:
+1. Question: 达梦公司在过去三年中的流动比率如下：2021年：3.74倍；2020年：2.82倍；2019年：2.05倍。
+2. Question: 公司2022年的营业收入为10.5亿元。
+1. KeyWords: ['过去三年', '流动比率', '2021', '3.74', '2020', '2.82', '2019', '2.05']
+2. KeyWords: ['2022', '营业收入', '10.5亿元']
+
+----------------
+{questions}'''
+
+_batch_line = re.compile(r'^\s*(\d+)\.\s*KeyWords:\s*(\[.*\])\s*$', re.MULTILINE)
+
+_llm_cache: Dict[Tuple[str, str], HostQwenChat] = {}
+
+
+def get_keyword_model() -> Tuple[Optional[str], Optional[str]]:
+    """ 关键词抽取使用的模型和地址，模型配置临时方案 """
+    keyword_conf = settings.get_default_llm() or {}
+    host_base_url = keyword_conf.get('host_base_url')
+    model = keyword_conf.get('model')
+
+    if model and not host_base_url:
+        with session_getter() as db_session:
+            model_deploy = db_session.exec(select(ModelDeploy).where(ModelDeploy.model == model)).first()
+        if model_deploy:
+            model = model if model_deploy.status == '已上线' else None
+            host_base_url = model_deploy.endpoint
+        else:
+            logger.error('不能使用配置模型进行关键词抽取，配置不正确')
+    return model, host_base_url
+
+
+def _get_llm_chain(extract_model: str, host_base_url: str, template: str) -> LLMChain:
+    key = (extract_model, host_base_url)
+    llm = _llm_cache.get(key)
+    if llm is None:
+        llm = HostQwenChat(model_name=extract_model,
+                           host_base_url=host_base_url,
+                           max_tokens=8192,
+                           temperature=0,
+                           top_p=1,
+                           verbose=True)
+        _llm_cache[key] = llm
+    return LLMChain(llm=llm, prompt=PromptTemplate.from_template(template))
+
+
+def _jieba_keywords(answer: str) -> List[str]:
+    import jieba.analyse
+    return jieba.analyse.extract_tags(answer, topK=100, withWeight=False)
+
+
+def extract_answer_keys(answer, extract_model, host_base_url):
+    """
+    提取answer中的关键词
+    """
+    if not extract_model:
+        return _jieba_keywords(answer)
+    try:
+        llm_chain = _get_llm_chain(extract_model, host_base_url, prompt_template)
+        keywords_str = llm_chain.run(answer)
+        keywords = ast.literal_eval(keywords_str[9:].strip())
+    except Exception:
+        logger.warning(f'llm {extract_model} extract_not_support, change to jieba')
+        keywords = _jieba_keywords(answer)
+
+    return keywords
+
+
+def extract_answer_keys_batch(answers: List[str], extract_model, host_base_url) -> List[List[str]]:
+    """
+    一次模型调用提取多个answer的关键词，结果缺失的answer单独抽取
+    """
+    if len(answers) == 1 or not extract_model:
+        return [extract_answer_keys(answer, extract_model, host_base_url) for answer in answers]
+
+    result: Dict[int, List[str]] = {}
+    try:
+        llm_chain = _get_llm_chain(extract_model, host_base_url, batch_prompt_template)
+        questions = '\n'.join(f'{i}. Question: {answer}' for i, answer in enumerate(answers, 1))
+        for index, keywords_str in _batch_line.findall(llm_chain.run(questions)):
+            try:
+                result[int(index) - 1] = ast.literal_eval(keywords_str)
+            except Exception:
+                continue
+    except Exception as e:
+        logger.warning(f'llm {extract_model} batch extract failed: {e}')
+
+    return [
+        result[i] if isinstance(result.get(i), list) else extract_answer_keys(answer, extract_model, host_base_url)
+        for i, answer in enumerate(answers)
+    ]
+
+
+class KeywordExtractor:
+    """ 后台抽取回答关键词的线程，多个回答攒批后一次调用大模型 """
+
+    # 一批回答的总长度上限，避免超出模型上下文
+    max_batch_chars = 4000
+
+    def __init__(self):
+        self._queue: queue.Queue = queue.Queue()
+        # 已提交未开始处理的回答 message_id -> answer
+        self._pending: Dict[int, str] = {}
+        # 正在抽取的回答
+        self._running: Dict[int, threading.Event] = {}
+        self._lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self.batch_size = 8
+        self.batch_wait = 0.2
+
+    def start(self):
+        if self._thread and self._thread.is_alive():
+            return
+        conf = settings.get_from_db('keyword_extract') or {}
+        self.batch_size = max(1, int(conf.get('batch_size', self.batch_size)))
+        self.batch_wait = float(conf.get('batch_wait_ms', self.batch_wait * 1000)) / 1000
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, name='keyword_extractor', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """ 未处理的回答在溯源接口访问时再抽取 """
+        self._stop_event.set()
+
+    def submit(self, message_id: int, answer: str):
+        with self._lock:
+            self._pending[message_id] = answer
+        self._queue.put(message_id)
+
+    def _claim(self, message_ids: List[int]) -> List[Tuple[int, str]]:
+        """ 领取待处理的回答，已被溯源接口领取的跳过 """
+        claimed = []
+        with self._lock:
+            for message_id in message_ids:
+                answer = self._pending.pop(message_id, None)
+                if answer is not None:
+                    self._running[message_id] = threading.Event()
+                    claimed.append((message_id, answer))
+        return claimed
+
+    def _finish(self, message_id: int):
+        with self._lock:
+            event = self._running.pop(message_id, None)
+        if event:
+            event.set()
+
+    def _next_batch(self) -> List[int]:
+        try:
+            message_ids = [self._queue.get(timeout=1)]
+        except queue.Empty:
+            return []
+        deadline = time.monotonic() + self.batch_wait
+        while len(message_ids) < self.batch_size:
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            try:
+                message_ids.append(self._queue.get(timeout=timeout))
+            except queue.Empty:
+                break
+        return message_ids
+
+    def _run(self):
+        while not self._stop_event.is_set():
+            claimed = self._claim(self._next_batch())
+            if not claimed:
+                continue
+            try:
+                model, host_base_url = get_keyword_model()
+                # 按长度拆分为多次调用
+                batch, batch_chars = [], 0
+                for item in claimed:
+                    if batch and batch_chars + len(item[1]) > self.max_batch_chars:
+                        self._process(batch, model, host_base_url)
+                        batch, batch_chars = [], 0
+                    batch.append(item)
+                    batch_chars += len(item[1])
+                self._process(batch, model, host_base_url)
+            except Exception as e:
+                logger.exception(f'keyword extract error: {e}')
+            finally:
+                for message_id, _ in claimed:
+                    self._finish(message_id)
+
+    def _process(self, batch: List[Tuple[int, str]], model, host_base_url):
+        start = time.time()
+        keywords_list = extract_answer_keys_batch([answer for _, answer in batch], model, host_base_url)
+        for (message_id, _), keywords in zip(batch, keywords_list):
+            self.save_keywords(message_id, keywords)
+        logger.info(f'keyword_extract batch={len(batch)} cost={time.time() - start:.2f}s')
+
+    @staticmethod
+    def save_keywords(message_id: int, keywords: List[str]):
+        with session_getter() as db_session:
+            chunks = db_session.exec(
+                select(RecallChunk).where(RecallChunk.message_id == message_id,
+                                          RecallChunk.keywords == PENDING_KEYWORDS)).all()
+            for chunk in chunks:
+                chunk.keywords = json.dumps(keywords)
+            db_session.add_all(chunks)
+            db_session.commit()
+
+    def get_keywords(self, message_id: int) -> Optional[List[str]]:
+        """
+        溯源接口获取关键词，后台尚未抽取时在当前线程抽取，返回None表示chunk还未写入
+        """
+        with session_getter() as db_session:
+            chunk = db_session.exec(select(RecallChunk).where(RecallChunk.message_id == message_id)).first()
+        if not chunk:
+            return None
+        if chunk.keywords != PENDING_KEYWORDS:
+            return json.loads(chunk.keywords)
+
+        claimed = self._claim([message_id])
+        if claimed:
+            answer = claimed[0][1]
+        else:
+            with self._lock:
+                event = self._running.get(message_id)
+            if event and event.wait(timeout=60):
+                return self.get_keywords(message_id)
+            # 任务不在当前进程，从消息记录中读取回答
+            with session_getter() as db_session:
+                message = db_session.get(ChatMessage, message_id)
+            answer = message.message if message else ''
+        try:
+            keywords = extract_answer_keys(answer, *get_keyword_model())
+            self.save_keywords(message_id, keywords)
+        finally:
+            self._finish(message_id)
+        return keywords
+
+
+keyword_extractor = KeywordExtractor()
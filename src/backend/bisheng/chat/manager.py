@@ -11,6 +11,8 @@ from bisheng.api.v1.schemas import ChatMessage, ChatResponse, FileResponse
 from bisheng.cache import cache_manager
 from bisheng.cache.flow import InMemoryCache
 from bisheng.cache.manager import Subject
+from bisheng.chat.affinity import session_affinity
+from bisheng.chat.answer_cache import answer_cache
 from bisheng.database.base import session_getter
 from bisheng.database.models.flow import Flow
 from bisheng.database.models.user import User
@@ -18,8 +20,10 @@ from bisheng.processing.process import process_tweaks
 from bisheng.utils.threadpool import ThreadPoolManager, thread_pool
 from bisheng.utils.util import get_cache_key
 from bisheng_langchain.input_output.output import Report
+from bisheng_langchain.utils import tracing
 from fastapi import WebSocket, WebSocketDisconnect, status
 from loguru import logger
+from starlette.websockets import WebSocketState
 
 
 class ChatHistory(Subject):
@@ -41,17 +45,18 @@ class ChatHistory(Subject):
         message.chat_id = chat_id
         if chat_id and (message.message or message.intermediate_steps
                         or message.files) and message.type != 'stream':
-            msg = message.copy()
-            msg.message = str(msg.message) if isinstance(msg.message, dict) else msg.message
-            files = json.dumps(msg.files) if msg.files else ''
-            msg.__dict__.pop('files')
-            db_message = ChatMessage(files=files, **msg.__dict__)
-            logger.info(f'chat={db_message} time={time.time()-t1}')
-            with session_getter() as seesion:
-                seesion.add(db_message)
-                seesion.commit()
-                seesion.refresh(db_message)
-                message.message_id = db_message.id
+            with tracing.span('chat.history.add_message', message_type=message.type):
+                msg = message.copy()
+                msg.message = str(msg.message) if isinstance(msg.message, dict) else msg.message
+                files = json.dumps(msg.files) if msg.files else ''
+                msg.__dict__.pop('files')
+                db_message = ChatMessage(files=files, **msg.__dict__)
+                logger.info(f'chat={db_message} time={time.time()-t1}')
+                with session_getter() as seesion:
+                    seesion.add(db_message)
+                    seesion.commit()
+                    seesion.refresh(db_message)
+                    message.message_id = db_message.id
 
         if not isinstance(message, FileResponse):
             self.notify()
@@ -63,7 +68,9 @@ class ChatHistory(Subject):
 
 class ChatManager:
 
-    def __init__(self):
+    def __init__(self, name: str = 'default'):
+        self.name = name
+        session_affinity.register(name, self)
         self.active_connections: Dict[str, WebSocket] = {}
         self.chat_history = ChatHistory()
         self.cache_manager = cache_manager
@@ -86,7 +93,9 @@ class ChatManager:
                                           self.cache_manager.current_chat_id, chat_response)
 
     async def connect(self, client_id: str, chat_id: str, websocket: WebSocket):
-        await websocket.accept()
+        # 转发或接管的连接已经accept过
+        if websocket.client_state == WebSocketState.CONNECTING:
+            await websocket.accept()
         self.active_connections[get_cache_key(client_id, chat_id)] = websocket
 
     def reuse_connect(self, client_id: str, chat_id: str, websocket: WebSocket):
@@ -149,6 +158,17 @@ class ChatManager:
         self.in_memory_cache.set(client_id, langchain_object)
         return client_id in self.in_memory_cache
 
+    async def dispatch_websocket(self,
+                                 flow_id: str,
+                                 chat_id: str,
+                                 websocket: WebSocket,
+                                 user_id: int,
+                                 gragh_data: dict = None):
+        """ 多worker部署时，会话交给持有已构建对象的worker处理，避免重复构建 """
+        if not chat_id or not session_affinity.enabled:
+            return await self.handle_websocket(flow_id, chat_id, websocket, user_id, gragh_data=gragh_data)
+        await session_affinity.handle_websocket(self.name, flow_id, chat_id, websocket, user_id, gragh_data)
+
     async def handle_websocket(
         self,
         flow_id: str,
@@ -213,6 +233,7 @@ class ChatManager:
                             continue
                         logger.info('act=new_chat_init_success key={}', key)
                         key_list.add(key)
+                        await session_affinity.claim(flow_id, chat_id)
                     if not payload.get('inputs'):
                         continue
 
@@ -477,6 +498,8 @@ class ChatManager:
                 question.extend(await node.get_result())
 
         self.set_cache(key_node + '_question', question)
+        answer_scope = await asyncio.to_thread(answer_cache.scope, flow_id, graph_data, user_id)
+        self.set_cache(key_node + '_answer_scope', answer_scope)
         input_nodes = graph.get_input_nodes()
         for node in input_nodes:
             # 只存储chain
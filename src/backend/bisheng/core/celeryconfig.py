@@ -16,3 +16,5 @@ if True:
     result_backend = os.environ.get('RESULT_BACKEND', 'redis://localhost:6379/0')
 # tasks should be json or pickle
 accept_content = ['json', 'pickle']
+# 入库等长任务 acks_late, 每个worker进程只预取一个任务
+worker_prefetch_multiplier = 1
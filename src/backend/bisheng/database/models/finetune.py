@@ -172,6 +172,13 @@ class FinetuneDao(FinetuneBase):
             session.commit()
             return True
 
+    @classmethod
+    def find_training_jobs(cls) -> List[Finetune]:
+        """ 获取所有训练中的任务 """
+        with session_getter() as session:
+            statement = select(Finetune).where(Finetune.status == FinetuneStatus.TRAINING.value)
+            return session.exec(statement).all()
+
     @classmethod
     def find_jobs(cls, finetune_list: FinetuneList) -> (List[Finetune], int):
         offset = (finetune_list.page - 1) * finetune_list.limit
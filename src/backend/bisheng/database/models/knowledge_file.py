@@ -1,9 +1,10 @@
 from datetime import datetime
-from typing import Optional
+from typing import List, Optional
 
+from bisheng.database.base import session_getter
 from bisheng.database.models.base import SQLModelSerializable
 from sqlalchemy import Column, DateTime, String, text
-from sqlmodel import Field
+from sqlmodel import Field, select
 
 
 class KnowledgeFileBase(SQLModelSerializable):
@@ -33,3 +34,14 @@ class KnowledgeFileRead(KnowledgeFileBase):
 
 class KnowledgeFileCreate(KnowledgeFileBase):
     pass
+
+
+class KnowledgeFileDao(KnowledgeFileBase):
+
+    @classmethod
+    def get_file_ids(cls, knowledge_ids: List[int]) -> List[int]:
+        """ 知识库中入库成功的文件id """
+        with session_getter() as session:
+            statement = select(KnowledgeFile.id).where(KnowledgeFile.knowledge_id.in_(knowledge_ids),
+                                                       KnowledgeFile.status == 2)
+            return list(session.exec(statement).all())
@@ -1,8 +1,8 @@
-from typing import Dict, Generator, List, Type, Union
+from typing import Dict, Generator, List, Optional, Type, Union
 
 from bisheng.graph.edge.base import Edge
 from bisheng.graph.graph.constants import lazy_load_vertex_dict
-from bisheng.graph.utils import process_flow
+from bisheng.graph.utils import process_flow, topological_order
 from bisheng.graph.vertex.base import Vertex
 from bisheng.graph.vertex.types import FileToolVertex, LLMVertex, ToolkitVertex
 from bisheng.interface.tools.constants import FILE_TOOLS
@@ -66,10 +66,39 @@ class Graph:
                 f"Invalid payload. Expected keys 'nodes' and 'edges'. Found {list(payload.keys())}"
             ) from exc
 
+    @property
+    def vertices(self) -> List[Vertex]:
+        return self._vertex_list
+
+    @vertices.setter
+    def vertices(self, vertices: List[Vertex]) -> None:
+        self._vertex_list = vertices
+        self.vertex_map = {vertex.id: vertex for vertex in vertices}
+        self._sorted_vertices: Optional[List[Vertex]] = None
+
+    @property
+    def edges(self) -> List[Edge]:
+        return self._edge_list
+
+    @edges.setter
+    def edges(self, edges: List[Edge]) -> None:
+        """Replacing the edges rebuilds the adjacency indexes, the lists must not be changed in place."""
+        self._edge_list = edges
+        # vertex_id -> 边列表，均保持 edges 中的顺序
+        self._vertex_edges: Dict[str, List[Edge]] = {}
+        self._in_edges: Dict[str, List[Edge]] = {}
+        self._out_edges: Dict[str, List[Edge]] = {}
+        for edge in edges:
+            self._out_edges.setdefault(edge.source_id, []).append(edge)
+            self._in_edges.setdefault(edge.target_id, []).append(edge)
+            self._vertex_edges.setdefault(edge.source_id, []).append(edge)
+            if edge.target_id != edge.source_id:
+                self._vertex_edges.setdefault(edge.target_id, []).append(edge)
+        self._sorted_vertices = None
+
     def _build_graph(self) -> None:
         """Builds the graph from the nodes and edges."""
         self.vertices = self._build_vertices()
-        self.vertex_map = {vertex.id: vertex for vertex in self.vertices}
         self.edges = self._build_edges()
 
         # This is a hack to make sure that the LLM node is sent to
@@ -110,20 +139,16 @@ class Graph:
 
     def get_vertex_edges(self, vertex_id: str) -> List[Edge]:
         """Returns a list of edges for a given vertex."""
-        return [
-            edge for edge in self.edges
-            if edge.source_id == vertex_id or edge.target_id == vertex_id
-        ]
+        return list(self._vertex_edges.get(vertex_id, ()))
 
     def get_vertices_with_target(self, vertex_id: str) -> List[Vertex]:
         """Returns the vertices connected to a vertex."""
         vertices: List[Vertex] = []
-        for edge in self.edges:
-            if edge.target_id == vertex_id:
-                vertex = self.get_vertex(edge.source_id)
-                if vertex is None:
-                    continue
-                vertices.append(vertex)
+        for edge in self._in_edges.get(vertex_id, ()):
+            vertex = self.get_vertex(edge.source_id)
+            if vertex is None:
+                continue
+            vertices.append(vertex)
         return vertices
 
     def get_input_nodes(self) -> List[Vertex]:
@@ -153,28 +178,14 @@ class Graph:
         Raises:
             ValueError: If the graph contains a cycle.
         """
-        # States: 0 = unvisited, 1 = visiting, 2 = visited
-        state = {node: 0 for node in self.vertices}
-        sorted_vertices = []
-
-        def dfs(node):
-            if state[node] == 1:
-                # We have a cycle
-                raise ValueError('Graph contains a cycle, cannot perform topological sort')
-            if state[node] == 0:
-                state[node] = 1
-                for edge in node.edges:
-                    if edge.source_id == node.id:
-                        dfs(self.get_vertex(edge.target_id))
-                state[node] = 2
-                sorted_vertices.append(node)
-
-        # Visit each node
-        for node in self.vertices:
-            if state[node] == 0:
-                dfs(node)
-
-        return list(reversed(sorted_vertices))
+        # 结果缓存到 vertices 或 edges 被替换
+        if self._sorted_vertices is None:
+            successors = {
+                vertex: [self.get_vertex(edge.target_id) for edge in self._out_edges.get(vertex.id, ())]
+                for vertex in self.vertices
+            }
+            self._sorted_vertices = topological_order(self.vertices, successors)
+        return list(self._sorted_vertices)
 
     def generator_build(self) -> Generator:
         """Builds each vertex in the graph and yields it."""
@@ -185,7 +196,7 @@ class Graph:
     def get_vertex_neighbors(self, vertex: Vertex) -> Dict[Vertex, int]:
         """Returns the neighbors of a vertex."""
         neighbors: Dict[Vertex, int] = {}
-        for edge in self.edges:
+        for edge in self._vertex_edges.get(vertex.id, ()):
             if edge.source_id == vertex.id:
                 neighbor = self.get_vertex(edge.target_id)
                 if neighbor is None:
@@ -2,12 +2,15 @@ import copy
 from collections import deque
 from typing import Dict, List
 
+from bisheng.graph.utils import topological_order
+
 
 def find_last_node(nodes, edges):
     """
     This function receives a flow and returns the last node.
     """
-    return next((n for n in nodes if all(e['source'] != n['id'] for e in edges)), None)
+    sources = {e['source'] for e in edges}
+    return next((n for n in nodes if n['id'] not in sources), None)
 
 
 def add_parent_node_id(nodes, parent_node_id):
@@ -51,31 +54,14 @@ def raw_topological_sort(nodes, edges) -> List[Dict]:
     # which are dicts instead of Vertex and Edge objects
     # nodes have an id, edges have a source and target keys
     # return a list of node ids in topological order
-
-    # States: 0 = unvisited, 1 = visiting, 2 = visited
-    state = {node['id']: 0 for node in nodes}
     nodes_dict = {node['id']: node for node in nodes}
-    sorted_vertices = []
-
-    def dfs(node):
-        if state[node] == 1:
-            # We have a cycle
-            raise ValueError('Graph contains a cycle, cannot perform topological sort')
-        if state[node] == 0:
-            state[node] = 1
-            for edge in edges:
-                if edge['source'] == node:
-                    dfs(edge['target'])
-            state[node] = 2
-            sorted_vertices.append(node)
-
-    # Visit each node
-    for node in nodes:
-        if state[node['id']] == 0:
-            dfs(node['id'])
+    # 预先建立邻接表，避免每个节点都遍历全部的边
+    successors: Dict[str, List[str]] = {}
+    for edge in edges:
+        successors.setdefault(edge['source'], []).append(edge['target'])
 
-    reverse_sorted = list(reversed(sorted_vertices))
-    return [nodes_dict[node_id] for node_id in reverse_sorted]
+    sorted_ids = topological_order(nodes_dict, successors)
+    return [nodes_dict[node_id] for node_id in sorted_ids]
 
 
 def process_flow(flow_object):
@@ -236,6 +222,9 @@ def get_updated_edges(base_flow, g_nodes, g_edges, group_node_id):
     """
     updated_edges = []
     for edge in base_flow['edges']:
+        # 只复制与分组节点相连的边
+        if edge['target'] != group_node_id and edge['source'] != group_node_id:
+            continue
         new_edge = copy.deepcopy(edge)
         if new_edge['target'] == group_node_id:
             new_edge = update_target_handle(new_edge, g_nodes, group_node_id)
@@ -243,6 +232,5 @@ def get_updated_edges(base_flow, g_nodes, g_edges, group_node_id):
         if new_edge['source'] == group_node_id:
             new_edge = update_source_handle(new_edge, g_nodes, g_edges)
 
-        if edge['target'] == group_node_id or edge['source'] == group_node_id:
-            updated_edges.append(new_edge)
+        updated_edges.append(new_edge)
     return updated_edges
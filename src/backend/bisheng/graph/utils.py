@@ -1,6 +1,6 @@
 import copy
 from collections import deque
-from typing import Any, Dict, List, Union
+from typing import Any, Dict, Hashable, Iterable, List, Union
 
 from bisheng.interface.utils import extract_input_variables_from_prompt
 
@@ -37,7 +37,8 @@ def find_last_node(nodes, edges):
     """
     This function receives a flow and returns the last node.
     """
-    return next((n for n in nodes if all(e['source'] != n['id'] for e in edges)), None)
+    sources = {e['source'] for e in edges}
+    return next((n for n in nodes if n['id'] not in sources), None)
 
 
 def add_parent_node_id(nodes, parent_node_id):
@@ -76,36 +77,52 @@ def ungroup_node(group_node_data, base_flow):
     return nodes
 
 
+def topological_order(keys: Iterable[Hashable],
+                      successors: Dict[Hashable, List[Hashable]]) -> List[Hashable]:
+    """
+    按 keys 的顺序深度优先遍历，返回拓扑序(与递归实现结果相同)，非递归避免长链路超出递归深度
+    successors 为每个节点的后继列表，存在环时抛出 ValueError
+    """
+    keys = list(keys)
+    # States: 0 = unvisited, 1 = visiting, 2 = visited
+    state = {key: 0 for key in keys}
+    sorted_keys = []
+    for key in keys:
+        if state[key] != 0:
+            continue
+        state[key] = 1
+        stack = [(key, iter(successors.get(key, ())))]
+        while stack:
+            node, children = stack[-1]
+            for child in children:
+                if state[child] == 1:
+                    # We have a cycle
+                    raise ValueError('Graph contains a cycle, cannot perform topological sort')
+                if state[child] == 0:
+                    state[child] = 1
+                    stack.append((child, iter(successors.get(child, ()))))
+                    break
+            else:
+                stack.pop()
+                state[node] = 2
+                sorted_keys.append(node)
+    sorted_keys.reverse()
+    return sorted_keys
+
+
 def raw_topological_sort(nodes, edges) -> List[Dict]:
     # Redefine the above function but using the nodes and self._edges
     # which are dicts instead of Vertex and Edge objects
     # nodes have an id, edges have a source and target keys
     # return a list of node ids in topological order
-
-    # States: 0 = unvisited, 1 = visiting, 2 = visited
-    state = {node['id']: 0 for node in nodes}
     nodes_dict = {node['id']: node for node in nodes}
-    sorted_vertices = []
-
-    def dfs(node):
-        if state[node] == 1:
-            # We have a cycle
-            raise ValueError('Graph contains a cycle, cannot perform topological sort')
-        if state[node] == 0:
-            state[node] = 1
-            for edge in edges:
-                if edge['source'] == node:
-                    dfs(edge['target'])
-            state[node] = 2
-            sorted_vertices.append(node)
-
-    # Visit each node
-    for node in nodes:
-        if state[node['id']] == 0:
-            dfs(node['id'])
+    # 预先建立邻接表，避免每个节点都遍历全部的边
+    successors: Dict[str, List[str]] = {}
+    for edge in edges:
+        successors.setdefault(edge['source'], []).append(edge['target'])
 
-    reverse_sorted = list(reversed(sorted_vertices))
-    return [nodes_dict[node_id] for node_id in reverse_sorted]
+    sorted_ids = topological_order(nodes_dict, successors)
+    return [nodes_dict[node_id] for node_id in sorted_ids]
 
 
 def process_flow(flow_object):
@@ -266,6 +283,9 @@ def get_updated_edges(base_flow, g_nodes, g_edges, group_node_id):
     """
     updated_edges = []
     for edge in base_flow['edges']:
+        # 只复制与分组节点相连的边
+        if edge['target'] != group_node_id and edge['source'] != group_node_id:
+            continue
         new_edge = copy.deepcopy(edge)
         if new_edge['target'] == group_node_id:
             new_edge = update_target_handle(new_edge, g_nodes, group_node_id)
@@ -273,6 +293,5 @@ def get_updated_edges(base_flow, g_nodes, g_edges, group_node_id):
         if new_edge['source'] == group_node_id:
             new_edge = update_source_handle(new_edge, g_nodes, g_edges)
 
-        if edge['target'] == group_node_id or edge['source'] == group_node_id:
-            updated_edges.append(new_edge)
+        updated_edges.append(new_edge)
     return updated_edges
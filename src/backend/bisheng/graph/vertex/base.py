@@ -9,6 +9,7 @@ from bisheng.interface.initialize import loading
 from bisheng.interface.listing import lazy_load_dict
 from bisheng.utils.constants import DIRECT_TYPES, NODE_ID_DICT, PRESET_QUESTION
 from bisheng.utils.util import sync_to_async
+from bisheng_langchain.utils import tracing
 from loguru import logger
 
 if TYPE_CHECKING:
@@ -431,7 +432,8 @@ class Vertex:
 
     async def build(self, force: bool = False, user_id=None, *args, **kwargs) -> Any:
         if not self._built or force:
-            await self._build(user_id, *args, **kwargs)
+            with tracing.span('graph.vertex.build', vertex_type=self.vertex_type):
+                await self._build(user_id, *args, **kwargs)
 
         return self._built_object
 
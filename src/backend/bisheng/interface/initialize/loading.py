@@ -1,8 +1,12 @@
 import json
-from typing import Any, Callable, Dict, Sequence, Type
+from functools import partial
+from typing import Any, Callable, Dict, List, Optional, Sequence, Type
 
 from bisheng.cache.utils import file_download
 from bisheng.chat.config import ChatConfig
+from bisheng.database.base import session_getter
+from bisheng.database.models.knowledge import Knowledge
+from bisheng.database.models.knowledge_file import KnowledgeFileDao
 from bisheng.interface.agents.base import agent_creator
 from bisheng.interface.chains.base import chain_creator
 from bisheng.interface.custom_lists import CUSTOM_NODES
@@ -31,6 +35,8 @@ from langchain.vectorstores.base import VectorStore
 from loguru import logger
 from pydantic import ValidationError, create_model
 from pydantic.fields import FieldInfo
+from sqlalchemy import or_
+from sqlmodel import select
 
 
 def build_vertex_in_params(params: Dict) -> Dict:
@@ -281,8 +287,10 @@ def instantiate_chains(node_type, class_object: Type[Chain], params: Dict, id_di
             if settings.get_from_db('file_access'):
                 # need to verify file access
                 access_url = settings.get_from_db('file_access') + f'?username={user_name}'
-                vectorstore = VectorStoreFilterRetriever(vectorstore=params['retriever'],
-                                                         access_url=access_url)
+                vectorstore = VectorStoreFilterRetriever(
+                    vectorstore=params['retriever'],
+                    access_url=access_url,
+                    file_ids_getter=knowledge_file_ids_getter(params['retriever'], {}))
             else:
                 vectorstore = params['retriever'].as_retriever()
             params['retriever'] = vectorstore
@@ -435,16 +443,36 @@ def instantiate_vectorstore(class_object: Type[VectorStore], params: Dict):
         if settings.get_from_db('file_access'):
             # need to verify file access / 只针对知识库
             access_url = settings.get_from_db('file_access') + f'?username={user_name}'
-            vecstore = VectorStoreFilterRetriever(vectorstore=vecstore,
-                                                  search_type=search_type,
-                                                  search_kwargs=search_kwargs,
-                                                  access_url=access_url)
+            vecstore = VectorStoreFilterRetriever(
+                vectorstore=vecstore,
+                search_type=search_type,
+                search_kwargs=search_kwargs,
+                access_url=access_url,
+                file_ids_getter=knowledge_file_ids_getter(vecstore, search_kwargs))
         else:
             vecstore = vecstore.as_retriever(search_type=search_type, search_kwargs=search_kwargs)
 
     return vecstore
 
 
+def knowledge_file_ids_getter(vectorstore: VectorStore,
+                              search_kwargs: Dict) -> Optional[Callable[[], List[int]]]:
+    """ 检索的知识库包含的文件，用于把有权限的文件下推到检索条件中 """
+    if search_kwargs.get('partition_key'):
+        knowledge_ids = [int(search_kwargs['partition_key'])]
+    else:
+        name = getattr(vectorstore, 'collection_name', None) or getattr(vectorstore, 'index_name', None)
+        if not name:
+            return None
+        with session_getter() as session:
+            knowledge_ids = session.exec(
+                select(Knowledge.id).where(
+                    or_(Knowledge.collection_name == name, Knowledge.index_name == name))).all()
+    if not knowledge_ids:
+        return None
+    return partial(KnowledgeFileDao.get_file_ids, list(knowledge_ids))
+
+
 def instantiate_documentloader(class_object: Type[BaseLoader], params: Dict):
     if 'file_filter' in params:
         # file_filter will be a string but we need a function
@@ -256,6 +256,11 @@ def initial_elastic(class_object: Type[ElasticKeywordsSearch], params: dict, sea
     elif isinstance(params.get('ssl_verify'), str):
         params['ssl_verify'] = eval(params['ssl_verify'])
 
+    if not params.get('user_dicts') and settings.get_knowledge().get('vectorstores').get(
+            'ElasticKeywordsSearch'):
+        params['user_dicts'] = settings.get_knowledge().get('vectorstores').get(
+            'ElasticKeywordsSearch').get('user_dicts')
+
     collection_id = params.pop('collection_id', '')
     if collection_id:
         with session_getter() as session:
@@ -3,15 +3,22 @@ from pathlib import Path
 from typing import Optional
 
 from bisheng.api import router, router_rpc
+from bisheng.api.services.finetune import finetune_status_poller
+from bisheng.cache.redis import redis_async_client
+from bisheng.chat.affinity import session_affinity
+from bisheng.chat.keywords import keyword_extractor
 from bisheng.database.base import init_default_data
 from bisheng.interface.utils import setup_llm_caching
 from bisheng.services.utils import initialize_services, teardown_services
+from bisheng.settings import settings
+from bisheng.utils import metrics
 from bisheng.utils.http_middleware import CustomMiddleware
 from bisheng.utils.logger import configure
+from bisheng_langchain.utils import tracing, transport
 from fastapi import FastAPI, HTTPException, Request, status
 from fastapi.exceptions import RequestValidationError
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import FileResponse, JSONResponse, ORJSONResponse
+from fastapi.responses import FileResponse, JSONResponse, ORJSONResponse, PlainTextResponse
 from fastapi.staticfiles import StaticFiles
 from fastapi_jwt_auth import AuthJWT
 from fastapi_jwt_auth.exceptions import AuthJWTException
@@ -38,9 +45,20 @@ async def lifespan(app: FastAPI):
     initialize_services()
     setup_llm_caching()
     init_default_data()
+    finetune_status_poller.start()
+    session_affinity.start()
+    keyword_extractor.start()
+    if (settings.get_from_db('tracing') or {}).get('opentelemetry'):
+        tracing.enable_opentelemetry()
     # LangfuseInstance.update()
     yield
+    session_affinity.drain()
+    keyword_extractor.stop()
+    finetune_status_poller.stop()
     teardown_services()
+    await redis_async_client.close()
+    await transport.close_session()
+    transport.close_sync_session()
 
 
 def create_app():
@@ -60,6 +78,12 @@ def create_app():
     def get_health():
         return {'status': 'OK'}
 
+    tracing.add_span_processor(metrics.on_span)
+
+    @app.get('/metrics', response_class=PlainTextResponse)
+    def get_metrics():
+        return PlainTextResponse(metrics.render_metrics(), media_type='text/plain; version=0.0.4')
+
     app.add_middleware(
         CORSMiddleware,
         allow_origins=origins,
@@ -3,6 +3,7 @@ from typing import Tuple, Union
 
 from bisheng.api.v1.callback import AsyncStreamingLLMCallbackHandler, StreamingLLMCallbackHandler
 from bisheng.processing.process import fix_memory_inputs, format_actions
+from bisheng.settings import settings
 from bisheng.utils.logger import logger
 
 
@@ -25,8 +26,13 @@ async def get_result_and_steps(langchain_object, inputs: Union[dict, str], **kwa
 
         asyc = True
         try:
-            async_callbacks = [AsyncStreamingLLMCallbackHandler(**kwargs)]
-            output = await langchain_object.acall(inputs, callbacks=async_callbacks)
+            coalesce = await settings.aget_from_db('stream_coalesce')
+            async_callbacks = [AsyncStreamingLLMCallbackHandler(coalesce=coalesce, **kwargs)]
+            try:
+                output = await langchain_object.acall(inputs, callbacks=async_callbacks)
+            finally:
+                # 发出还在合并中的token
+                await async_callbacks[0].flush_tokens()
         except Exception as exc:
             # make the error message more informative
             logger.exception(exc)
@@ -1,4 +1,4 @@
-from bisheng.cache.redis import redis_client
+from bisheng.cache.redis import redis_async_client, redis_client
 from bisheng.interface.run import build_sorted_vertices
 from bisheng.services.base import Service
 from bisheng.services.session.utils import compute_dict_hash, session_id_generator
@@ -12,11 +12,13 @@ class SessionService(Service):
 
     def __init__(self):
         self.cache_service = redis_client
+        self.async_cache_service = redis_async_client
 
     async def load_session(self, key, data_graph):
         # Check if the data is cached
-        if key in self.cache_service:
-            return self.cache_service.get(key)
+        if key is not None:
+            if session := await self.async_cache_service.get(key):
+                return session
 
         if key is None:
             key = self.generate_key(session_id=None, data_graph=data_graph)
@@ -24,7 +26,7 @@ class SessionService(Service):
         # If not cached, build the graph and cache it
         graph, artifacts = await build_sorted_vertices(data_graph)
 
-        self.cache_service.set(key, (graph, artifacts))
+        await self.async_cache_service.set(key, (graph, artifacts))
 
         return graph, artifacts
 
@@ -1,3 +1,4 @@
+import asyncio
 import os
 from typing import Dict, Optional, Union
 
@@ -141,6 +142,26 @@ class Settings(BaseSettings):
             else:
                 return {}
 
+    async def aget_knowledge(self):
+        """ get_knowledge的异步版本 """
+        return await self.aget_from_db('knowledges')
+
+    async def aget_from_db(self, key: str):
+        """ get_from_db的异步版本，缓存命中时不阻塞事件循环 """
+        return (await self.aget_configs(key))[0]
+
+    async def aget_configs(self, *keys: str) -> list:
+        """ 一次MGET读取多个配置，缓存未命中的配置再从db读取 """
+        from bisheng.cache.redis import redis_async_client
+        caches = await redis_async_client.mget(['config_' + key for key in keys])
+        result = []
+        for key, cache in zip(keys, caches):
+            if cache:
+                result.append(yaml.safe_load(cache))
+            else:
+                result.append(await asyncio.to_thread(self.get_from_db, key))
+        return result
+
     def update_from_yaml(self, file_path: str, dev: bool = False):
         new_settings = load_settings_from_yaml(file_path)
         self.chains = new_settings.chains or {}
@@ -2,6 +2,7 @@
 from time import time
 from uuid import uuid4
 
+from bisheng_langchain.utils import tracing
 from fastapi import Request
 from loguru import logger
 from starlette.middleware.base import BaseHTTPMiddleware, RequestResponseEndpoint
@@ -15,7 +16,9 @@ class CustomMiddleware(BaseHTTPMiddleware):
         trace_id = str(uuid4().hex)
         start_time = time()
         with logger.contextualize(trace_id=trace_id):
-            response = await call_next(request)
+            with tracing.span('http.request', trace_id=trace_id, path=request.url.path) as span:
+                response = await call_next(request)
             process_time = round(time() - start_time, 2)
-            logger.info(f'{request.url.path} {response.status_code} timecost={process_time}')
+            logger.info(f'{request.url.path} {response.status_code} timecost={process_time} '
+                        f'stages={span.stage_summary()}')
             return response
@@ -0,0 +1,81 @@
+"""
+/metrics 接口使用的 Prometheus 直方图
+由 tracing 的 span processor 写入，各阶段(span名称)的耗时、大模型首token耗时和生成速度
+"""
+import bisect
+import threading
+from typing import Dict, List, Sequence, Tuple
+
+from bisheng_langchain.utils.tracing import Span
+
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+TOKENS_PER_SECOND_BUCKETS = (1, 5, 10, 20, 30, 50, 75, 100, 200)
+
+
+class Histogram:
+    """ 线程安全的直方图，按 label 值分组 """
+
+    def __init__(self, name: str, doc: str, labels: Sequence[str], buckets: Sequence[float]):
+        self.name = name
+        self.doc = doc
+        self.labels = tuple(labels)
+        self.buckets = tuple(buckets)
+        # label值 -> (各桶计数, 总和, 总数)
+        self._series: Dict[Tuple[str, ...], Tuple[List[int], float, int]] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, *label_values: str):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            counts, total, count = self._series.get(label_values) or ([0] * len(self.buckets), 0.0, 0)
+            if index < len(counts):
+                counts[index] += 1
+            self._series[label_values] = (counts, total + value, count + 1)
+
+    def render(self) -> List[str]:
+        lines = [f'# HELP {self.name} {self.doc}', f'# TYPE {self.name} histogram']
+        with self._lock:
+            series = sorted((k, (list(v[0]), v[1], v[2])) for k, v in self._series.items())
+        for label_values, (counts, total, count) in series:
+            labels = ','.join(f'{k}="{_escape(v)}"' for k, v in zip(self.labels, label_values))
+            prefix = f'{labels},' if labels else ''
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                lines.append(f'{self.name}_bucket{{{prefix}le="{bound}"}} {cumulative}')
+            lines.append(f'{self.name}_bucket{{{prefix}le="+Inf"}} {count}')
+            suffix = f'{{{labels}}}' if labels else ''
+            lines.append(f'{self.name}_sum{suffix} {total}')
+            lines.append(f'{self.name}_count{suffix} {count}')
+        return lines
+
+
+def _escape(value: str) -> str:
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+stage_duration = Histogram('bisheng_stage_duration_seconds', '各阶段耗时', ('stage', 'status'),
+                           DURATION_BUCKETS)
+llm_first_token = Histogram('bisheng_llm_first_token_seconds', '大模型流式输出首token耗时', ('model', ),
+                            DURATION_BUCKETS)
+llm_tokens_per_second = Histogram('bisheng_llm_tokens_per_second', '大模型流式输出速度', ('model', ),
+                                  TOKENS_PER_SECOND_BUCKETS)
+_histograms = (stage_duration, llm_first_token, llm_tokens_per_second)
+
+
+def on_span(span: Span):
+    """ tracing span processor """
+    stage_duration.observe(span.duration, span.name, 'error' if span.error else 'ok')
+    attributes = span.attributes
+    if 'first_token_seconds' in attributes:
+        model = str(attributes.get('model', ''))
+        llm_first_token.observe(attributes['first_token_seconds'], model)
+        if 'tokens_per_second' in attributes:
+            llm_tokens_per_second.observe(attributes['tokens_per_second'], model)
+
+
+def render_metrics() -> str:
+    lines = []
+    for histogram in _histograms:
+        lines.extend(histogram.render())
+    return '\n'.join(lines) + '\n'
@@ -105,6 +105,12 @@ class MinioClient():
                                          data=file,
                                          length=length, **kwargs)
 
-    def download_minio(self, object_name: str):
+    def object_size(self, object_name: str):
+        """ 返回对象的字节数，未配置minio时返回None """
         if self.minio_client:
-            return self.minio_client.get_object(bucket_name=bucket, object_name=object_name)
+            return self.minio_client.stat_object(bucket_name=bucket, object_name=object_name).size
+
+    def download_minio(self, object_name: str, offset: int = 0):
+        # offset 大于0时只下载该字节偏移之后的内容
+        if self.minio_client:
+            return self.minio_client.get_object(bucket_name=bucket, object_name=object_name, offset=offset)
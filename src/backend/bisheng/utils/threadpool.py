@@ -1,9 +1,11 @@
 import asyncio
 import concurrent.futures
+import contextvars
 import threading
 import time
 from typing import Dict, List, Set, Tuple
 
+from bisheng_langchain.utils import tracing
 from loguru import logger
 
 
@@ -24,23 +26,29 @@ class ThreadPoolManager:
                 self.future_dict[key] = []
             if key not in self.async_task:
                 self.async_task[key] = []
+            # 复制提交方的上下文，线程中的span和提交方属于同一个trace
+            ctx = contextvars.copy_context()
             if asyncio.coroutines.iscoroutinefunction(fn):
-                future = self.executor.submit(self.run_in_event_loop, fn, *args, **kwargs)
+                future = self.executor.submit(ctx.run, self.run_in_event_loop, fn, *args, **kwargs)
                 self.async_task[key].append(future)
             else:
-                future = self.executor.submit(self.context_wrapper, fn, *args, **kwargs)
+                future = self.executor.submit(ctx.run, self.context_wrapper, time.time(), fn, *args,
+                                              **kwargs)
                 self.future_dict[key].append(future)
             return future
 
-    def context_wrapper(self, func, *args, **kwargs):
+    def context_wrapper(self, submit_time, func, *args, **kwargs):
         trace_id = kwargs.pop('trace_id', '2')
-        start_wait = time.time()
+        start_time = time.time()  # Time when the task actually started
         with logger.contextualize(trace_id=trace_id):
-            result = func(*args, **kwargs)
-            end_wait = time.time()  # Time when the task actually started
+            tracing.observe('thread_pool.wait', start_time - submit_time, pool=self.thread_group)
+            with tracing.span('thread_pool.execute', trace_id=trace_id, pool=self.thread_group) as span:
+                result = func(*args, **kwargs)
+            # 作为根span时输出各阶段耗时
+            stages = span.stage_summary() if span.root is span else ''
             logger.info(
-                f'Task_waited={end_wait - start_wait:.2f} seconds and executed={time.time() - end_wait:.2f} seconds',
-            )
+                f'Task_waited={start_time - submit_time:.2f} seconds and '
+                f'executed={time.time() - start_time:.2f} seconds {stages}', )
             return result
 
     def run_in_event_loop(self, coro, *args, **kwargs):
@@ -31,6 +31,36 @@ def build_vertex(self, vertex: 'Vertex') -> 'Vertex':
         raise self.retry(exc=SoftTimeLimitExceeded('Task took too long'), countdown=2) from e
 
 
+@celery_app.task(bind=True, acks_late=True, max_retries=None)
+def file_embedding_task(self, file_id: int, file_path: str, params: Dict[str, Any], attempt: int = 0):
+    """
+    知识库单个文件入库，由入库队列的 worker 执行:
+    celery -A bisheng.worker worker -Q knowledge_ingest
+    """
+    from bisheng.api.v1.knowledge import RETRYABLE_INGEST_ERRORS, ingest_conf, ingest_file, ingest_rate_wait
+
+    conf = ingest_conf()
+    wait = ingest_rate_wait(params['model'], conf)
+    if wait:
+        # 限流等待不计入重试次数
+        raise self.retry(countdown=wait)
+    max_retries = int(conf.get('max_retries', 3))
+    try:
+        ingest_file(file_id, file_path, final=attempt >= max_retries, **params)
+    except RETRYABLE_INGEST_ERRORS as e:
+        countdown = min(10 * 2**attempt, 300)
+        logger.warning(f'file_embedding_retry file_id={file_id} attempt={attempt + 1} '
+                       f'countdown={countdown} error={e}')
+        raise self.retry(exc=e,
+                         countdown=countdown,
+                         kwargs={
+                             'file_id': file_id,
+                             'file_path': file_path,
+                             'params': params,
+                             'attempt': attempt + 1
+                         })
+
+
 @celery_app.task(acks_late=True)
 def process_graph_cached_task(
     data_graph: Dict[str, Any],
@@ -0,0 +1,140 @@
+"""
+压测使用的本地服务替身，接口与 bisheng-rt 一致:
+GET  /v2/models/{model}/config              模型配置, 大模型为 decoupled 模式
+POST /v2.1/models/{model}/infer             embedding (HostEmbeddings)
+POST /v2.1/models/{model}/generate_stream   大模型, stream=true 时按 tokens/s 输出 SSE
+
+单独启动: python -m test.loadtest.fake_services --port 18001 --first-token 0.2 --tokens-per-second 50
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import time
+from collections import Counter
+
+import numpy as np
+from aiohttp import web
+
+EMBEDDING_MODEL = 'bench-embedding'
+LLM_MODEL = 'bench-llm'
+_WORDS = ['毕昇', '知识库', '技能', '检索', '问答', '模型', '服务', '文档', '数据', '结果']
+
+
+class FakeServiceConfig:
+
+    def __init__(self,
+                 embedding_dim: int = 768,
+                 embedding_latency: float = 0.01,
+                 first_token: float = 0.2,
+                 tokens_per_second: float = 50,
+                 answer_tokens: int = 64):
+        self.embedding_dim = embedding_dim
+        # 每次 embedding 请求的固定耗时, 另外每条文本增加 1ms
+        self.embedding_latency = embedding_latency
+        self.first_token = first_token
+        self.tokens_per_second = tokens_per_second
+        self.answer_tokens = answer_tokens
+
+
+def fake_vector(text: str, dim: int) -> np.ndarray:
+    """ 同一文本得到相同的归一化向量 """
+    seed = int(hashlib.sha1(text.encode('utf-8')).hexdigest()[:8], 16)
+    vector = np.random.default_rng(seed).standard_normal(dim).astype(np.float32)
+    return vector / np.linalg.norm(vector)
+
+
+def _answer(n: int):
+    return [_WORDS[i % len(_WORDS)] for i in range(n)]
+
+
+def create_app(conf: FakeServiceConfig) -> web.Application:
+    stats = Counter()
+
+    async def model_config(request: web.Request):
+        return web.json_response({'model_transaction_policy': {'decoupled': True}})
+
+    async def embed(texts):
+        await asyncio.sleep(conf.embedding_latency + 0.001 * len(texts))
+        stats['embedding_requests'] += 1
+        stats['embedding_texts'] += len(texts)
+        return [fake_vector(text, conf.embedding_dim).tolist() for text in texts]
+
+    async def chat(request: web.Request, body: dict):
+        stats['llm_requests'] += 1
+        tokens = _answer(conf.answer_tokens)
+        interval = 1 / conf.tokens_per_second if conf.tokens_per_second > 0 else 0
+        if not body.get('stream'):
+            await asyncio.sleep(conf.first_token + interval * len(tokens))
+            return web.json_response({
+                'model': body.get('model'),
+                'created': int(time.time()),
+                'choices': [{
+                    'index': 0,
+                    'message': {
+                        'role': 'assistant',
+                        'content': ''.join(tokens)
+                    },
+                    'finish_reason': 'stop'
+                }],
+                'usage': {}
+            })
+
+        response = web.StreamResponse(headers={'Content-Type': 'text/event-stream'})
+        await response.prepare(request)
+        await asyncio.sleep(conf.first_token)
+        for index, token in enumerate(tokens):
+            delta = {'content': token}
+            if index == 0:
+                delta['role'] = 'assistant'
+            chunk = {'choices': [{'index': 0, 'delta': delta, 'finish_reason': None}]}
+            await response.write(f'data: {json.dumps(chunk, ensure_ascii=False)}\n\n'.encode('utf-8'))
+            stats['llm_tokens'] += 1
+            if interval:
+                await asyncio.sleep(interval)
+        await response.write_eof()
+        return response
+
+    async def infer(request: web.Request):
+        body = await request.json()
+        if request.match_info['model'] == EMBEDDING_MODEL:
+            return web.json_response({'status_code': 200, 'embeddings': await embed(body.get('texts') or [])})
+        return await chat(request, body)
+
+    async def generate_stream(request: web.Request):
+        return await chat(request, await request.json())
+
+    async def get_stats(request: web.Request):
+        return web.json_response(dict(stats))
+
+    app = web.Application(client_max_size=64 * 1024 * 1024)
+    app['stats'] = stats
+    app.router.add_get('/v2/models/{model}/config', model_config)
+    app.router.add_post('/v2.1/models/{model}/infer', infer)
+    app.router.add_post('/v2.1/models/{model}/generate_stream', generate_stream)
+    app.router.add_get('/stats', get_stats)
+    return app
+
+
+async def start(conf: FakeServiceConfig, host: str, port: int) -> web.AppRunner:
+    """ 在当前事件循环中启动，返回的 runner 用于 cleanup """
+    runner = web.AppRunner(create_app(conf), access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    return runner
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=18001)
+    parser.add_argument('--embedding-dim', type=int, default=768)
+    parser.add_argument('--first-token', type=float, default=0.2)
+    parser.add_argument('--tokens-per-second', type=float, default=50)
+    parser.add_argument('--answer-tokens', type=int, default=64)
+    args = parser.parse_args()
+    config = FakeServiceConfig(embedding_dim=args.embedding_dim,
+                               first_token=args.first_token,
+                               tokens_per_second=args.tokens_per_second,
+                               answer_tokens=args.answer_tokens)
+    web.run_app(create_app(config), host=args.host, port=args.port, access_log=None)
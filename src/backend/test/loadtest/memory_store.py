@@ -0,0 +1,87 @@
+"""
+压测使用的进程内向量库，代替 Milvus 接收知识库入库的数据
+按 collection_name 保存在进程内，支持 add_texts(progress_callback) 和相似度检索
+"""
+import threading
+import uuid
+from typing import Any, Callable, ClassVar, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+from langchain.embeddings.base import Embeddings
+from langchain.schema import Document
+from langchain.vectorstores.base import VectorStore
+
+
+class MemoryVectorStore(VectorStore):
+
+    _collections: ClassVar[Dict[str, 'MemoryVectorStore']] = {}
+    _registry_lock: ClassVar[threading.Lock] = threading.Lock()
+
+    def __init__(self, embedding: Embeddings, collection_name: str, batch_size: int = 1000):
+        self.embedding_function = embedding
+        self.collection_name = collection_name
+        self.batch_size = batch_size
+        self.texts: List[str] = []
+        self.metadatas: List[dict] = []
+        self.vectors = np.empty((0, 0), dtype=np.float32)
+        self._lock = threading.Lock()
+
+    @classmethod
+    def get(cls, collection_name: str, embedding: Embeddings) -> 'MemoryVectorStore':
+        with cls._registry_lock:
+            store = cls._collections.get(collection_name)
+            if store is None:
+                store = cls._collections[collection_name] = cls(embedding, collection_name)
+            store.embedding_function = embedding
+            return store
+
+    @classmethod
+    def total(cls) -> int:
+        return sum(len(store.texts) for store in cls._collections.values())
+
+    @property
+    def embeddings(self) -> Embeddings:
+        return self.embedding_function
+
+    def add_texts(self,
+                  texts: Iterable[str],
+                  metadatas: Optional[List[dict]] = None,
+                  progress_callback: Optional[Callable[[int], None]] = None,
+                  **kwargs: Any) -> List[str]:
+        texts = list(texts)
+        metadatas = list(metadatas) if metadatas else [{} for _ in texts]
+        ids = [uuid.uuid4().hex for _ in texts]
+        for start in range(0, len(texts), self.batch_size):
+            batch = texts[start:start + self.batch_size]
+            vectors = np.asarray(self.embedding_function.embed_documents(batch), dtype=np.float32)
+            with self._lock:
+                self.vectors = vectors if not self.texts else np.vstack([self.vectors, vectors])
+                self.texts.extend(batch)
+                self.metadatas.extend(metadatas[start:start + self.batch_size])
+            if progress_callback:
+                progress_callback(start + len(batch))
+        return ids
+
+    def similarity_search_with_score(self, query: str, k: int = 4, **kwargs: Any) -> List[Tuple[Document, float]]:
+        with self._lock:
+            vectors, texts, metadatas = self.vectors, self.texts, self.metadatas
+        if not texts:
+            return []
+        query_vector = np.asarray(self.embedding_function.embed_query(query), dtype=np.float32)
+        scores = vectors @ query_vector
+        top = np.argsort(-scores)[:k]
+        return [(Document(page_content=texts[i], metadata=metadatas[i]), float(scores[i])) for i in top]
+
+    def similarity_search(self, query: str, k: int = 4, **kwargs: Any) -> List[Document]:
+        return [doc for doc, _ in self.similarity_search_with_score(query, k, **kwargs)]
+
+    @classmethod
+    def from_texts(cls,
+                   texts: List[str],
+                   embedding: Embeddings,
+                   metadatas: Optional[List[dict]] = None,
+                   collection_name: str = 'bench',
+                   **kwargs: Any) -> 'MemoryVectorStore':
+        store = cls.get(collection_name, embedding)
+        store.add_texts(texts, metadatas)
+        return store
@@ -0,0 +1,440 @@
+"""
+bisheng 离线端到端压测，不依赖 Milvus、ES、embedding 和大模型服务
+1. 启动本地服务替身(fake_services.py)，大模型按配置的首字延迟和 tokens/s 流式输出
+2. 以 sqlite 和本地 redis 启动 bisheng(server.py)，知识库写入进程内向量库
+3. 创建知识库和 HostQwenChat + ConversationChain 技能并上线
+4. 按比例和并发混合执行: 知识库文件上传入库(upload)、/process/{flow_id}(process)、websocket 对话(chat)
+5. 输出各场景的 p50/p99 延迟、吞吐、错误数以及服务进程的 RSS
+
+cd src/backend
+python -m test.loadtest.run_benchmark --concurrency 20 --duration 60 --mix process=6,chat=3,upload=1 \
+    --redis-url redis://127.0.0.1:6379/15 --output report.json --baseline baseline.json --tolerance 0.2
+注意: 启动前会清空 --redis-url 指定的 redis db
+指定 --baseline 时，p99 上升或吞吐下降超过 tolerance、错误率超过 --max-error-rate 时返回非0，用于 CI
+"""
+import argparse
+import asyncio
+import copy
+import json
+import math
+import os
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+from collections import Counter, defaultdict
+from typing import Dict, List
+
+import aiohttp
+
+from test.loadtest import fake_services
+from test.loadtest.server import ADMIN_PASSWORD, ADMIN_USER
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+SCENARIOS = ('process', 'chat', 'upload')
+_QUESTIONS = ['毕昇是什么', '如何创建知识库', '技能上线需要哪些步骤', '支持哪些文件格式', '怎样配置embedding模型']
+
+
+def percentile(values: List[float], q: float) -> float:
+    """ nearest-rank 分位数 """
+    if not values:
+        return 0
+    ordered = sorted(values)
+    index = max(math.ceil(q / 100 * len(ordered)) - 1, 0)
+    return ordered[min(index, len(ordered) - 1)]
+
+
+def read_rss(pid: int) -> int:
+    """ 进程的常驻内存(字节)，非 linux 返回0 """
+    try:
+        with open(f'/proc/{pid}/status', 'r') as f:
+            for line in f:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return 0
+
+
+class Recorder:
+
+    def __init__(self):
+        self.latencies: Dict[str, List[float]] = defaultdict(list)
+        self.first_token: List[float] = []
+        self.errors: Counter = Counter()
+        self.error_samples: Dict[str, str] = {}
+        self.rss: List[int] = []
+
+    def add(self, scenario: str, cost: float):
+        self.latencies[scenario].append(cost)
+
+    def error(self, scenario: str, err: Exception):
+        self.errors[scenario] += 1
+        self.error_samples.setdefault(scenario, repr(err)[:300])
+
+    async def sample_rss(self, pid: int, stop: asyncio.Event, interval: float = 0.5):
+        while not stop.is_set():
+            self.rss.append(read_rss(pid))
+            try:
+                await asyncio.wait_for(stop.wait(), interval)
+            except asyncio.TimeoutError:
+                pass
+
+    def report(self, duration: float) -> dict:
+        scenarios = {}
+        for scenario in sorted(set(self.latencies) | set(self.errors)):
+            values = self.latencies.get(scenario, [])
+            total = len(values) + self.errors[scenario]
+            scenarios[scenario] = {
+                'count': len(values),
+                'errors': self.errors[scenario],
+                'error_rate': self.errors[scenario] / total if total else 0,
+                'throughput': len(values) / duration if duration else 0,
+                'p50_ms': percentile(values, 50) * 1000,
+                'p99_ms': percentile(values, 99) * 1000,
+                'max_ms': max(values) * 1000 if values else 0,
+            }
+        if self.first_token:
+            scenarios['chat']['first_token_p50_ms'] = percentile(self.first_token, 50) * 1000
+            scenarios['chat']['first_token_p99_ms'] = percentile(self.first_token, 99) * 1000
+        rss = [value for value in self.rss if value]
+        return {
+            'duration': duration,
+            'scenarios': scenarios,
+            'server_rss_mb': {
+                'start': rss[0] / 2**20 if rss else 0,
+                'peak': max(rss) / 2**20 if rss else 0,
+                'end': rss[-1] / 2**20 if rss else 0,
+            },
+            'error_samples': self.error_samples,
+        }
+
+
+class BenchClient:
+
+    def __init__(self, base_url: str, session: aiohttp.ClientSession, timeout: float):
+        self.base_url = base_url
+        self.session = session
+        self.timeout = aiohttp.ClientTimeout(total=timeout)
+        self.token = ''
+        self.flow_id = ''
+        self.knowledge_id = 0
+
+    @property
+    def headers(self) -> dict:
+        return {'Authorization': f'Bearer {self.token}'}
+
+    async def request(self, method: str, path: str, **kwargs):
+        async with self.session.request(method,
+                                        f'{self.base_url}{path}',
+                                        headers=self.headers,
+                                        timeout=self.timeout,
+                                        **kwargs) as resp:
+            text = await resp.text()
+        if resp.status != 200 and resp.status != 201:
+            raise RuntimeError(f'{method} {path} http={resp.status} {text[:300]}')
+        body = json.loads(text)
+        # 业务错误也以 http 200 返回
+        if body.get('status_code') not in (200, 201, None):
+            raise RuntimeError(f"{method} {path} status={body.get('status_code')} {body.get('status_message')}")
+        return body.get('data')
+
+    async def login(self):
+        data = await self.request('POST',
+                                  '/api/v1/user/login',
+                                  json={
+                                      'user_name': ADMIN_USER,
+                                      'password': ADMIN_PASSWORD
+                                  })
+        self.token = data['access_token']
+
+    async def setup(self, fake_url: str):
+        await self.login()
+        types = await self.request('GET', '/api/v1/all')
+        name = f'bench_{uuid.uuid4().hex[:8]}'
+        flow = await self.request('POST',
+                                  '/api/v1/flows/',
+                                  json={
+                                      'name': name,
+                                      'data': build_flow_data(types, fake_url)
+                                  })
+        self.flow_id = flow['id']
+        # 上线后 websocket 才能以 chat_id 对话
+        await self.request('PATCH', f'/api/v1/flows/{self.flow_id}', json={'status': 2})
+        knowledge = await self.request('POST',
+                                       '/api/v1/knowledge/create',
+                                       json={
+                                           'name': name,
+                                           'model': fake_services.EMBEDDING_MODEL
+                                       })
+        self.knowledge_id = knowledge['id']
+
+    async def process(self):
+        await self.request('POST',
+                           f'/api/v1/process/{self.flow_id}',
+                           json={'inputs': {
+                               'input': random.choice(_QUESTIONS)
+                           }})
+
+    async def chat(self, recorder: Recorder):
+        url = f"{self.base_url.replace('http', 'ws', 1)}/api/v1/chat/{self.flow_id}"
+        chat_id = uuid.uuid4().hex
+        start = time.perf_counter()
+        params = {'t': self.token, 'chat_id': chat_id}
+        async with self.session.ws_connect(url, params=params) as ws:
+            await ws.send_json({
+                'flow_id': self.flow_id,
+                'chat_id': chat_id,
+                'inputs': {
+                    'input': random.choice(_QUESTIONS)
+                }
+            })
+            first_token = None
+            while True:
+                msg = await ws.receive(timeout=self.timeout.total)
+                if msg.type != aiohttp.WSMsgType.TEXT:
+                    raise RuntimeError(f'websocket closed type={msg.type} data={msg.data} extra={msg.extra}')
+                resp = json.loads(msg.data)
+                if resp.get('category') == 'error':
+                    raise RuntimeError(f"chat error {resp.get('intermediate_steps')}")
+                if resp.get('type') == 'stream' and first_token is None:
+                    first_token = time.perf_counter() - start
+                if resp.get('type') == 'close' and resp.get('category') != 'system':
+                    break
+        if first_token is not None:
+            recorder.first_token.append(first_token)
+
+    async def upload(self, paragraphs: int, poll_interval: float = 0.2):
+        """ 上传文件、入库，直到文件状态不再是处理中 """
+        file_name = f'bench_{uuid.uuid4().hex}.txt'
+        content = '\n\n'.join(f'{random.choice(_QUESTIONS)} {uuid.uuid4().hex} ' * 20 for _ in range(paragraphs))
+        form = aiohttp.FormData()
+        form.add_field('file', content.encode('utf-8'), filename=file_name, content_type='text/plain')
+        uploaded = await self.request('POST', '/api/v1/knowledge/upload', data=form)
+        files = await self.request('POST',
+                                   '/api/v1/knowledge/process',
+                                   json={
+                                       'knowledge_id': self.knowledge_id,
+                                       'file_path': [uploaded['file_path']],
+                                       'auto': True
+                                   })
+        file_id = files[0]['id']
+        deadline = time.monotonic() + self.timeout.total
+        while time.monotonic() < deadline:
+            await asyncio.sleep(poll_interval)
+            data = await self.request('GET',
+                                      f'/api/v1/knowledge/file_list/{self.knowledge_id}',
+                                      params={'file_name': file_name})
+            status = next((f['status'] for f in data['data'] if f['id'] == file_id), None)
+            if status == 2:
+                return
+            if status != 1:
+                raise RuntimeError(f'file ingest failed file_id={file_id} status={status}')
+        raise TimeoutError(f'file ingest timeout file_id={file_id}')
+
+
+def build_flow_data(types: dict, fake_url: str) -> dict:
+    """ 使用 /api/v1/all 返回的组件模板构建 HostQwenChat -> ConversationChain 技能 """
+    llm = copy.deepcopy(types['llms']['HostQwenChat'])
+    chain = copy.deepcopy(types['chains']['ConversationChain'])
+    llm_id, chain_id = 'HostQwenChat-bench', 'ConversationChain-bench'
+    values = {
+        'host_base_url': f'{fake_url}/v2.1/models',
+        'model_name': fake_services.LLM_MODEL,
+        'model': fake_services.LLM_MODEL,
+        'streaming': True,
+    }
+    for key, value in values.items():
+        if key in llm['template']:
+            llm['template'][key]['value'] = value
+    return {
+        'nodes': [{
+            'id': llm_id,
+            'type': 'genericNode',
+            'position': {'x': 0, 'y': 0},
+            'data': {'id': llm_id, 'type': 'HostQwenChat', 'node': llm}
+        }, {
+            'id': chain_id,
+            'type': 'genericNode',
+            'position': {'x': 400, 'y': 0},
+            'data': {'id': chain_id, 'type': 'ConversationChain', 'node': chain}
+        }],
+        'edges': [{
+            'id': f'reactflow__edge-{llm_id}-{chain_id}',
+            'source': llm_id,
+            'target': chain_id,
+            'sourceHandle': '|'.join(['HostQwenChat', llm_id] + llm['base_classes']),
+            'targetHandle': f'BaseLanguageModel|llm|{chain_id}',
+        }],
+        'viewport': {'x': 0, 'y': 0, 'zoom': 1},
+    }
+
+
+def parse_mix(mix: str) -> Dict[str, float]:
+    weights = {}
+    for item in mix.split(','):
+        name, _, weight = item.partition('=')
+        if name.strip() not in SCENARIOS:
+            raise ValueError(f'unknown scenario {name}, choose from {SCENARIOS}')
+        weights[name.strip()] = float(weight or 1)
+    return weights
+
+
+async def wait_ready(base_url: str, server: subprocess.Popen, timeout: float = 120):
+    deadline = time.monotonic() + timeout
+    async with aiohttp.ClientSession() as session:
+        while time.monotonic() < deadline:
+            if server.poll() is not None:
+                raise RuntimeError(f'bisheng server exited code={server.returncode}')
+            try:
+                async with session.get(f'{base_url}/health', timeout=aiohttp.ClientTimeout(total=2)) as resp:
+                    if resp.status == 200:
+                        return
+            except aiohttp.ClientError:
+                pass
+            await asyncio.sleep(0.5)
+    raise TimeoutError('bisheng server not ready')
+
+
+async def run_load(client: BenchClient, recorder: Recorder, weights: Dict[str, float], args) -> float:
+    names, values = list(weights), list(weights.values())
+    deadline = time.monotonic() + args.duration
+    remaining = [args.requests] if args.requests else None
+
+    async def worker():
+        while time.monotonic() < deadline:
+            if remaining is not None:
+                if remaining[0] <= 0:
+                    return
+                remaining[0] -= 1
+            scenario = random.choices(names, values)[0]
+            start = time.perf_counter()
+            try:
+                if scenario == 'process':
+                    await client.process()
+                elif scenario == 'chat':
+                    await client.chat(recorder)
+                else:
+                    await client.upload(args.upload_paragraphs)
+                recorder.add(scenario, time.perf_counter() - start)
+            except Exception as e:
+                recorder.error(scenario, e)
+
+    start = time.perf_counter()
+    await asyncio.gather(*[worker() for _ in range(args.concurrency)])
+    return time.perf_counter() - start
+
+
+def compare(report: dict, baseline: dict, tolerance: float, max_error_rate: float) -> List[str]:
+    """ 返回相对 baseline 的退化项 """
+    regressions = []
+    for scenario, stats in report['scenarios'].items():
+        if stats['error_rate'] > max_error_rate:
+            regressions.append(f"{scenario} error_rate={stats['error_rate']:.3f} > {max_error_rate}")
+        base = baseline.get('scenarios', {}).get(scenario)
+        if not base:
+            continue
+        if base['p99_ms'] and stats['p99_ms'] > base['p99_ms'] * (1 + tolerance):
+            regressions.append(f"{scenario} p99 {base['p99_ms']:.0f}ms -> {stats['p99_ms']:.0f}ms")
+        if base['throughput'] and stats['throughput'] < base['throughput'] * (1 - tolerance):
+            regressions.append(f"{scenario} throughput {base['throughput']:.2f}/s -> {stats['throughput']:.2f}/s")
+    base_rss = baseline.get('server_rss_mb', {}).get('peak')
+    if base_rss and report['server_rss_mb']['peak'] > base_rss * (1 + tolerance):
+        regressions.append(f"server rss peak {base_rss:.0f}MB -> {report['server_rss_mb']['peak']:.0f}MB")
+    return regressions
+
+
+def print_report(report: dict):
+    print(f"duration={report['duration']:.1f}s server_rss_mb={report['server_rss_mb']}")
+    for scenario, stats in report['scenarios'].items():
+        line = (f"{scenario:8s} count={stats['count']} errors={stats['errors']} "
+                f"throughput={stats['throughput']:.2f}/s p50={stats['p50_ms']:.0f}ms p99={stats['p99_ms']:.0f}ms")
+        if 'first_token_p50_ms' in stats:
+            line += f" first_token_p50={stats['first_token_p50_ms']:.0f}ms p99={stats['first_token_p99_ms']:.0f}ms"
+        print(line)
+    for scenario, sample in report['error_samples'].items():
+        print(f'{scenario} error sample: {sample}')
+
+
+async def main(args) -> int:
+    import redis
+
+    # 每次压测从空的 redis db 开始，避免上次的配置和缓存影响结果
+    redis.Redis.from_url(args.redis_url).flushdb()
+    workdir = args.workdir or tempfile.mkdtemp(prefix='bisheng_bench_')
+    fake_url = f'http://127.0.0.1:{args.fake_port}'
+    base_url = f'http://127.0.0.1:{args.port}'
+    conf = fake_services.FakeServiceConfig(embedding_dim=args.embedding_dim,
+                                           first_token=args.first_token,
+                                           tokens_per_second=args.tokens_per_second,
+                                           answer_tokens=args.answer_tokens)
+    runner = await fake_services.start(conf, '127.0.0.1', args.fake_port)
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, [BACKEND_DIR, os.environ.get('PYTHONPATH')])))
+    command = [
+        sys.executable, '-m', 'test.loadtest.server', '--workdir', workdir, '--redis-url', args.redis_url,
+        '--fake-url', fake_url, '--port',
+        str(args.port)
+    ]
+    server = subprocess.Popen(command, cwd=workdir, env=env)
+    recorder = Recorder()
+    stop = asyncio.Event()
+    try:
+        await wait_ready(base_url, server)
+        connector = aiohttp.TCPConnector(limit=args.concurrency * 2)
+        async with aiohttp.ClientSession(connector=connector) as session:
+            client = BenchClient(base_url, session, args.timeout)
+            await client.setup(fake_url)
+            sampler = asyncio.create_task(recorder.sample_rss(server.pid, stop))
+            duration = await run_load(client, recorder, parse_mix(args.mix), args)
+            stop.set()
+            await sampler
+        report = recorder.report(duration)
+        report['fake_services'] = dict(runner.app['stats'])
+        report['args'] = vars(args)
+    finally:
+        server.terminate()
+        try:
+            server.wait(timeout=30)
+        except subprocess.TimeoutExpired:
+            server.kill()
+        await runner.cleanup()
+        if not args.workdir:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    print_report(report)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+    if args.baseline:
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            regressions = compare(report, json.load(f), args.tolerance, args.max_error_rate)
+        for item in regressions:
+            print(f'REGRESSION {item}')
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='bisheng offline load test')
+    parser.add_argument('--concurrency', type=int, default=10)
+    parser.add_argument('--duration', type=float, default=30, help='seconds')
+    parser.add_argument('--requests', type=int, default=0, help='stop after n requests, 0 means only duration')
+    parser.add_argument('--mix', default='process=6,chat=3,upload=1')
+    parser.add_argument('--timeout', type=float, default=120)
+    parser.add_argument('--upload-paragraphs', type=int, default=50)
+    parser.add_argument('--redis-url', default='redis://127.0.0.1:6379/15')
+    parser.add_argument('--port', type=int, default=17860)
+    parser.add_argument('--fake-port', type=int, default=18001)
+    parser.add_argument('--workdir', default='', help='keep sqlite db and logs in this directory')
+    parser.add_argument('--embedding-dim', type=int, default=768)
+    parser.add_argument('--first-token', type=float, default=0.2)
+    parser.add_argument('--tokens-per-second', type=float, default=50)
+    parser.add_argument('--answer-tokens', type=int, default=64)
+    parser.add_argument('--output', default='')
+    parser.add_argument('--baseline', default='')
+    parser.add_argument('--tolerance', type=float, default=0.2)
+    parser.add_argument('--max-error-rate', type=float, default=0.01)
+    sys.exit(asyncio.run(main(parser.parse_args())))
@@ -0,0 +1,110 @@
+"""
+压测用的 bisheng 服务进程
+使用 sqlite 和本地 redis 启动 bisheng.main.create_app，知识库的 Milvus 替换为进程内向量库(memory_store.py)，
+不使用 ES 和 minio，embedding 和大模型指向本地服务替身(fake_services.py)。
+由 run_benchmark.py 启动，单独运行时需要先启动 fake_services:
+PYTHONPATH=src/backend python -m test.loadtest.server --workdir /tmp/bisheng_bench \
+    --redis-url redis://127.0.0.1:6379/15 --fake-url http://127.0.0.1:18001 --port 17860
+"""
+import argparse
+import os
+
+import yaml
+
+from test.loadtest.fake_services import EMBEDDING_MODEL
+
+ADMIN_USER = 'admin'
+ADMIN_PASSWORD = 'bisheng_bench'
+
+
+def write_config(workdir: str, redis_url: str) -> str:
+    config = {
+        'database_url': f"sqlite:///{os.path.join(workdir, 'bisheng_bench.db')}",
+        'redis_url': redis_url,
+        'environment': {
+            'env': 'dev',
+            'uns_support': ['txt', 'md', 'html', 'pdf', 'docx']
+        },
+        'admin': {
+            'user_name': ADMIN_USER,
+            'password': ADMIN_PASSWORD
+        },
+    }
+    config_path = os.path.join(workdir, 'config.yaml')
+    with open(config_path, 'w', encoding='utf-8') as f:
+        yaml.safe_dump(config, f, allow_unicode=True)
+    return config_path
+
+
+def prepare_knowledge_config(fake_url: str):
+    """ 初始化数据库，知识库配置指向服务替身 """
+    from bisheng.cache.redis import redis_client
+    from bisheng.database.base import init_default_data, session_getter
+    from bisheng.database.models.config import Config
+    from sqlmodel import select
+
+    init_default_data()
+    with session_getter() as session:
+        config = session.exec(select(Config).where(Config.key == 'knowledges')).first()
+        knowledges = (yaml.safe_load(config.value) if config else None) or {}
+        knowledges.update({
+            'unstructured_api_url': '',
+            'embeddings': {
+                EMBEDDING_MODEL: {
+                    'host_base_url': f'{fake_url}/v2.1/models',
+                    'model': EMBEDDING_MODEL
+                }
+            },
+            'minio': {},
+            'celery_ingestion': {
+                'enable': False
+            },
+        })
+        if config is None:
+            config = Config(key='knowledges')
+        config.value = yaml.safe_dump(knowledges, allow_unicode=True)
+        session.add(config)
+        session.commit()
+    redis_client.delete('config_knowledges')
+
+
+def patch_vectorstores():
+    """ Milvus 替换为进程内向量库，不使用 ES """
+    from bisheng.api.v1 import knowledge
+
+    from test.loadtest.memory_store import MemoryVectorStore
+
+    def decide_vectorstores(collection_name: str, vector_store: str, embedding):
+        if vector_store == 'Milvus':
+            return MemoryVectorStore.get(collection_name, embedding)
+        return None
+
+    knowledge.decide_vectorstores = decide_vectorstores
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--workdir', required=True)
+    parser.add_argument('--redis-url', default='redis://127.0.0.1:6379/15')
+    parser.add_argument('--fake-url', required=True)
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=17860)
+    parser.add_argument('--log-level', default='WARNING')
+    args = parser.parse_args()
+
+    os.makedirs(args.workdir, exist_ok=True)
+    # bisheng.settings 在导入时读取配置文件
+    os.environ['config'] = write_config(args.workdir, args.redis_url)
+
+    import uvicorn
+    from bisheng.main import create_app
+    from bisheng.utils.logger import configure
+
+    configure(log_level=args.log_level, log_file=os.path.join(args.workdir, 'data', 'bisheng.log'))
+    prepare_knowledge_config(args.fake_url)
+    patch_vectorstores()
+    uvicorn.run(create_app(), host=args.host, port=args.port, log_level='warning', access_log=False)
+
+
+if __name__ == '__main__':
+    main()
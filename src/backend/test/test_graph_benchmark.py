@@ -0,0 +1,201 @@
+"""
+技能 Graph 构建耗时评测
+
+PYTHONPATH=src/backend python src/backend/test/test_graph_benchmark.py [节点数] [分组数] [每组节点数]
+构造包含分组(group)子流程的大型技能，对比 逐条扫描全部边(原方式) 与 邻接表索引 下的
+Graph 构建(process_flow、_build_vertex_params)、拓扑排序和邻接查询耗时，并检查两种方式的结果一致。
+"""
+import random
+import sys
+import time
+from unittest import mock
+
+from bisheng.graph import utils as graph_utils
+from bisheng.graph.graph.base import Graph
+
+NODE_TYPE = 'BenchNode'
+IO_TYPE = 'BenchInput'
+
+
+def _input_field(**extra):
+    return {
+        'type': IO_TYPE,
+        'required': False,
+        'list': True,
+        'show': True,
+        'advanced': False,
+        'name': 'inputs',
+        **extra
+    }
+
+
+def make_node(node_id: str, template_extra: dict = None, flow: dict = None) -> dict:
+    node = {
+        'base_classes': [IO_TYPE],
+        'template': {
+            '_type': NODE_TYPE,
+            'inputs': _input_field(**(template_extra or {}))
+        },
+    }
+    if flow:
+        node['flow'] = flow
+    return {'id': node_id, 'data': {'id': node_id, 'type': NODE_TYPE, 'node': node}}
+
+
+def make_edge(source: str, target: str, proxy: dict = None) -> dict:
+    target_handle = {'fieldName': 'inputs', 'id': target, 'inputTypes': None, 'type': IO_TYPE}
+    if proxy:
+        target_handle['proxy'] = proxy
+    return {
+        'id': f'{source}-{target}',
+        'source': source,
+        'target': target,
+        'data': {
+            'sourceHandle': {
+                'baseClasses': [IO_TYPE],
+                'dataType': NODE_TYPE,
+                'id': source
+            },
+            'targetHandle': target_handle,
+        }
+    }
+
+
+def make_group(group_id: str, size: int) -> dict:
+    """ 分组节点，内部为 size 个节点的链路，外部的输入代理到第一个节点 """
+    inner_ids = [f'{group_id}-inner{i}' for i in range(size)]
+    inner_nodes = [make_node(inner_id) for inner_id in inner_ids]
+    inner_edges = [make_edge(inner_ids[i], inner_ids[i + 1]) for i in range(size - 1)]
+    proxy = {'field': 'inputs', 'id': inner_ids[0]}
+    group = make_node(group_id, template_extra={'proxy': proxy},
+                      flow={'data': {
+                          'nodes': inner_nodes,
+                          'edges': inner_edges
+                      }})
+    # 分组节点的 template 只包含代理的字段
+    group['data']['node']['template'].pop('_type')
+    return group
+
+
+def build_flow(nodes: int, groups: int, group_size: int, seed: int = 0) -> dict:
+    """ 随机DAG: 每个节点连接1~3个在它之前的节点，保证每个节点都有边 """
+    rng = random.Random(seed)
+    group_ids = set(rng.sample(range(1, nodes), min(groups, nodes - 1)))
+    flow_nodes, flow_edges = [], []
+    proxies = {}
+    for i in range(nodes):
+        node_id = f'node{i}'
+        if i in group_ids:
+            group = make_group(node_id, group_size)
+            proxies[node_id] = group['data']['node']['template']['inputs']['proxy']
+            flow_nodes.append(group)
+        else:
+            flow_nodes.append(make_node(node_id))
+        if i == 0:
+            continue
+        for j in sorted(rng.sample(range(i), min(i, rng.randint(1, 3)))):
+            flow_edges.append(make_edge(f'node{j}', node_id, proxies.get(node_id)))
+    return {'nodes': flow_nodes, 'edges': flow_edges}
+
+
+def legacy_raw_topological_sort(nodes, edges):
+    state = {node['id']: 0 for node in nodes}
+    nodes_dict = {node['id']: node for node in nodes}
+    sorted_vertices = []
+
+    def dfs(node):
+        if state[node] == 1:
+            raise ValueError('Graph contains a cycle, cannot perform topological sort')
+        if state[node] == 0:
+            state[node] = 1
+            for edge in edges:
+                if edge['source'] == node:
+                    dfs(edge['target'])
+            state[node] = 2
+            sorted_vertices.append(node)
+
+    for node in nodes:
+        if state[node['id']] == 0:
+            dfs(node['id'])
+    return [nodes_dict[node_id] for node_id in reversed(sorted_vertices)]
+
+
+def legacy_get_vertex_edges(self, vertex_id):
+    return [edge for edge in self.edges if edge.source_id == vertex_id or edge.target_id == vertex_id]
+
+
+def legacy_get_vertex_neighbors(self, vertex):
+    neighbors = {}
+    for edge in self.edges:
+        if edge.source_id == vertex.id:
+            neighbor = self.get_vertex(edge.target_id)
+        elif edge.target_id == vertex.id:
+            neighbor = self.get_vertex(edge.source_id)
+        else:
+            continue
+        neighbors[neighbor] = neighbors.get(neighbor, 0) + 1
+    return neighbors
+
+
+def legacy_topological_sort(self):
+    state = {node: 0 for node in self.vertices}
+    sorted_vertices = []
+
+    def dfs(node):
+        if state[node] == 1:
+            raise ValueError('Graph contains a cycle, cannot perform topological sort')
+        if state[node] == 0:
+            state[node] = 1
+            for edge in node.edges:
+                if edge.source_id == node.id:
+                    dfs(self.get_vertex(edge.target_id))
+            state[node] = 2
+            sorted_vertices.append(node)
+
+    for node in self.vertices:
+        if state[node] == 0:
+            dfs(node)
+    return list(reversed(sorted_vertices))
+
+
+def run(flow: dict, rounds: int):
+    start = time.perf_counter()
+    graph = Graph(flow['nodes'], flow['edges'])
+    build_cost = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for _ in range(rounds):
+        order = graph.topological_sort()
+    sort_cost = (time.perf_counter() - start) / rounds
+
+    start = time.perf_counter()
+    neighbors = [graph.get_vertex_neighbors(vertex) for vertex in graph.vertices]
+    neighbor_cost = time.perf_counter() - start
+    return graph, build_cost, sort_cost, neighbor_cost, [v.id for v in order], neighbors
+
+
+def main(nodes: int, groups: int, group_size: int, rounds: int = 10):
+    flow = build_flow(nodes, groups, group_size)
+    sys.setrecursionlimit(max(sys.getrecursionlimit(), 10 * (nodes + groups * group_size)))
+
+    with mock.patch.object(graph_utils, 'raw_topological_sort', legacy_raw_topological_sort), \
+            mock.patch.object(Graph, 'get_vertex_edges', legacy_get_vertex_edges), \
+            mock.patch.object(Graph, 'get_vertex_neighbors', legacy_get_vertex_neighbors), \
+            mock.patch.object(Graph, 'topological_sort', legacy_topological_sort):
+        legacy = run(flow, rounds)
+    indexed = run(flow, rounds)
+
+    graph = indexed[0]
+    print(f'vertices={len(graph.vertices)} edges={len(graph.edges)}')
+    for name, result in (('legacy', legacy), ('indexed', indexed)):
+        print(f'{name}: build={result[1]:.3f}s topological_sort={result[2] * 1000:.2f}ms '
+              f'neighbors={result[3] * 1000:.2f}ms')
+    assert legacy[4] == indexed[4], 'topological order differs'
+    assert [{v.id: c for v, c in n.items()} for n in legacy[5]] == \
+        [{v.id: c for v, c in n.items()} for n in indexed[5]], 'neighbors differ'
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 300,
+         int(sys.argv[2]) if len(sys.argv) > 2 else 20,
+         int(sys.argv[3]) if len(sys.argv) > 3 else 10)
@@ -0,0 +1,76 @@
+"""
+对比同步RedisClient和RedisAsyncClient在热点接口上的单次请求redis耗时
+
+python test/test_redis_async.py [并发数] [请求数]
+需要配置文件中的redis可用。模拟三类访问:
+  ws_auth: 读取编译状态和技能数据(同步版本为 exists + 2次hget, 异步版本为1次hmget)
+  config:  读取3个配置key(同步版本为3次get, 异步版本为1次mget)
+  session: 读取会话缓存(同步版本为 exists + get, 异步版本为1次get)
+同步版本在事件循环内直接调用，会阻塞其他并发请求，总耗时体现了这一点。
+"""
+import asyncio
+import json
+import sys
+import time
+
+from bisheng.cache.redis import redis_async_client, redis_client
+
+FLOW_KEY = 'flow_data_bench'
+CONFIG_KEYS = ['config_bench_a', 'config_bench_b', 'config_bench_c']
+SESSION_KEY = 'session_bench'
+
+
+def prepare():
+    redis_client.hset(FLOW_KEY, {'status': 'SUCCESS', 'graph_data': json.dumps({'nodes': [], 'edges': []})}, 60)
+    for key in CONFIG_KEYS:
+        redis_client.set(key, 'enabled: true', 60)
+    redis_client.set(SESSION_KEY, ({'graph': 1}, {'artifacts': 1}), 60)
+
+
+async def sync_request():
+    if redis_client.exists(FLOW_KEY):
+        redis_client.hget(FLOW_KEY, 'status')
+        json.loads(redis_client.hget(FLOW_KEY, 'graph_data'))
+    [redis_client.get(key) for key in CONFIG_KEYS]
+    if SESSION_KEY in redis_client:
+        redis_client.get(SESSION_KEY)
+
+
+async def async_request():
+    _, graph_data = await redis_async_client.hmget(FLOW_KEY, ['status', 'graph_data'])
+    json.loads(graph_data)
+    await redis_async_client.mget(CONFIG_KEYS)
+    await redis_async_client.get(SESSION_KEY)
+
+
+async def bench(name, request, concurrency, total):
+    costs = []
+
+    async def one():
+        start = time.perf_counter()
+        await request()
+        costs.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    for _ in range(total // concurrency):
+        await asyncio.gather(*[one() for _ in range(concurrency)])
+    elapse = time.perf_counter() - start
+    costs.sort()
+    print(f'{name}: requests={len(costs)} total={elapse:.3f}s qps={len(costs) / elapse:.1f} '
+          f'mean={sum(costs) / len(costs) * 1000:.3f}ms p50={costs[len(costs) // 2] * 1000:.3f}ms '
+          f'p99={costs[int(len(costs) * 0.99)] * 1000:.3f}ms')
+
+
+async def main(concurrency, total):
+    prepare()
+    await bench('sync', sync_request, concurrency, total)
+    await bench('async', async_request, concurrency, total)
+    await redis_async_client.close()
+    redis_client.delete(FLOW_KEY)
+    redis_client.delete(SESSION_KEY)
+    for key in CONFIG_KEYS:
+        redis_client.delete(key)
+
+
+if __name__ == '__main__':
+    asyncio.run(main(int(sys.argv[1]) if len(sys.argv) > 1 else 10, int(sys.argv[2]) if len(sys.argv) > 2 else 1000))
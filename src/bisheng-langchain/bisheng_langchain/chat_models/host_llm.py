@@ -7,7 +7,10 @@ import sys
 from typing import TYPE_CHECKING, Any, Callable, Dict, List, Mapping, Optional, Tuple, Union
 
 import requests
+from bisheng_langchain.utils import tracing
+from bisheng_langchain.utils.model_config import model_config_registry
 from bisheng_langchain.utils.requests import Requests
+from bisheng_langchain.utils.sse import aiter_events
 from langchain.callbacks.manager import AsyncCallbackManagerForLLMRun, CallbackManagerForLLMRun
 from langchain.chat_models.base import BaseChatModel
 from langchain.schema import ChatGeneration, ChatResult
@@ -151,8 +154,8 @@ class BaseHostChatLLM(BaseChatModel):
         try:
             if cls != CustomLLMChat:
                 url = values['host_base_url'].rsplit('/', 2)[0]
-                config_ep = f'{url}/v2/models/{model}/config'
-                config = requests.get(url=config_ep, json={}, timeout=5).json()
+                # 模型配置进程内缓存，实例化时不再每次请求模型服务
+                config = model_config_registry.get(url, model)
                 policy = config.get('model_transaction_policy', {})
                 values['decoupled'] = policy.get('decoupled', False)
                 # Host class should set below code
@@ -261,7 +264,8 @@ class BaseHostChatLLM(BaseChatModel):
         '''用来处理同步请求'''
         message_dicts, params = self._create_message_dicts(messages, stop)
         params = {**params, **kwargs}
-        response = self.completion_with_retry(messages=message_dicts, **params)
+        with tracing.span('llm.generate', model=self.model_name, stream=False):
+            response = self.completion_with_retry(messages=message_dicts, **params)
         return self._create_chat_result(response)
 
     async def acompletion_with_retry(self, **kwargs: Any) -> Any:
@@ -274,34 +278,21 @@ class BaseHostChatLLM(BaseChatModel):
                 async with self.client.apost(url=self.host_base_url, json=kwargs) as response:
                     if response.status != 200:
                         raise ValueError(f'Error: {response.status} contet: {response.text}')
-                    async for txt in response.content.iter_any():
-                        if b'\n' in txt:
-                            for txt_ in txt.split(b'\n'):
-                                yield txt_.decode('utf-8').strip()
-                        else:
-                            yield txt.decode('utf-8').strip()
+                    async for event in aiter_events(response.content.iter_any()):
+                        yield event
             except requests.exceptions.Timeout as exc:
                 raise ValueError(f'timeout in host llm infer, url=[{self.host_base_url}]') from exc
             except Exception as e:
                 raise ValueError(f'exception in host llm infer: [{e}]') from e
 
-        async for response in _acompletion_with_retry(**kwargs):
-            is_error = False
-            if response:
-                if response.startswith('event:error'):
-                    is_error = True
-                elif response.startswith('data:'):
-                    text = response[len('data:'):].strip()
-                    if text.startswith('{'):
-                        yield (is_error, response[len('data:'):])
-                    else:
-                        logger.info('agenerate_no_json text=%s', text)
-                    if is_error:
-                        break
-                elif response.startswith('{'):
-                    yield (is_error, response)
-                else:
-                    continue
+        async for event in _acompletion_with_retry(**kwargs):
+            if event.is_error:
+                yield (True, event.text())
+                break
+            if event.is_json:
+                yield (False, event.json())
+            else:
+                logger.info('agenerate_no_json text=%s', event.text())
 
     async def _agenerate(
         self,
@@ -318,27 +309,29 @@ class BaseHostChatLLM(BaseChatModel):
             role = 'assistant'
             params['stream'] = True
             function_call: Optional[dict] = None
-            async for is_error, stream_resp in self.acompletion_with_retry(messages=message_dicts,
-                                                                           **params):
-                output = json.loads(stream_resp)
-                if is_error:
-                    logger.error(stream_resp)
-                    raise ValueError(stream_resp)
-
-                choices = output.get('choices')
-                if choices:
-                    for choice in choices:
-                        role = choice['delta'].get('role', role)
-                        token = choice['delta'].get('content', '')
-                        inner_completion += token or ''
-                        _function_call = choice['delta'].get('function_call')
-                        if run_manager:
-                            await run_manager.on_llm_new_token(token)
-                        if _function_call:
-                            if function_call is None:
-                                function_call = _function_call
-                            else:
-                                function_call['arguments'] += _function_call['arguments']
+            with tracing.span('llm.generate', model=self.model_name, stream=True) as llm_span:
+                async for is_error, output in self.acompletion_with_retry(messages=message_dicts,
+                                                                          **params):
+                    if is_error:
+                        logger.error(output)
+                        raise ValueError(output)
+
+                    choices = output.get('choices')
+                    if choices:
+                        for choice in choices:
+                            role = choice['delta'].get('role', role)
+                            token = choice['delta'].get('content', '')
+                            inner_completion += token or ''
+                            if token:
+                                llm_span.record_token()
+                            _function_call = choice['delta'].get('function_call')
+                            if run_manager:
+                                await run_manager.on_llm_new_token(token)
+                            if _function_call:
+                                if function_call is None:
+                                    function_call = _function_call
+                                else:
+                                    function_call['arguments'] += _function_call['arguments']
             message = _convert_dict_to_message({
                 'content': inner_completion,
                 'role': role,
@@ -347,13 +340,13 @@ class BaseHostChatLLM(BaseChatModel):
             return ChatResult(generations=[ChatGeneration(message=message)])
         else:
             params['stream'] = False
-            response = [
-                response
-                async for _, response in self.acompletion_with_retry(messages=message_dicts,
-                                                                     **params)
-            ]
-            response = json.loads(response[0])
-            return self._create_chat_result(response)
+            with tracing.span('llm.generate', model=self.model_name, stream=False):
+                response = [
+                    response
+                    async for _, response in self.acompletion_with_retry(messages=message_dicts,
+                                                                         **params)
+                ]
+            return self._create_chat_result(response[0])
 
     def _create_message_dicts(
             self, messages: List[BaseMessage],
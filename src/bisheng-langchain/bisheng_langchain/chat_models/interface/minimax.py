@@ -1,6 +1,7 @@
 import json
 
 import requests
+from bisheng_langchain.utils import transport
 
 from .types import ChatInput, ChatOutput, Choice, Message, Usage
 from .utils import get_ts
@@ -22,7 +23,7 @@ class ChatCompletion(object):
         delta_content = parsed_data['choices'][0]['delta']
         return delta_content
 
-    def __call__(self, inp: ChatInput, verbose=False):
+    def _build_payload(self, inp: ChatInput, verbose=False):
         messages = inp.messages
         model = inp.model
         top_p = 0.95 if inp.top_p is None else inp.top_p
@@ -72,20 +73,17 @@ class ChatCompletion(object):
 
         if verbose:
             print('payload', payload)
+        return payload
 
-        response = requests.post(self.endpoint,
-                                 headers=self.headers,
-                                 json=payload)
-
+    def _parse_response(self, model, status_code, text):
         req_type = 'chat.completion'
         status_message = 'success'
-        status_code = response.status_code
         created = get_ts()
         choices = []
         usage = Usage()
         if status_code == 200:
             try:
-                info = json.loads(response.text)
+                info = json.loads(text)
                 if info['base_resp']['status_code'] == 0:
                     created = info['created']
                     # reply = info['reply']
@@ -121,3 +119,18 @@ class ChatCompletion(object):
                           created=created,
                           choices=choices,
                           usage=usage)
+
+    def __call__(self, inp: ChatInput, verbose=False):
+        payload = self._build_payload(inp, verbose)
+        response = requests.post(self.endpoint,
+                                 headers=self.headers,
+                                 json=payload)
+        return self._parse_response(inp.model, response.status_code, response.text)
+
+    async def acall(self, inp: ChatInput, verbose=False, request_timeout=None):
+        payload = self._build_payload(inp, verbose)
+        status_code, text = await transport.apost(self.endpoint,
+                                                  request_timeout,
+                                                  headers=self.headers,
+                                                  json=payload)
+        return self._parse_response(inp.model, status_code, text)
@@ -1,24 +1,59 @@
 import json
+from functools import partial
 
 import requests
+from bisheng_langchain.utils import transport
+from bisheng_langchain.utils.credentials import cache_key, token_cache
+from bisheng_langchain.utils.sse import aiter_events
 
 from .types import ChatInput, ChatOutput, Choice, Message, Usage
 from .utils import get_ts
 
 
-def get_access_token(api_key, sec_key):
-    url = (f'https://aip.baidubce.com/oauth/2.0/token?'
-           f'grant_type=client_credentials'
-           f'&client_id={api_key}&client_secret={sec_key}')
+def _access_token_url(api_key, sec_key):
+    return (f'https://aip.baidubce.com/oauth/2.0/token?'
+            f'grant_type=client_credentials'
+            f'&client_id={api_key}&client_secret={sec_key}')
+
+
+_access_token_headers = {
+    'Content-Type': 'application/json',
+    'Accept': 'application/json'
+}
+
+
+# access token 失效或过期的错误码
+_token_error_codes = (110, 111)
 
+
+def _fetch_access_token(api_key, sec_key):
     payload = json.dumps('')
-    headers = {
-        'Content-Type': 'application/json',
-        'Accept': 'application/json'
-    }
+    response = requests.request('POST', _access_token_url(api_key, sec_key),
+                                headers=_access_token_headers, data=payload)
+    info = response.json()
+    return info.get('access_token'), info.get('expires_in')
+
+
+async def _afetch_access_token(api_key, sec_key):
+    _, text = await transport.apost(_access_token_url(api_key, sec_key),
+                                    headers=_access_token_headers, data=json.dumps(''))
+    info = json.loads(text)
+    return info.get('access_token'), info.get('expires_in')
+
+
+def get_access_token(api_key, sec_key):
+    """token 有效期为30天，进程内缓存并在过期前刷新"""
+    return token_cache.get(cache_key('wenxin', api_key, sec_key),
+                           partial(_fetch_access_token, api_key, sec_key))
+
+
+async def aget_access_token(api_key, sec_key):
+    return await token_cache.aget(cache_key('wenxin', api_key, sec_key),
+                                  partial(_afetch_access_token, api_key, sec_key))
 
-    response = requests.request('POST', url, headers=headers, data=payload)
-    return response.json().get('access_token')
+
+def invalidate_access_token(api_key, sec_key):
+    token_cache.invalidate(cache_key('wenxin', api_key, sec_key))
 
 
 class ChatCompletion(object):
@@ -38,9 +73,8 @@ class ChatCompletion(object):
         # self.endpoint = f"{self.ep_url}?access_token={token}"
         self.headers = {'Content-Type': 'application/json'}
 
-    def __call__(self, inp: ChatInput, verbose=False):
+    def _build_payload(self, inp: ChatInput, verbose=False):
         messages = inp.messages
-        model = inp.model
         top_p = 0.8 if inp.top_p is None else inp.top_p
         temperature = 0.95 if inp.temperature is None else inp.temperature
         stream = False if inp.stream is None else inp.stream
@@ -68,27 +102,30 @@ class ChatCompletion(object):
 
         if verbose:
             print('payload', payload)
+        return payload
 
-        token = get_access_token(self.api_key, self.sec_key)
+    def _endpoint(self, model, token):
         endpoint = f'{self.ep_url}?access_token={token}'
         if model == 'ernie-bot-turbo':
             endpoint = f'{self.ep_url_turbo}?access_token={token}'
         elif model == 'ernie-bot-4':
             endpoint = f'{self.ep_url_pro}?access_token={token}'
+        return endpoint
 
-        response = requests.post(endpoint, headers=self.headers, json=payload)
-
+    def _parse_response(self, model, status_code, text):
         req_type = 'chat.completion'
         status_message = 'success'
-        status_code = response.status_code
         created = get_ts()
         choices = []
         usage = Usage()
         if status_code == 200:
             try:
-                info = json.loads(response.text)
+                info = json.loads(text)
                 status_code = info.get('error_code', 200)
                 status_message = info.get('error_msg', status_message)
+                if status_code in _token_error_codes:
+                    # 缓存的token失效，下次重试时重新获取
+                    invalidate_access_token(self.api_key, self.sec_key)
                 if status_code == 200:
                     created = info['created']
                     result = info['result']
@@ -117,3 +154,41 @@ class ChatCompletion(object):
                           created=created,
                           choices=choices,
                           usage=usage)
+
+    def __call__(self, inp: ChatInput, verbose=False):
+        payload = self._build_payload(inp, verbose)
+        token = get_access_token(self.api_key, self.sec_key)
+        response = requests.post(self._endpoint(inp.model, token), headers=self.headers, json=payload)
+        return self._parse_response(inp.model, response.status_code, response.text)
+
+    async def acall(self, inp: ChatInput, verbose=False, request_timeout=None):
+        payload = self._build_payload(inp, verbose)
+        token = await aget_access_token(self.api_key, self.sec_key)
+        status_code, text = await transport.apost(self._endpoint(inp.model, token),
+                                                  request_timeout,
+                                                  headers=self.headers,
+                                                  json=payload)
+        return self._parse_response(inp.model, status_code, text)
+
+    async def astream(self, inp: ChatInput, verbose=False, request_timeout=None):
+        """流式请求，逐段返回(增量文本, usage)，usage只在最后一段中有值"""
+        payload = self._build_payload(inp, verbose)
+        payload['stream'] = True
+        token = await aget_access_token(self.api_key, self.sec_key)
+        async with transport.arequest('POST',
+                                      self._endpoint(inp.model, token),
+                                      request_timeout,
+                                      headers=self.headers,
+                                      json=payload) as response:
+            if response.status != 200:
+                raise Exception('requests error')
+            async for event in aiter_events(response.content.iter_any()):
+                if not event.is_json:
+                    continue
+                # 出错时直接返回json
+                info = event.json()
+                if info.get('error_code'):
+                    if info['error_code'] in _token_error_codes:
+                        invalidate_access_token(self.api_key, self.sec_key)
+                    raise Exception(info.get('error_msg', event.text()))
+                yield info.get('result', ''), info.get('usage') if info.get('is_end') else None
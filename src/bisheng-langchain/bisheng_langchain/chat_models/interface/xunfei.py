@@ -9,7 +9,9 @@ from time import mktime
 from urllib.parse import urlencode, urlparse
 from wsgiref.handlers import format_date_time
 
+import aiohttp
 import websocket
+from bisheng_langchain.utils import transport
 from websocket import create_connection
 
 import _thread as thread
@@ -153,7 +155,7 @@ class ChatCompletion(object):
         pass
         # self.ws.close()
 
-    def __call__(self, inp: ChatInput, verbose=False):
+    def _build_payload(self, inp: ChatInput, verbose=False):
         messages = inp.messages
         model = inp.model
         # top_p = 0.7 if inp.top_p is None else inp.top_p
@@ -177,7 +179,6 @@ class ChatCompletion(object):
         elif model == 'spark-v3.0':
             domain = 'generalv3'
 
-        created = get_ts()
         payload = {
             'header': self.header,
             'payload': {'message': {'text': new_messages}},
@@ -193,38 +194,62 @@ class ChatCompletion(object):
 
         if verbose:
             print('payload', payload)
+        return payload
+
+    def _create_url(self, model):
+        if model == 'spark-v2.0':
+            return self.wsParam2.create_url()
+        elif model == 'spark-v3.0':
+            return self.wsParam3.create_url()
+        return self.wsParam1.create_url()
+
+    @staticmethod
+    def _handle_message(resp, texts):
+        """处理一条返回消息，返回usage(最后一条消息时)"""
+        if resp['header']['code'] == 0:
+            texts.append(
+                resp['payload']['choices']['text'][0]['content'])
+        if resp['header']['code'] == 0 and resp['header']['status'] == 2:
+            usage_dict = resp['payload']['usage']['text']
+            usage_dict.pop('question_tokens')
+            return Usage(**usage_dict)
+        return None
+
+    @staticmethod
+    def _build_output(model, created, status_code, status_message, texts, usage):
+        choices = []
+        if texts:
+            finish_reason = 'default'
+            msg = Message(role='assistant', content=''.join(texts))
+            cho = Choice(index=0, message=msg,
+                         finish_reason=finish_reason)
+            choices.append(cho)
+
+        return ChatOutput(
+            status_code=status_code,
+            status_message=status_message,
+            model=model, object='chat.completion', created=created,
+            choices=choices, usage=usage)
+
+    def __call__(self, inp: ChatInput, verbose=False):
+        created = get_ts()
+        payload = self._build_payload(inp, verbose)
 
-        req_type = 'chat.completion'
         status_code = 200
         status_message = 'success'
-        choices = []
         usage = Usage()
         texts = []
         ws = None
         try:
             # self.mutex.acquire()
-            if model == 'spark-v2.0':
-                wsUrl = self.wsParam2.create_url()
-            elif model == 'spark-v3.0':
-                wsUrl = self.wsParam3.create_url()
-            else:
-                wsUrl = self.wsParam1.create_url()
-
-            ws = create_connection(wsUrl)
+            ws = create_connection(self._create_url(inp.model))
             ws.send(json.dumps(payload))
             texts = []
             while True:
                 raw_data = ws.recv()
                 if not raw_data:
                     break
-                resp = json.loads(raw_data)
-                if resp['header']['code'] == 0:
-                    texts.append(
-                        resp['payload']['choices']['text'][0]['content'])
-                if resp['header']['code'] == 0 and resp['header']['status'] == 2:
-                    usage_dict = resp['payload']['usage']['text']
-                    usage_dict.pop('question_tokens')
-                    usage = Usage(**usage_dict)
+                usage = self._handle_message(json.loads(raw_data), texts) or usage
         except Exception as e:
             print('exception', e)
             status_code = 401
@@ -234,15 +259,32 @@ class ChatCompletion(object):
                 ws.close()
             # self.mutex.release()
 
-        if texts:
-            finish_reason = 'default'
-            msg = Message(role='assistant', content=''.join(texts))
-            cho = Choice(index=0, message=msg,
-                         finish_reason=finish_reason)
-            choices.append(cho)
+        return self._build_output(inp.model, created, status_code, status_message, texts, usage)
 
-        return ChatOutput(
-            status_code=status_code,
-            status_message=status_message,
-            model=model, object=req_type, created=created,
-            choices=choices, usage=usage)
+    async def acall(self, inp: ChatInput, verbose=False, request_timeout=None):
+        created = get_ts()
+        payload = self._build_payload(inp, verbose)
+
+        status_code = 200
+        status_message = 'success'
+        usage = Usage()
+        texts = []
+        try:
+            async with transport.get_session().ws_connect(
+                    self._create_url(inp.model),
+                    receive_timeout=transport.make_timeout(request_timeout).total) as ws:
+                await ws.send_str(json.dumps(payload))
+                async for msg in ws:
+                    if msg.type != aiohttp.WSMsgType.TEXT:
+                        break
+                    resp = json.loads(msg.data)
+                    usage = self._handle_message(resp, texts) or usage
+                    # 服务端发完最后一条消息后关闭连接
+                    if resp['header']['code'] != 0 or resp['header']['status'] == 2:
+                        break
+        except Exception as e:
+            print('exception', e)
+            status_code = 401
+            status_message = str(e)
+
+        return self._build_output(inp.model, created, status_code, status_message, texts, usage)
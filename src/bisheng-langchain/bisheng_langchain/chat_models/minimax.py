@@ -195,6 +195,29 @@ class ChatMinimaxAI(BaseChatModel):
 
         return _completion_with_retry(**kwargs)
 
+    async def acompletion_with_retry(self, **kwargs: Any) -> Any:
+        """Use tenacity to retry the async completion call."""
+        retry_decorator = _create_retry_decorator(self)
+
+        @retry_decorator
+        async def _acompletion_with_retry(**kwargs: Any) -> Any:
+            messages = kwargs.get('messages')
+            temperature = kwargs.get('temperature')
+            top_p = kwargs.get('top_p')
+            max_tokens = kwargs.get('max_tokens')
+            params = {
+                'messages': messages,
+                'model': self.model_name,
+                'top_p': top_p,
+                'temperature': temperature,
+                'max_tokens': max_tokens
+            }
+            output = await self.client.acall(ChatInput.parse_obj(params), self.verbose,
+                                             self.request_timeout)
+            return output.dict()
+
+        return await _acompletion_with_retry(**kwargs)
+
     def _combine_llm_outputs(self, llm_outputs: List[Optional[dict]]) -> dict:
         overall_token_usage: dict = {}
         for output in llm_outputs:
@@ -231,7 +254,11 @@ class ChatMinimaxAI(BaseChatModel):
         run_manager: Optional[AsyncCallbackManagerForLLMRun] = None,
         **kwargs: Any,
     ) -> ChatResult:
-        return self._generate(messages, stop, run_manager, **kwargs)
+        message_dicts, params = self._create_message_dicts(messages, stop)
+        params = {**params, **kwargs}
+
+        response = await self.acompletion_with_retry(messages=message_dicts, **params)
+        return self._create_chat_result(response)
 
     def _create_message_dicts(
             self, messages: List[BaseMessage],
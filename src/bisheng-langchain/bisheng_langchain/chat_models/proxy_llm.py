@@ -1,12 +1,12 @@
 """proxy llm chat wrapper."""
 from __future__ import annotations
 
-import json
 import logging
 import sys
 from typing import TYPE_CHECKING, Any, Callable, Dict, List, Mapping, Optional, Tuple, Union
 
 from bisheng_langchain.utils import requests
+from bisheng_langchain.utils.sse import aiter_events
 from langchain.callbacks.manager import AsyncCallbackManagerForLLMRun, CallbackManagerForLLMRun
 from langchain.chat_models.base import BaseChatModel
 from langchain.schema import ChatGeneration, ChatResult
@@ -249,16 +249,12 @@ class ProxyChatLLM(BaseChatModel):
         async def _acompletion_with_retry(**kwargs: Any) -> Any:
             # Use OpenAI's async api https://github.com/openai/openai-python#async-api
             async with self.client.apost(url=self.elemai_base_url, json=kwargs) as response:
-                async for txt in response.content.iter_any():
-                    if b'\n' in txt:
-                        for txt_ in txt.split(b'\n'):
-                            yield txt_.decode('utf-8').strip()
-                    else:
-                        yield txt.decode('utf-8').strip()
+                async for event in aiter_events(response.content.iter_any()):
+                    yield event
 
-        async for response in _acompletion_with_retry(**kwargs):
-            if response:
-                yield json.loads(response)
+        async for event in _acompletion_with_retry(**kwargs):
+            if event.is_json:
+                yield event.json()
 
     async def _agenerate(
         self,
@@ -2,12 +2,12 @@
 from __future__ import annotations
 
 import copy
-import json
 import logging
 import sys
 from typing import TYPE_CHECKING, Any, Callable, Dict, List, Mapping, Optional, Tuple, Union
 
 from bisheng_langchain.utils.requests import Requests
+from bisheng_langchain.utils.sse import aiter_events
 # import requests
 from langchain.callbacks.manager import AsyncCallbackManagerForLLMRun, CallbackManagerForLLMRun
 from langchain.chat_models.base import BaseChatModel
@@ -216,26 +216,15 @@ class ChatQWen(BaseChatModel):
             inp = {'input': input, 'parameters': params, 'model': self.model_name}
             # Use OpenAI's async api https://github.com/openai/openai-python#async-api
             async with self.client.apost(url=url, json=inp) as response:
-                async for line in response.content.iter_any():
-                    if b'\n' in line:
-                        for txt_ in line.split(b'\n'):
-                            yield txt_.decode('utf-8').strip()
-                    else:
-                        yield line.decode('utf-8').strip()
-
-        async for response in _acompletion_with_retry(**kwargs):
-            is_error = False
-            if response:
-                if response.startswith('event:error'):
-                    is_error = True
-                elif response.startswith('data:'):
-                    yield (is_error, response[len('data:'):])
-                    if is_error:
-                        break
-                elif response.startswith('{'):
-                    yield (is_error, response)
-                else:
-                    continue
+                async for event in aiter_events(response.content.iter_any()):
+                    yield event
+
+        async for event in _acompletion_with_retry(**kwargs):
+            if event.is_error:
+                yield (True, event.text())
+                break
+            if event.is_json:
+                yield (False, event.json())
 
     def _combine_llm_outputs(self, llm_outputs: List[Optional[dict]]) -> dict:
         overall_token_usage: dict = {}
@@ -278,13 +267,12 @@ class ChatQWen(BaseChatModel):
             role = 'assistant'
             params['stream'] = True
             function_call: Optional[dict] = None
-            async for is_error, stream_resp in self.acompletion_with_retry(messages=message_dicts,
-                                                                           **params):
+            async for is_error, msg in self.acompletion_with_retry(messages=message_dicts,
+                                                                   **params):
                 output = None
-                msg = json.loads(stream_resp)
                 if is_error:
-                    logger.error(stream_resp)
-                    raise ValueError(stream_resp)
+                    logger.error(msg)
+                    raise ValueError(msg)
                 if 'output' in msg:
                     output = msg['output']
                 choices = output.get('choices')
@@ -313,7 +301,7 @@ class ChatQWen(BaseChatModel):
                 async for _, response in self.acompletion_with_retry(messages=message_dicts,
                                                                      **params)
             ]
-            response = json.loads(response[0])
+            response = response[0]
             return self._create_chat_result(response.get('output'), response.get('usage'))
 
     def _create_message_dicts(
@@ -6,7 +6,10 @@ import time
 from typing import Any, Dict, List, Mapping, Optional, Tuple, Union
 
 import jwt
+from bisheng_langchain.utils import transport
+from bisheng_langchain.utils.credentials import cache_key, token_cache
 from bisheng_langchain.utils.requests import Requests
+from bisheng_langchain.utils.sse import aiter_events
 from langchain.callbacks.manager import AsyncCallbackManagerForLLMRun, CallbackManagerForLLMRun
 from langchain.chat_models.base import BaseChatModel
 from langchain.schema import ChatGeneration, ChatResult
@@ -44,6 +47,18 @@ def encode_jwt_token(ak, sk):
     return token
 
 
+def get_jwt_token(ak, sk) -> str:
+    """进程内复用签名的token, 在过期前重新签发"""
+
+    def _encode():
+        token = encode_jwt_token(ak, sk)
+        if isinstance(token, bytes):
+            token = token.decode('utf-8')
+        return token, 18000
+
+    return token_cache.get(cache_key('sensetime', ak, sk), _encode)
+
+
 def _create_retry_decorator(llm):
 
     min_seconds = 1
@@ -217,9 +232,7 @@ class SenseChat(BaseChatModel):
                 'stream': False  # self.streaming
             }
 
-            token = encode_jwt_token(self.access_key_id, self.secret_access_key)
-            if isinstance(token, bytes):
-                token = token.decode('utf-8')
+            token = get_jwt_token(self.access_key_id, self.secret_access_key)
             self.client.headers.update({'Authorization': 'Bearer {}'.format(token)})
 
             response = self.client.post(url=url, json=params).json()
@@ -234,6 +247,37 @@ class SenseChat(BaseChatModel):
             # return rsp_dict['data'], rsp_dict.get('usage', '')
             return rsp_dict, rsp_dict.get('usage', '')
 
+    async def acompletion(self, **kwargs: Any) -> Any:
+        """Use tenacity to retry the async non-streaming completion call."""
+        retry_decorator = _create_retry_decorator(self)
+
+        @retry_decorator
+        async def _acompletion(**kwargs: Any) -> Any:
+            params = {
+                'messages': kwargs.get('messages'),
+                'model': self.model_name,
+                'top_p': kwargs.get('top_p'),
+                'temperature': kwargs.get('temperature'),
+                'repetition_penalty': self.repetition_penalty,
+                'n': self.n,
+                'max_new_tokens': self.max_tokens,
+                'stream': False
+            }
+
+            token = get_jwt_token(self.access_key_id, self.secret_access_key)
+            # 使用独立的header, 避免并发请求互相修改client.headers
+            headers = {k: v for k, v in self.client.headers.items() if k != 'Accept'}
+            headers['Authorization'] = 'Bearer {}'.format(token)
+            _, text = await transport.apost(url, self.request_timeout, headers=headers, json=params)
+            return json.loads(text)
+
+        rsp_dict = await _acompletion(**kwargs)
+        if 'error' in rsp_dict:
+            logger.error(f'sensechat_error resp={rsp_dict}')
+            message = rsp_dict['error']['message']
+            raise Exception(message)
+        return rsp_dict, rsp_dict.get('usage', '')
+
     async def acompletion_with_retry(self, **kwargs: Any) -> Any:
         """Use tenacity to retry the async completion call."""
         retry_decorator = _create_retry_decorator(self)
@@ -258,30 +302,20 @@ class SenseChat(BaseChatModel):
                 'stream': True
             }
 
+            token = get_jwt_token(self.access_key_id, self.secret_access_key)
+            self.client.headers.update({'Authorization': 'Bearer {}'.format(token)})
             # Use OpenAI's async api https://github.com/openai/openai-python#async-api
             async with self.client.apost(url=url, json=inp) as response:
 
-                async for line in response.content.iter_any():
-
-                    if b'\n' in line:
-                        for txt_ in line.split(b'\n'):
-                            yield txt_.decode('utf-8').strip()
-                    else:
-                        yield line.decode('utf-8').strip()
-
-        async for response in _acompletion_with_retry(**kwargs):
-            is_error = False
-            if response:
-                if response.startswith('event:error'):
-                    is_error = True
-                elif response.startswith('data:'):
-                    yield (is_error, response[len('data:'):])
-                    if is_error:
-                        break
-                elif response.startswith('{'):
-                    yield (is_error, response)
-                else:
-                    continue
+                async for event in aiter_events(response.content.iter_any()):
+                    yield event
+
+        async for event in _acompletion_with_retry(**kwargs):
+            if event.is_error:
+                yield (True, event.text())
+                break
+            if event.is_json:
+                yield (False, event.json())
 
     def _combine_llm_outputs(self, llm_outputs: List[Optional[dict]]) -> dict:
         overall_token_usage: dict = {}
@@ -326,14 +360,11 @@ class SenseChat(BaseChatModel):
             role = 'user'
             params['stream'] = True
             function_call: Optional[dict] = None
-            async for is_error, stream_resp in self.acompletion_with_retry(messages=message_dicts,
-                                                                           **params):
-                if str(stream_resp).startswith('[DONE]'):
-                    continue
-                output = json.loads(stream_resp)
+            async for is_error, output in self.acompletion_with_retry(messages=message_dicts,
+                                                                      **params):
                 if is_error:
-                    logger.error(stream_resp)
-                    raise ValueError(stream_resp)
+                    logger.error(output)
+                    raise ValueError(output)
                 if 'data' in output:
                     output = output['data']
 
@@ -361,7 +392,8 @@ class SenseChat(BaseChatModel):
             })
             return ChatResult(generations=[ChatGeneration(message=message)])
         else:
-            return self._generate(messages, stop, run_manager, **kwargs)
+            response, usage = await self.acompletion(messages=message_dicts, **params)
+            return self._create_chat_result(response)
 
     def _create_message_dicts(
             self, messages: List[BaseMessage],
@@ -191,6 +191,29 @@ class ChatWenxin(BaseChatModel):
 
         return _completion_with_retry(**kwargs)
 
+    async def acompletion_with_retry(self, **kwargs: Any) -> Any:
+        """Use tenacity to retry the async completion call."""
+        retry_decorator = _create_retry_decorator(self)
+
+        @retry_decorator
+        async def _acompletion_with_retry(**kwargs: Any) -> Any:
+            messages = kwargs.get('messages')
+            temperature = kwargs.get('temperature')
+            top_p = kwargs.get('top_p')
+            max_tokens = kwargs.get('max_tokens')
+            params = {
+                'messages': messages,
+                'model': self.model_name,
+                'top_p': top_p,
+                'temperature': temperature,
+                'max_tokens': max_tokens
+            }
+            output = await self.client.acall(ChatInput.parse_obj(params), self.verbose,
+                                             self.request_timeout)
+            return output.dict()
+
+        return await _acompletion_with_retry(**kwargs)
+
     def _combine_llm_outputs(self, llm_outputs: List[Optional[dict]]) -> dict:
         overall_token_usage: dict = {}
         for output in llm_outputs:
@@ -225,7 +248,30 @@ class ChatWenxin(BaseChatModel):
         run_manager: Optional[AsyncCallbackManagerForLLMRun] = None,
         **kwargs: Any,
     ) -> ChatResult:
-        return self._generate(messages, stop, run_manager, **kwargs)
+        message_dicts, params = self._create_message_dicts(messages, stop)
+        params = {**params, **kwargs}
+        if not self.streaming:
+            response = await self.acompletion_with_retry(messages=message_dicts, **params)
+            return self._create_chat_result(response)
+
+        inp = ChatInput.parse_obj({
+            'messages': message_dicts,
+            'model': self.model_name,
+            'top_p': params.get('top_p'),
+            'temperature': params.get('temperature'),
+            'max_tokens': params.get('max_tokens'),
+            'stream': True,
+        })
+        inner_completion = ''
+        token_usage = None
+        async for token, usage in self.client.astream(inp, self.verbose, self.request_timeout):
+            inner_completion += token
+            token_usage = usage or token_usage
+            if run_manager:
+                await run_manager.on_llm_new_token(token)
+        message = _convert_dict_to_message({'role': 'assistant', 'content': inner_completion})
+        llm_output = {'token_usage': token_usage or {}, 'model_name': self.model_name}
+        return ChatResult(generations=[ChatGeneration(message=message)], llm_output=llm_output)
 
     def _create_message_dicts(
             self, messages: List[BaseMessage],
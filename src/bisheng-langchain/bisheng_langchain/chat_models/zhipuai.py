@@ -5,6 +5,7 @@ import logging
 import sys
 from typing import TYPE_CHECKING, Any, Callable, Dict, List, Mapping, Optional, Tuple, Union
 
+from bisheng_langchain.utils import transport
 from langchain.callbacks.manager import AsyncCallbackManagerForLLMRun, CallbackManagerForLLMRun
 from langchain.chat_models.base import BaseChatModel
 from langchain.schema import ChatGeneration, ChatResult
@@ -203,6 +204,27 @@ class ChatZhipuAI(BaseChatModel):
 
         return _completion_with_retry(**kwargs)
 
+    async def acompletion_with_retry(self, **kwargs: Any) -> Any:
+        """Use tenacity to retry the async completion call."""
+        retry_decorator = _create_retry_decorator(self)
+
+        @retry_decorator
+        async def _acompletion_with_retry(**kwargs: Any) -> Any:
+            messages = kwargs.get('messages')
+            temperature = kwargs.get('temperature')
+            top_p = kwargs.get('top_p')
+            params = {
+                'prompt': messages,
+                'model': self.model_name,
+                'top_p': top_p,
+                'temperature': temperature,
+                'incremental': False
+            }
+            # zhipuai sdk只有同步接口，放到线程池中执行，不阻塞事件循环
+            return await transport.run_sync(self.client, **params)
+
+        return await _acompletion_with_retry(**kwargs)
+
     def _combine_llm_outputs(self, llm_outputs: List[Optional[dict]]) -> dict:
         overall_token_usage: dict = {}
         for output in llm_outputs:
@@ -237,7 +259,11 @@ class ChatZhipuAI(BaseChatModel):
         run_manager: Optional[AsyncCallbackManagerForLLMRun] = None,
         **kwargs: Any,
     ) -> ChatResult:
-        return self._generate(messages, stop, run_manager, **kwargs)
+        message_dicts, params = self._create_message_dicts(messages, stop)
+        params = {**params, **kwargs}
+
+        response = await self.acompletion_with_retry(messages=message_dicts, **params)
+        return self._create_chat_result(response)
 
     def _create_message_dicts(
             self, messages: List[BaseMessage],
@@ -6,12 +6,15 @@ import os
 import re
 import time
 from collections import Counter
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 from copy import deepcopy
-from typing import List, Optional, Union
+from functools import partial
+from typing import List, Optional, Tuple, Union
 
 import fitz
 import numpy as np
 from bisheng_langchain.document_loaders.parsers import LayoutParser
+from bisheng_langchain.document_loaders.parsers.pdf_pages import map_ordered
 from langchain.docstore.document import Document
 from langchain.document_loaders.blob_loaders import Blob
 from langchain.document_loaders.pdf import BasePDFLoader
@@ -21,6 +24,42 @@ from shapely import box as Rect
 RE_MULTISPACE_INCLUDING_NEWLINES = re.compile(pattern=r'\s+', flags=re.DOTALL)
 
 
+def render_page_png(fitz_doc, pdf_reader, pg) -> bytes:
+    page = fitz_doc.load_page(pg)
+    mat = fitz.Matrix(1, 1)
+    try:
+        pm = page.get_pixmap(matrix=mat, alpha=False)
+        return pm.getPNGData()
+    except Exception:
+        # some pdf input cannot get render image from fitz
+        if callable(pdf_reader):
+            pdf_reader = pdf_reader()
+        page = pdf_reader.get_page(pg)
+        pil_image = page.render().to_pil()
+        img_byte_arr = io.BytesIO()
+        pil_image.save(img_byte_arr, format='PNG')
+        return img_byte_arr.getvalue()
+
+
+# documents opened in the render worker process
+_worker_docs = {}
+
+
+def _render_page_png_worker(file_path: str, pg: int) -> Tuple[int, bytes]:
+    if _worker_docs.get('path') != file_path:
+        _worker_docs.clear()
+        _worker_docs['path'] = file_path
+        _worker_docs['fitz'] = fitz.open(file_path)
+
+    def pdfium_doc():
+        if 'pdfium' not in _worker_docs:
+            import pypdfium2
+            _worker_docs['pdfium'] = pypdfium2.PdfDocument(file_path, autoclose=True)
+        return _worker_docs['pdfium']
+
+    return pg, render_page_png(_worker_docs['fitz'], pdfium_doc, pg)
+
+
 def merge_rects(bboxes):
     x0 = np.min(bboxes[:, 0])
     y0 = np.min(bboxes[:, 1])
@@ -197,9 +236,19 @@ class PDFWithSemanticLoader(BasePDFLoader):
                  start: int = 0,
                  n: int = None,
                  html_output_file: str = None,
-                 verbose: bool = False) -> None:
-        """Initialize with a file path."""
-        self.layout_parser = LayoutParser(api_key=layout_api_key, api_base_url=layout_api_url)
+                 verbose: bool = False,
+                 max_concurrency: int = 4,
+                 render_workers: Optional[int] = None) -> None:
+        """Initialize with a file path.
+
+        max_concurrency: max in-flight layout requests.
+        render_workers: processes to render page images, 0 renders in current process.
+        """
+        self.layout_parser = LayoutParser(api_key=layout_api_key,
+                                          api_base_url=layout_api_url,
+                                          max_concurrency=max_concurrency)
+        self.max_concurrency = max(1, max_concurrency)
+        self.render_workers = min(4, os.cpu_count() or 1) if render_workers is None else render_workers
         self.with_columns = with_columns
         self.is_join_table = is_join_table
         self.support_rotate = support_rotate
@@ -216,24 +265,33 @@ class PDFWithSemanticLoader(BasePDFLoader):
         if not n:
             n = fitz_doc.page_count
         for pg in range(start, start + n):
-            bytes_img = None
-            page = fitz_doc.load_page(pg)
-            pages.append(page)
-            mat = fitz.Matrix(1, 1)
-            try:
-                pm = page.get_pixmap(matrix=mat, alpha=False)
-                bytes_img = pm.getPNGData()
-            except Exception:
-                # some pdf input cannot get render image from fitz
-                page = pdf_reader.get_page(pg)
-                pil_image = page.render().to_pil()
-                img_byte_arr = io.BytesIO()
-                pil_image.save(img_byte_arr, format='PNG')
-                bytes_img = img_byte_arr.getvalue()
-
-            blobs.append(Blob(data=bytes_img))
+            pages.append(fitz_doc.load_page(pg))
+            blobs.append(Blob(data=render_page_png(fitz_doc, pdf_reader, pg)))
         return blobs, pages
 
+    def _iter_page_images(self, file_path, fitz_doc, pdf_reader, start, n):
+        """Yield (page index, png bytes) in page order, rendered ahead in worker processes."""
+        workers = min(self.render_workers, n)
+        if workers <= 1:
+            for pg in range(start, start + n):
+                yield pg, render_page_png(fitz_doc, pdf_reader, pg)
+            return
+
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            yield from map_ordered(executor, partial(_render_page_png_worker, file_path), range(start, start + n),
+                                   self.max_concurrency + workers)
+
+    def _iter_page_layouts(self, file_path, fitz_doc, pdf_reader, start, n):
+        """Yield (page index, layout) in page order, layout requests are sent concurrently."""
+        images = self._iter_page_images(file_path, fitz_doc, pdf_reader, start, n)
+
+        def parse(item):
+            pg, bytes_img = item
+            return pg, self.layout_parser.parse(Blob(data=bytes_img))[0]
+
+        with ThreadPoolExecutor(max_workers=self.max_concurrency) as executor:
+            yield from map_ordered(executor, parse, images, self.max_concurrency)
+
     def _allocate_semantic(self, page, layout):
         class_name = ['印章', '图片', '标题', '段落', '表格', '页眉', '页码', '页脚']
         effective_class_inds = [3, 4, 5, 999]
@@ -604,10 +662,9 @@ class PDFWithSemanticLoader(BasePDFLoader):
             if self.verbose:
                 print(f'{n} pages need be processed...')
 
-            for idx in range(start, start + n):
-                blobs, pages = self._get_image_blobs(fitz_doc, pdf_doc, 1, idx)
-                layout = self.layout_parser.parse(blobs[0])[0]
-                blocks = self._allocate_semantic(pages[0], layout)
+            # rendering and layout requests run ahead, geometry is processed here in page order
+            for idx, layout in self._iter_page_layouts(self.file_path, fitz_doc, pdf_doc, start, n):
+                blocks = self._allocate_semantic(fitz_doc.load_page(idx), layout)
                 if not blocks: continue
 
                 if self.with_columns:
@@ -73,6 +73,8 @@ class ElemUnstructuredLoader(BasePDFLoader):
         self.start = start
         self.n = n
         self.extra_kwargs = kwargs
+        # status_code of the last partition response, 200 when parsing succeeded
+        self.status_code = None
         super().__init__(file_path)
 
     def load(self) -> List[Document]:
@@ -87,6 +89,7 @@ class ElemUnstructuredLoader(BasePDFLoader):
 
         resp = requests.post(self.unstructured_api_url, headers=self.headers, json=payload).json()
 
+        self.status_code = resp.get('status_code')
         if 200 != resp.get('status_code'):
             logger.info(f'not return resp={resp}')
         partitions = resp['partitions']
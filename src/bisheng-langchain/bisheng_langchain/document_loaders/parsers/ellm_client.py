@@ -2,14 +2,20 @@
 import copy
 import base64
 import requests
+from requests.adapters import HTTPAdapter
 from typing import Any, Iterator, List, Mapping, Optional, Union
 
 
 class ELLMClient(object):
     def __init__(self,
-                 api_base_url: Optional[str] = None):
+                 api_base_url: Optional[str] = None,
+                 max_concurrency: int = 4):
         self.ep = api_base_url
         self.client = requests.Session()
+        # keep enough connections for concurrent page requests
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max(1, max_concurrency))
+        self.client.mount('http://', adapter)
+        self.client.mount('https://', adapter)
         self.timeout = 10000
         self.params = {
             'sort_filter_boxes': True,
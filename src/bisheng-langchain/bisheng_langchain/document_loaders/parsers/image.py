@@ -4,6 +4,7 @@ import json
 from typing import List, Optional
 
 import requests
+from requests.adapters import HTTPAdapter
 from langchain.document_loaders.blob_loaders import Blob
 from langchain.schema import Document
 
@@ -14,15 +15,22 @@ class LayoutParser(object):
 
     def __init__(self,
                  api_key: Optional[str] = None,
-                 api_base_url: Optional[str] = None):
+                 api_base_url: Optional[str] = None,
+                 max_concurrency: int = 4):
         self.api_key = api_key
-        self.api_base_url = 'http://192.168.106.20:14569/predict'
+        self.api_base_url = api_base_url or 'http://192.168.106.20:14569/predict'
         self.class_name = ['印章', '图片', '标题', '段落', '表格', '页眉', '页码', '页脚']
+        self.max_concurrency = max(1, max_concurrency)
+        # pooled connections shared by concurrent page requests
+        self.client = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.max_concurrency)
+        self.client.mount('http://', adapter)
+        self.client.mount('https://', adapter)
 
     def parse(self, blob: Blob) -> List[Document]:
         b64_data = base64.b64encode(blob.as_bytes()).decode()
         data = {'img': b64_data}
-        resp = requests.post('http://192.168.106.20:14569/predict', data=data)
+        resp = self.client.post(self.api_base_url, data=data)
         content = resp.json()
         doc = Document(page_content=json.dumps(content), metadata={})
         return [doc]
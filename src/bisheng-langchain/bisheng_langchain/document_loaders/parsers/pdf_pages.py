@@ -0,0 +1,113 @@
+"""Page level pipeline for pdf: lazy rendering in worker processes and
+bounded concurrent requests, results are always returned in page order."""
+import base64
+import os
+from collections import deque
+from concurrent.futures import Executor, ProcessPoolExecutor
+from functools import partial
+from typing import Callable, Iterable, Iterator, Optional, Sequence, Tuple
+
+import cv2
+import fitz
+import numpy as np
+from PIL import Image
+
+DEFAULT_DPIS = (72, 144, 200)
+
+# document opened in current worker process, reused by the following pages
+_opened_doc = {}
+
+
+def _open_pdf(file_path: str) -> fitz.Document:
+    if _opened_doc.get('path') != file_path:
+        if _opened_doc.get('doc') is not None:
+            _opened_doc['doc'].close()
+        _opened_doc['doc'] = fitz.Document(file_path)
+        _opened_doc['path'] = file_path
+    return _opened_doc['doc']
+
+
+def pdf_page_count(file_path: str) -> int:
+    with fitz.Document(file_path) as pdf:
+        return pdf.page_count
+
+
+def choose_dpi(page: fitz.Page, min_side: int, dpis: Sequence[int] = DEFAULT_DPIS) -> int:
+    """Pick the first dpi whose rendered image has min side >= min_side,
+    the pixmap size is computed from the page rect instead of rendering."""
+    for dpi in dpis:
+        zoom = dpi / 72
+        irect = (page.rect * fitz.Matrix(zoom, zoom)).irect
+        if min(irect.width, irect.height) >= min_side:
+            return dpi
+    return dpis[-1]
+
+
+def render_page(page: fitz.Page, min_side: int, dpis: Sequence[int] = DEFAULT_DPIS) -> np.ndarray:
+    """Render one page to BGR(A) array, same as transpdf2png did for each page."""
+    pix = page.get_pixmap(dpi=choose_dpi(page, min_side, dpis))
+    mode = 'RGBA' if pix.alpha else 'RGB'
+    img = Image.frombytes(mode, [pix.width, pix.height], pix.samples)
+    # RGB to BGR
+    return np.array(img)[:, :, ::-1]
+
+
+def encode_base64(image: np.ndarray) -> str:
+    image_binary = cv2.imencode('.jpg', image)[1].tobytes()
+    return base64.b64encode(image_binary).decode('ascii').replace('\n', '')
+
+
+def render_page_base64(file_path: str,
+                       page_number: int,
+                       min_side: int = 1600,
+                       dpis: Sequence[int] = DEFAULT_DPIS) -> Tuple[int, str]:
+    """Worker entry: render a page and return jpeg base64, which is much
+    smaller than the raw array to send back to the parent process."""
+    pdf = _open_pdf(file_path)
+    return page_number, encode_base64(render_page(pdf[page_number], min_side, dpis))
+
+
+def map_ordered(executor: Executor, fn: Callable, items: Iterable, max_inflight: int) -> Iterator:
+    """Like executor.map, but items are consumed lazily and at most
+    max_inflight tasks are submitted and not yet consumed."""
+    max_inflight = max(1, max_inflight)
+    pending = deque()
+    try:
+        for item in items:
+            pending.append(executor.submit(fn, item))
+            if len(pending) >= max_inflight:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+    finally:
+        for future in pending:
+            future.cancel()
+
+
+def iter_pdf_pages(file_path: str,
+                   min_side: int = 1600,
+                   max_pages: Optional[int] = None,
+                   render_workers: Optional[int] = None,
+                   prefetch: Optional[int] = None,
+                   dpis: Sequence[int] = DEFAULT_DPIS) -> Iterator[Tuple[int, str]]:
+    """Yield (page_number, jpeg base64) in page order.
+
+    Pages are rendered in a process pool, at most `prefetch` pages are
+    rendered ahead of the consumer. render_workers=0 renders in current process.
+    """
+    page_count = pdf_page_count(file_path)
+    if max_pages is not None:
+        page_count = min(page_count, max_pages)
+    if render_workers is None:
+        render_workers = min(4, os.cpu_count() or 1)
+    render_workers = min(render_workers, page_count)
+
+    render = partial(render_page_base64, file_path, min_side=min_side, dpis=dpis)
+    if render_workers <= 1:
+        with fitz.Document(file_path) as pdf:
+            for page_number in range(page_count):
+                yield page_number, encode_base64(render_page(pdf[page_number], min_side, dpis))
+        return
+
+    with ProcessPoolExecutor(max_workers=render_workers) as executor:
+        yield from map_ordered(executor, render, range(page_count), prefetch or render_workers * 2)
@@ -4,13 +4,15 @@ import base64
 import json
 import os
 from collections import defaultdict
-from typing import List
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional
 
 import cv2
 import filetype
 import fitz
 import numpy as np
 from bisheng_langchain.document_loaders.parsers import ELLMClient
+from bisheng_langchain.document_loaders.parsers.pdf_pages import iter_pdf_pages, map_ordered
 from langchain.docstore.document import Document
 from langchain.document_loaders.base import BaseLoader
 from PIL import Image
@@ -52,14 +54,27 @@ class UniversalKVLoader(BaseLoader):
                  ellm_model_url: str = None,
                  schema='',
                  max_pages=30,
-                 verbose: bool = False) -> None:
-        """Initialize with a file path."""
+                 verbose: bool = False,
+                 max_concurrency: int = 4,
+                 render_workers: Optional[int] = None) -> None:
+        """Initialize with a file path.
+
+        max_concurrency: max in-flight page requests to the ellm service.
+        render_workers: processes to render pdf pages, 0 renders in current process.
+        """
         self.file_path = file_path
         self.schema = schema
         self.max_pages = max_pages
-        self.ellm_model = ELLMClient(ellm_model_url)
+        self.max_concurrency = max_concurrency
+        self.render_workers = render_workers
+        self.ellm_model = ELLMClient(ellm_model_url, max_concurrency=max_concurrency)
         super().__init__()
 
+    def _predict_page(self, page: tuple):
+        page_number, b64data = page
+        payload = {'b64_image': b64data, 'keys': self.schema}
+        return page_number, self.ellm_model.predict(payload)
+
     def load(self) -> List[Document]:
         """Load given path as pages."""
         mime_type = filetype.guess(self.file_path).mime
@@ -92,25 +107,24 @@ class UniversalKVLoader(BaseLoader):
             return [doc]
 
         elif file_type == 'pdf':
-            pdf_images = transpdf2png(self.file_path)
+            # page number starts from 0, pages 0..max_pages are extracted
+            pages = iter_pdf_pages(self.file_path,
+                                   min_side=1600,
+                                   max_pages=self.max_pages + 1,
+                                   render_workers=self.render_workers,
+                                   prefetch=self.max_concurrency * 2)
 
             kv_results = defaultdict(list)
-            for pdf_name in pdf_images:
-                page = int(pdf_name.split('page_')[-1])
-                if page > self.max_pages:
-                    continue
-
-                b64data = convert_base64(pdf_images[pdf_name])
-                payload = {'b64_image': b64data, 'keys': self.schema}
-                resp = self.ellm_model.predict(payload)
-
-                if 'code' in resp and resp['code'] == 200:
-                    key_values = resp['result']['ellm_result']
-                else:
-                    raise ValueError(f'universal kv load failed: {resp}')
-
-                for key, value in key_values.items():
-                    kv_results[key].extend(value['text'])
+            with ThreadPoolExecutor(max_workers=max(1, self.max_concurrency)) as executor:
+                # results come back in page order
+                for page, resp in map_ordered(executor, self._predict_page, pages, self.max_concurrency):
+                    if 'code' in resp and resp['code'] == 200:
+                        key_values = resp['result']['ellm_result']
+                    else:
+                        raise ValueError(f'universal kv load failed: page={page} {resp}')
+
+                    for key, value in key_values.items():
+                        kv_results[key].extend(value['text'])
 
             content = json.dumps(kv_results, indent=2, ensure_ascii=False)
             file_name = os.path.basename(self.file_path)
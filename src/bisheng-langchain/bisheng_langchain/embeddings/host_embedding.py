@@ -3,7 +3,10 @@ from __future__ import annotations
 import logging
 from typing import Any, Callable, Dict, List, Optional, Tuple, Union
 
+import numpy as np
 import requests
+from bisheng_langchain.utils import tracing
+from bisheng_langchain.utils.vectors import decode_embeddings
 from langchain.embeddings.base import Embeddings
 from langchain.utils import get_from_dict_or_env
 from langchain_core.pydantic_v1 import BaseModel, Extra, Field, root_validator
@@ -64,6 +67,11 @@ class HostEmbeddings(BaseModel, Embeddings):
 
     url_ep: Optional[str] = None
 
+    return_numpy: bool = False
+    """Return embeddings as a (n, dim) float32 numpy array instead of float lists."""
+    encoding_format: Optional[str] = None
+    """Set to base64 to ask the service for base64 encoded float32 vectors, only used with return_numpy."""
+
     class Config:
         """Configuration for this pydantic object."""
 
@@ -95,15 +103,18 @@ class HostEmbeddings(BaseModel, Embeddings):
         }
         return api_args
 
-    def embed(self, texts: List[str], **kwargs) -> List[List[float]]:
+    def embed(self, texts: List[str], **kwargs) -> Union[List[List[float]], np.ndarray]:
         emb_type = kwargs.get('type', 'raw')
         inp = {'texts': texts, 'model': self.model, 'type': emb_type}
+        if self.return_numpy and self.encoding_format:
+            inp['encoding_format'] = self.encoding_format
         if self.verbose:
             print('payload', inp)
 
         outp = None
         try:
-            outp = self.client(url=self.url_ep, json=inp, timeout=self.request_timeout).json()
+            with tracing.span('embedding.embed', model=self.model, count=len(texts)):
+                outp = self.client(url=self.url_ep, json=inp, timeout=self.request_timeout).json()
         except requests.exceptions.Timeout:
             raise Exception(f'timeout in host embedding infer, url=[{self.url_ep}]')
         except Exception as e:
@@ -111,11 +122,14 @@ class HostEmbeddings(BaseModel, Embeddings):
 
         if outp['status_code'] != 200:
             raise ValueError(f"API returned an error: {outp['status_message']}")
+        if self.return_numpy:
+            # 不支持 encoding_format 的服务仍返回列表，同样转为 float32 数组
+            return decode_embeddings(outp['embeddings'])
         return outp['embeddings']
 
     def embed_documents(self,
                         texts: List[str],
-                        chunk_size: Optional[int] = 0) -> List[List[float]]:
+                        chunk_size: Optional[int] = 0) -> Union[List[List[float]], np.ndarray]:
         if not texts:
             return []
         """Embed search docs."""
@@ -123,7 +137,7 @@ class HostEmbeddings(BaseModel, Embeddings):
         embeddings = embed_with_retry(self, texts=texts, type='doc')
         return embeddings
 
-    def embed_query(self, text: str) -> List[float]:
+    def embed_query(self, text: str) -> Union[List[float], np.ndarray]:
         embeddings = embed_with_retry(self, texts=[text], type='query')
         return embeddings[0]
 
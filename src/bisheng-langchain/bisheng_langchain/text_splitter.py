@@ -7,11 +7,11 @@ import copy
 import logging
 import re
 from abc import ABC, abstractmethod
-from collections import Counter
+from collections import deque
 from dataclasses import dataclass
 from enum import Enum
-from typing import (AbstractSet, Any, Callable, Collection, Dict, Iterable, List, Literal, Optional,
-                    Sequence, Tuple, Type, TypedDict, TypeVar, Union, cast)
+from typing import (AbstractSet, Any, Callable, Collection, Dict, Iterable, Iterator, List, Literal,
+                    Optional, Sequence, Tuple, Type, TypedDict, TypeVar, Union, cast)
 
 from langchain.docstore.document import Document
 from langchain.schema import BaseDocumentTransformer
@@ -78,9 +78,44 @@ class IntervalSearch(object):
         return [lb1 // 2, lb2 // 2]
 
 
+class IntervalCursor(IntervalSearch):
+    """IntervalSearch for queries in increasing order.
+
+    Chunks come out of the splitter in text order, so instead of two binary
+    searches per chunk the lower bounds are found by walking two pointers
+    forward, one merge pass over the element intervals per document. A query
+    that goes backwards falls back to bisect.
+    """
+
+    def __init__(self, inters):
+        super().__init__(inters)
+        self._pos = [0, 0]
+        self._last = [float('-inf'), float('-inf')]
+
+    def _lower_bound(self, which, v):
+        if v < self._last[which]:
+            pos = bisect.bisect_left(self.arrs, v)
+        else:
+            pos = self._pos[which]
+            while pos < self.n and self.arrs[pos] < v:
+                pos += 1
+        self._pos[which] = pos
+        self._last[which] = v
+        return pos
+
+    def find(self, inter) -> List[int, int]:
+        lb1 = self._norm_bound(self._lower_bound(0, inter[0]), inter[0])
+        lb2 = self._norm_bound(self._lower_bound(1, inter[1]), inter[1])
+        return [lb1 // 2, lb2 // 2]
+
+
 class ElemCharacterTextSplitter(RecursiveCharacterTextSplitter):
     """
-    todo
+    Recursive character splitter for documents from ElemUnstructuredLoader.
+
+    Splits keep their start offset in the source text through splitting and
+    merging, so each chunk is mapped to its element bboxes and pages without
+    searching the text for it. Separators are matched literally.
     """
     def __init__(
         self,
@@ -98,112 +133,140 @@ class ElemCharacterTextSplitter(RecursiveCharacterTextSplitter):
         self._is_separator_regex = False
 
     def split_documents(self, documents: Iterable[Document]) -> List[Document]:
-        texts, metadatas = [], []
+        return list(self.iter_split_documents(documents))
+
+    def iter_split_documents(self, documents: Iterable[Document]) -> Iterator[Document]:
+        """Lazily split documents, chunks of a document are yielded as soon as it is split."""
         for doc in documents:
-            texts.append(doc.page_content)
-            metadatas.append(doc.metadata)
+            yield from self._iter_documents(doc.page_content, doc.metadata)
 
-        return self.create_documents(texts, metadatas=metadatas)
+    def _split_spans(self, text: str, start: int, end: int, separator: str) -> List[Tuple[int, int]]:
+        """Spans of text[start:end] split by separator, empty splits dropped."""
+        if not separator:
+            return [(i, i + 1) for i in range(start, end)]
+        spans = []
+        sep_len = len(separator)
+        prev = start
+        pos = text.find(separator, start, end)
+        while pos != -1:
+            spans.append((prev, pos))
+            # keep_separator: 分隔符放在下一段的开头
+            prev = pos if self._keep_separator else pos + sep_len
+            pos = text.find(separator, pos + sep_len, end)
+        spans.append((prev, end))
+        return [(s, e) for s, e in spans if e > s]
 
-    def _split_text(self, text: str, separators: List[str]) -> List[str]:
-        """Split incoming text and return chunks."""
-        final_chunks = []
+    def _merge_spans(self, text: str, spans: List[Tuple[int, int]], lengths: List[int],
+                     separator: str) -> Iterator[Tuple[str, int]]:
+        """RecursiveCharacterTextSplitter._merge_splits on spans, yields (chunk, start offset)."""
+        separator_len = self._length_function(separator)
+        window = deque()
+        total = 0
+        for span, _len in zip(spans, lengths):
+            if total + _len + (separator_len if window else 0) > self._chunk_size:
+                if total > self._chunk_size:
+                    logger.warning(f'Created a chunk of size {total}, '
+                                   f'which is longer than the specified {self._chunk_size}')
+                if window:
+                    chunk = self._join_spans(text, window, separator)
+                    if chunk is not None:
+                        yield chunk
+                    # Keep on popping if:
+                    # - we have a larger chunk than in the chunk overlap
+                    # - or if we still have any chunks and the length is long
+                    while total > self._chunk_overlap or (
+                            total + _len + (separator_len if window else 0) > self._chunk_size
+                            and total > 0):
+                        total -= window[0][1] + (separator_len if len(window) > 1 else 0)
+                        window.popleft()
+            window.append((span, _len))
+            total += _len + (separator_len if len(window) > 1 else 0)
+        chunk = self._join_spans(text, window, separator)
+        if chunk is not None:
+            yield chunk
+
+    def _join_spans(self, text: str, window: deque, separator: str) -> Optional[Tuple[str, int]]:
+        start = window[0][0][0]
+        if separator:
+            joined = separator.join(text[s:e] for (s, e), _ in window)
+        else:
+            # 无分隔符合并时相邻的片段在原文中是连续的
+            joined = text[start:window[-1][0][1]]
+        if getattr(self, '_strip_whitespace', True):
+            stripped = joined.lstrip()
+            start += len(joined) - len(stripped)
+            joined = stripped.rstrip()
+        if joined == '':
+            return None
+        return joined, start
+
+    def _split_text_with_offsets(self, text: str, start: int, end: int,
+                                 separators: List[str]) -> Iterator[Tuple[str, int]]:
+        """Split text[start:end] and yield (chunk, start offset in text)."""
         # Get appropriate separator to use
         separator = separators[-1]
         new_separators = []
         for i, _s in enumerate(separators):
-            _separator = _s if self._is_separator_regex else re.escape(_s)
             if _s == '':
                 separator = _s
                 break
-            if re.search(_separator, text):
+            if text.find(_s, start, end) != -1:
                 separator = _s
-                new_separators = separators[i + 1 :]
+                new_separators = separators[i + 1:]
                 break
 
-        _separator = separator if self._is_separator_regex else re.escape(separator)
-        splits = _split_text_with_regex(text, _separator, self._keep_separator)
+        spans = self._split_spans(text, start, end, separator)
 
         # Now go merging things, recursively splitting longer texts.
-        _good_splits = []
+        _good_spans, _good_lengths = [], []
         _separator = '' if self._keep_separator else separator
-        for s in splits:
-            if self._length_function(s) < self._chunk_size:
-                _good_splits.append(s)
+        for s, e in spans:
+            _len = self._length_function(text[s:e])
+            if _len < self._chunk_size:
+                _good_spans.append((s, e))
+                _good_lengths.append(_len)
             else:
-                if _good_splits:
-                    merged_text = self._merge_splits(_good_splits, _separator)
-                    final_chunks.extend(merged_text)
-                    _good_splits = []
+                if _good_spans:
+                    yield from self._merge_spans(text, _good_spans, _good_lengths, _separator)
+                    _good_spans, _good_lengths = [], []
                 if not new_separators:
-                    final_chunks.append(s)
+                    yield text[s:e], s
                 else:
-                    other_info = self._split_text(s, new_separators)
-                    final_chunks.extend(other_info)
-        if _good_splits:
-            merged_text = self._merge_splits(_good_splits, _separator)
-            final_chunks.extend(merged_text)
-        return final_chunks
+                    yield from self._split_text_with_offsets(text, s, e, new_separators)
+        if _good_spans:
+            yield from self._merge_spans(text, _good_spans, _good_lengths, _separator)
+
+    def _split_text(self, text: str, separators: List[str]) -> List[str]:
+        """Split incoming text and return chunks."""
+        return [chunk for chunk, _ in self._split_text_with_offsets(text, 0, len(text), separators)]
 
     def split_text(self, text: str) -> List[str]:
         return self._split_text(text, self._separators)
 
+    def _iter_documents(self, text: str, metadata: dict) -> Iterator[Document]:
+        pages = metadata['pages']
+        types = metadata['types']
+        bboxes = metadata['bboxes']
+        source = metadata.get('source', '')
+        searcher = IntervalCursor(metadata['indexes'])
+        for chunk, index in self._split_text_with_offsets(text, 0, len(text), self._separators):
+            inter0 = [index, index + len(chunk) - 1]
+            norm_inter = searcher.find(inter0)
+            new_metadata = {}
+            new_metadata['chunk_bboxes'] = [{
+                'page': pages[j],
+                'bbox': bboxes[j]
+            } for j in range(norm_inter[0], norm_inter[1] + 1)]
+            # 取区间起始元素的类型
+            new_metadata['chunk_type'] = types[norm_inter[0]]
+            new_metadata['source'] = source
+            yield Document(page_content=chunk, metadata=new_metadata)
+
     def create_documents(
         self, texts: List[str], metadatas: Optional[List[dict]] = None
     ) -> List[Document]:
         """Create documents from a list of texts."""
         documents = []
         for i, text in enumerate(texts):
-            index = -1
-            # metadata = copy.deepcopy(_metadatas[i])
-            indexes = metadatas[i]['indexes']
-            pages = metadatas[i]['pages']
-            types = metadatas[i]['types']
-            bboxes = metadatas[i]['bboxes']
-            searcher = IntervalSearch(indexes)
-            split_texts = self.split_text(text)
-            for chunk in split_texts:
-                new_metadata = {}
-                index = text.find(chunk, index + 1)
-                inter0 = [index, index + len(chunk) - 1]
-                norm_inter = searcher.find(inter0)
-                new_metadata['chunk_bboxes'] = []
-                for j in range(norm_inter[0], norm_inter[1] + 1):
-                    new_metadata['chunk_bboxes'].append(
-                        {'page': pages[j], 'bbox': bboxes[j]})
-
-                c = Counter([types[j] for j in norm_inter])
-                chunk_type = c.most_common(1)[0][0]
-                new_metadata['chunk_type'] = chunk_type
-                new_metadata['source'] = metadatas[i].get('source', '')
-
-
-            # for chunk in split_texts:
-            #     new_metadata = {}
-            #     new_metadata['chunk_type'] = metadata.get('chunk_type', 'paragraph')
-            #     new_metadata['bboxes'] = metadata.get('bboxes', [])
-            #     new_metadata['source'] = metadata.get('source', '')
-            #     # chunk's start index in text
-            #     index = text.find(chunk, index + 1)
-            #     new_metadata['start'] = metadata.get('start', 0) + index
-            #     new_metadata['end'] = metadata.get('start', 0) + index + len(chunk) - 1
-
-            #     if 'page' in metadata:
-            #         new_metadata['page'] = metadata['page'][new_metadata['start']:new_metadata['end']+1]
-            #     if 'token_to_bbox' in metadata:
-            #         new_metadata['token_to_bbox'] = metadata['token_to_bbox'][new_metadata['start']:new_metadata['end']+1]
-
-            #     if 'page' in new_metadata and 'token_to_bbox' in new_metadata:
-            #         box_no_duplicates = set()
-            #         for index in range(len(new_metadata['page'])):
-            #             box_no_duplicates.add(
-            #                 (new_metadata['page'][index], new_metadata['token_to_bbox'][index]))
-
-            #         new_metadata['chunk_bboxes'] = []
-            #         for elem in box_no_duplicates:
-            #             new_metadata['chunk_bboxes'].append(
-            #                 {'page': elem[0], 'bbox': new_metadata['bboxes'][elem[1]]})
-
-                new_doc = Document(page_content=chunk, metadata=new_metadata)
-                documents.append(new_doc)
+            documents.extend(self._iter_documents(text, metadatas[i]))
         return documents
@@ -0,0 +1,139 @@
+"""Process wide cache of short lived provider credentials.
+
+Access tokens (oauth, signed jwt...) are cached by key until shortly before
+they expire. Concurrent callers asking for the same key share one refresh,
+and while a refresh is running the previous token is served if it is still
+valid.
+"""
+import asyncio
+import logging
+import threading
+import time
+from typing import Any, Awaitable, Callable, Dict, Hashable, NamedTuple, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# fetch functions return (token, expires_in seconds), expires_in may be None
+FetchResult = Tuple[Optional[str], Optional[float]]
+
+
+class CachedToken(NamedTuple):
+    token: str
+    expires_at: float
+    refresh_at: float
+
+
+class TokenCache(object):
+
+    def __init__(self, refresh_margin: float = 300, refresh_ratio: float = 0.1, default_ttl: float = 3600):
+        """
+        refresh_margin/refresh_ratio: refresh when the remaining lifetime is less than
+            max(refresh_margin, ttl * refresh_ratio), capped to half of the ttl.
+        default_ttl: lifetime used when the provider does not return expires_in.
+        """
+        self.refresh_margin = refresh_margin
+        self.refresh_ratio = refresh_ratio
+        self.default_ttl = default_ttl
+        self._tokens: Dict[Hashable, CachedToken] = {}
+        self._locks: Dict[Hashable, threading.Lock] = {}
+        self._locks_guard = threading.Lock()
+        self._inflight: Dict[Tuple[asyncio.AbstractEventLoop, Hashable], asyncio.Task] = {}
+
+    def _lock(self, key: Hashable) -> threading.Lock:
+        with self._locks_guard:
+            return self._locks.setdefault(key, threading.Lock())
+
+    def _valid(self, key: Hashable) -> Optional[CachedToken]:
+        item = self._tokens.get(key)
+        if item is not None and time.time() < item.expires_at:
+            return item
+        return None
+
+    def _fresh(self, key: Hashable) -> Optional[str]:
+        item = self._tokens.get(key)
+        if item is not None and time.time() < item.refresh_at:
+            return item.token
+        return None
+
+    def _store(self, key: Hashable, result: FetchResult) -> Optional[str]:
+        token, expires_in = result
+        if not token:
+            # 不缓存失败的结果，由调用方处理
+            return token
+        ttl = float(expires_in) if expires_in else self.default_ttl
+        margin = min(max(self.refresh_margin, ttl * self.refresh_ratio), ttl / 2)
+        now = time.time()
+        self._tokens[key] = CachedToken(token, now + ttl, now + ttl - margin)
+        return token
+
+    def _fallback(self, key: Hashable, error: Exception) -> str:
+        item = self._valid(key)
+        if item is None:
+            raise error
+        # key 中包含密钥，只打印provider
+        provider = key[0] if isinstance(key, tuple) else type(key).__name__
+        logger.warning(f'refresh token failed, use the cached one until it expires provider={provider} err={error}')
+        return item.token
+
+    def get(self, key: Hashable, fetch: Callable[[], FetchResult]) -> Optional[str]:
+        """Return the cached token of key, or call fetch() to refresh it."""
+        token = self._fresh(key)
+        if token is not None:
+            return token
+
+        lock = self._lock(key)
+        if not lock.acquire(blocking=False):
+            # 其他线程正在刷新，旧token仍有效时直接使用
+            item = self._valid(key)
+            if item is not None:
+                return item.token
+            lock.acquire()
+        try:
+            token = self._fresh(key)
+            if token is not None:
+                return token
+            try:
+                return self._store(key, fetch())
+            except Exception as e:
+                return self._fallback(key, e)
+        finally:
+            lock.release()
+
+    async def aget(self, key: Hashable, fetch: Callable[[], Awaitable[FetchResult]]) -> Optional[str]:
+        """Async version of get, concurrent coroutines of one event loop share one fetch."""
+        token = self._fresh(key)
+        if token is not None:
+            return token
+
+        loop = asyncio.get_running_loop()
+        inflight_key = (loop, key)
+        task = self._inflight.get(inflight_key)
+        if task is None:
+            task = loop.create_task(self._afetch(key, fetch))
+            self._inflight[inflight_key] = task
+            task.add_done_callback(lambda _: self._inflight.pop(inflight_key, None))
+        else:
+            item = self._valid(key)
+            if item is not None:
+                return item.token
+        return await asyncio.shield(task)
+
+    async def _afetch(self, key: Hashable, fetch: Callable[[], Awaitable[FetchResult]]) -> Optional[str]:
+        try:
+            return self._store(key, await fetch())
+        except Exception as e:
+            return self._fallback(key, e)
+
+    def invalidate(self, key: Hashable) -> None:
+        """Drop the cached token, e.g. when the provider reports it as expired."""
+        self._tokens.pop(key, None)
+
+    def clear(self) -> None:
+        self._tokens.clear()
+
+
+token_cache = TokenCache()
+
+
+def cache_key(provider: str, *credentials: Any) -> Tuple:
+    return (provider, ) + tuple(credentials)
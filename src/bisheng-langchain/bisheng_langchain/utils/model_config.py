@@ -0,0 +1,105 @@
+"""Cache of model configs fetched from the model server (/v2/models/{model}/config).
+
+Host llm objects are created on every flow build, the config is cached per
+(server url, model) so creating them does not hit the model server. Stale
+configs are refreshed in the background, failures are cached for a short
+time so an unreachable server fails fast instead of waiting for the timeout.
+"""
+import logging
+import threading
+import time
+from typing import Dict, NamedTuple, Optional, Tuple
+
+from bisheng_langchain.utils import transport
+
+logger = logging.getLogger(__name__)
+
+_MISS = object()
+
+
+class _Entry(NamedTuple):
+    config: Optional[dict]
+    error: Optional[Exception]
+    fetched_at: float
+
+
+class ModelConfigRegistry(object):
+
+    def __init__(self, ttl: float = 300, error_ttl: float = 10, timeout: float = 5):
+        self.ttl = ttl
+        self.error_ttl = error_ttl
+        self.timeout = timeout
+        self._entries: Dict[Tuple[str, str], _Entry] = {}
+        self._locks: Dict[Tuple[str, str], threading.Lock] = {}
+        self._refreshing = set()
+        self._guard = threading.Lock()
+
+    @staticmethod
+    def config_url(server_url: str, model_name: str) -> str:
+        return f'{server_url}/v2/models/{model_name}/config'
+
+    def _fetch(self, key: Tuple[str, str]) -> dict:
+        resp = transport.get_sync_session().get(url=self.config_url(*key), json={}, timeout=self.timeout)
+        return resp.json()
+
+    def _lock(self, key: Tuple[str, str]) -> threading.Lock:
+        with self._guard:
+            return self._locks.setdefault(key, threading.Lock())
+
+    def _cached(self, key: Tuple[str, str]):
+        """Return the cached config, raise the cached error, or _MISS if need to fetch."""
+        entry = self._entries.get(key)
+        if entry is None:
+            return _MISS
+        age = time.monotonic() - entry.fetched_at
+        if entry.error is None:
+            if age > self.ttl:
+                self._refresh_background(key)
+            return entry.config
+        if age < self.error_ttl:
+            raise entry.error
+        return _MISS
+
+    def get(self, server_url: str, model_name: str) -> dict:
+        key = (server_url, model_name)
+        config = self._cached(key)
+        if config is not _MISS:
+            return config
+        with self._lock(key):
+            # 其他线程可能已经获取完成
+            config = self._cached(key)
+            if config is not _MISS:
+                return config
+            try:
+                config = self._fetch(key)
+            except Exception as e:
+                self._entries[key] = _Entry(None, e, time.monotonic())
+                raise
+            self._entries[key] = _Entry(config, None, time.monotonic())
+            return config
+
+    def _refresh_background(self, key: Tuple[str, str]) -> None:
+        with self._guard:
+            if key in self._refreshing:
+                return
+            self._refreshing.add(key)
+        threading.Thread(target=self._refresh, args=(key, ), daemon=True).start()
+
+    def _refresh(self, key: Tuple[str, str]) -> None:
+        try:
+            config = self._fetch(key)
+            self._entries[key] = _Entry(config, None, time.monotonic())
+        except Exception as e:
+            # 保留旧的配置，error_ttl 之后再次尝试刷新
+            logger.warning(f'refresh model config failed url={self.config_url(*key)} err={e}')
+            self._entries[key] = _Entry(self._entries[key].config, None,
+                                        time.monotonic() - self.ttl + self.error_ttl)
+        finally:
+            with self._guard:
+                self._refreshing.discard(key)
+
+    def invalidate(self, server_url: str, model_name: str) -> None:
+        self._entries.pop((server_url, model_name), None)
+
+
+model_config_registry = ModelConfigRegistry()
@@ -4,6 +4,7 @@ from typing import Any, AsyncGenerator, Dict, Optional, Tuple, Union
 
 import aiohttp
 import requests
+from bisheng_langchain.utils import transport
 from loguru import logger
 from pydantic import BaseModel, Extra
 
@@ -28,46 +29,46 @@ class Requests(BaseModel):
 
     def get(self, url: str, **kwargs: Any) -> requests.Response:
         """GET the URL and return the text."""
-        return requests.get(url,
-                            headers=self.headers,
-                            auth=self.auth,
-                            timeout=self.request_timeout,
-                            **kwargs)
+        return transport.get_sync_session().get(url,
+                                                headers=self.headers,
+                                                auth=self.auth,
+                                                timeout=self.request_timeout,
+                                                **kwargs)
 
     def post(self, url: str, json: Dict[str, Any], **kwargs: Any) -> requests.Response:
         """POST to the URL and return the text."""
-        return requests.post(url,
-                             json=json,
-                             headers=self.headers,
-                             auth=self.auth,
-                             timeout=self.request_timeout,
-                             **kwargs)
+        return transport.get_sync_session().post(url,
+                                                 json=json,
+                                                 headers=self.headers,
+                                                 auth=self.auth,
+                                                 timeout=self.request_timeout,
+                                                 **kwargs)
 
     def patch(self, url: str, json: Dict[str, Any], **kwargs: Any) -> requests.Response:
         """PATCH the URL and return the text."""
-        return requests.patch(url,
-                              json=json,
-                              headers=self.headers,
-                              auth=self.auth,
-                              timeout=self.request_timeout,
-                              **kwargs)
+        return transport.get_sync_session().patch(url,
+                                                  json=json,
+                                                  headers=self.headers,
+                                                  auth=self.auth,
+                                                  timeout=self.request_timeout,
+                                                  **kwargs)
 
     def put(self, url: str, json: Dict[str, Any], **kwargs: Any) -> requests.Response:
         """PUT the URL and return the text."""
-        return requests.put(url,
-                            json=json,
-                            headers=self.headers,
-                            auth=self.auth,
-                            timeout=self.request_timeout,
-                            **kwargs)
+        return transport.get_sync_session().put(url,
+                                                json=json,
+                                                headers=self.headers,
+                                                auth=self.auth,
+                                                timeout=self.request_timeout,
+                                                **kwargs)
 
     def delete(self, url: str, **kwargs: Any) -> requests.Response:
         """DELETE the URL and return the text."""
-        return requests.delete(url,
-                               headers=self.headers,
-                               auth=self.auth,
-                               timeout=self.request_timeout,
-                               **kwargs)
+        return transport.get_sync_session().delete(url,
+                                                   headers=self.headers,
+                                                   auth=self.auth,
+                                                   timeout=self.request_timeout,
+                                                   **kwargs)
 
     @asynccontextmanager
     async def _arequest(self, method: str, url: str,
@@ -76,21 +77,15 @@ class Requests(BaseModel):
         if not self.aiosession:
             if not self.request_timeout:
                 self.request_timeout = 120
-            if isinstance(self.request_timeout, tuple):
-                timeout = aiohttp.ClientTimeout(connect=self.request_timeout[0],
-                                                total=self.request_timeout[1])
-            else:
-                timeout = aiohttp.ClientTimeout(total=self.request_timeout)
-            async with aiohttp.ClientSession(timeout=timeout) as session:
-                logger.info(f'aio_http url={url}')
-                async with session.request(method, url, headers=self.headers,
-                                           **kwargs) as response:
-                    yield response
+            # 复用当前事件循环的连接池
+            logger.info(f'aio_http url={url}')
+            async with transport.arequest(method, url, self.request_timeout, headers=self.headers,
+                                          **kwargs) as response:
+                yield response
         else:
             async with self.aiosession.request(method,
                                                url,
                                                headers=self.headers,
-                                               auth=self.auth,
                                                **kwargs) as response:
                 yield response
 
@@ -0,0 +1,123 @@
+"""Incremental decoder for streaming llm responses, server-sent events and ndjson.
+
+Chunks from the socket are appended to one bytearray and scanned for line
+ends through a memoryview, so an event split across tcp chunks is decoded
+once it is complete, and only the payload of each event is copied out.
+
+Every `data:` line is dispatched as one event (with the current `event:`
+type) instead of waiting for the blank line, all the streaming apis we call
+send one json object per data line and some of them omit the blank line.
+Lines starting with `{` are dispatched as ndjson events.
+"""
+from typing import AsyncIterable, AsyncIterator, Iterable, Iterator, List, NamedTuple, Optional, Tuple
+
+import orjson
+
+_DATA = b'data:'
+_EVENT = b'event:'
+_JSON_START = ord('{')
+_WHITESPACE = b' \t\r'
+
+
+class StreamEvent(NamedTuple):
+    event: Optional[str]
+    data: bytes
+
+    @property
+    def is_error(self) -> bool:
+        return self.event == 'error'
+
+    @property
+    def is_json(self) -> bool:
+        return bool(self.data) and self.data[0] == _JSON_START
+
+    @property
+    def is_done(self) -> bool:
+        return self.data == b'[DONE]'
+
+    def json(self):
+        return orjson.loads(self.data)
+
+    def text(self) -> str:
+        return self.data.decode('utf-8', errors='replace')
+
+
+def _strip(buffer: bytearray, start: int, end: int) -> Tuple[int, int]:
+    """Strip whitespace by moving the indexes, the buffer is not copied."""
+    while start < end and buffer[start] in _WHITESPACE:
+        start += 1
+    while end > start and buffer[end - 1] in _WHITESPACE:
+        end -= 1
+    return start, end
+
+
+class StreamDecoder(object):
+
+    def __init__(self):
+        self._buffer = bytearray()
+        self._event: Optional[str] = None
+        # 上次扫描过的位置，不完整的行不重复查找换行
+        self._scanned = 0
+
+    def feed(self, chunk: bytes) -> List[StreamEvent]:
+        """Append a chunk and return the events completed by it."""
+        buffer = self._buffer
+        buffer += chunk
+        events = []
+        start, scan = 0, self._scanned
+        with memoryview(buffer) as view:
+            while True:
+                end = buffer.find(b'\n', scan)
+                if end < 0:
+                    break
+                self._handle_line(view, start, end, events)
+                start = scan = end + 1
+        if start:
+            del buffer[:start]
+        self._scanned = len(buffer)
+        return events
+
+    def flush(self) -> List[StreamEvent]:
+        """Decode the remaining bytes when the stream ends without a trailing newline."""
+        events = []
+        if self._buffer:
+            with memoryview(self._buffer) as view:
+                self._handle_line(view, 0, len(self._buffer), events)
+            self._buffer.clear()
+        self._event = None
+        self._scanned = 0
+        return events
+
+    def _handle_line(self, view: memoryview, start: int, end: int, events: List[StreamEvent]) -> None:
+        buffer = self._buffer
+        start, end = _strip(buffer, start, end)
+        if start == end:
+            # 空行为事件的结束
+            self._event = None
+        elif buffer.startswith(_DATA, start, end):
+            start, end = _strip(buffer, start + len(_DATA), end)
+            events.append(StreamEvent(self._event, bytes(view[start:end])))
+        elif buffer.startswith(_EVENT, start, end):
+            start, end = _strip(buffer, start + len(_EVENT), end)
+            self._event = bytes(view[start:end]).decode('utf-8')
+        elif buffer[start] == _JSON_START:
+            events.append(StreamEvent(None, bytes(view[start:end])))
+        # 注释(:开头)、id、retry 等字段忽略
+
+
+async def aiter_events(chunks: AsyncIterable[bytes]) -> AsyncIterator[StreamEvent]:
+    """Decode events from an async byte stream, e.g. aiohttp response.content.iter_any()."""
+    decoder = StreamDecoder()
+    async for chunk in chunks:
+        for event in decoder.feed(chunk):
+            yield event
+    for event in decoder.flush():
+        yield event
+
+
+def iter_events(chunks: Iterable[bytes]) -> Iterator[StreamEvent]:
+    """Decode events from a sync byte stream, e.g. requests response.iter_content()."""
+    decoder = StreamDecoder()
+    for chunk in chunks:
+        yield from decoder.feed(chunk)
+    yield from decoder.flush()
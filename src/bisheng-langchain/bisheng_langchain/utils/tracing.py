@@ -0,0 +1,154 @@
+"""Lightweight spans for timing the stages of a request.
+
+    with tracing.span('milvus.search', k=4) as s:
+        ...
+        s.set_attribute('hits', len(docs))
+
+The current span is kept in a contextvar, so spans opened in nested calls (and
+in tasks or threads started with a copied context) become its children and
+share its trace id. Finished spans are handed to the registered processors;
+the backend uses one to feed the /metrics histograms. Every root span also
+sums the time of its descendants per stage, so a slow request can be logged
+with its stage breakdown.
+
+OpenTelemetry is optional: after enable_opentelemetry() each span is mirrored
+to an OpenTelemetry span on the globally configured tracer provider.
+"""
+import contextvars
+import logging
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+logger = logging.getLogger(__name__)
+
+SpanProcessor = Callable[['Span'], None]
+
+_current: contextvars.ContextVar[Optional['Span']] = contextvars.ContextVar('bisheng_span', default=None)
+_processors: List[SpanProcessor] = []
+_otel_tracer = None
+
+
+class Span(object):
+    __slots__ = ('name', 'trace_id', 'span_id', 'parent', 'root', 'attributes', 'start', 'end', 'error',
+                 'first_token_at', 'tokens', 'stages', '_lock', '_otel')
+
+    def __init__(self, name: str, parent: Optional['Span'] = None, trace_id: Optional[str] = None,
+                 attributes: Optional[Dict[str, Any]] = None):
+        self.name = name
+        self.parent = parent
+        self.root = parent.root if parent else self
+        self.trace_id = trace_id or (parent.trace_id if parent else uuid.uuid4().hex)
+        self.span_id = uuid.uuid4().hex[:16]
+        self.attributes: Dict[str, Any] = dict(attributes or {})
+        self.start = time.perf_counter()
+        self.end: Optional[float] = None
+        self.error: Optional[str] = None
+        self.first_token_at: Optional[float] = None
+        self.tokens = 0
+        # 仅根span使用: 各阶段的累计耗时
+        self.stages: Dict[str, float] = {}
+        self._lock = threading.Lock()
+        self._otel = None
+
+    @property
+    def duration(self) -> float:
+        return (self.end or time.perf_counter()) - self.start
+
+    def set_attribute(self, key: str, value: Any) -> None:
+        self.attributes[key] = value
+        if self._otel is not None:
+            self._otel.set_attribute(key, _otel_value(value))
+
+    def record_token(self, count: int = 1) -> None:
+        """Count streamed tokens, the first call records the time to first token."""
+        if self.first_token_at is None:
+            self.first_token_at = time.perf_counter()
+            self.set_attribute('first_token_seconds', self.first_token_at - self.start)
+        self.tokens += count
+
+    def _finish(self) -> None:
+        self.end = time.perf_counter()
+        if self.tokens:
+            self.set_attribute('tokens', self.tokens)
+            generate_time = self.end - self.first_token_at
+            if self.tokens > 1 and generate_time > 0:
+                # 首个token之后的生成速度
+                self.set_attribute('tokens_per_second', (self.tokens - 1) / generate_time)
+        if self.root is not self:
+            with self.root._lock:
+                self.root.stages[self.name] = self.root.stages.get(self.name, 0) + self.duration
+
+    def stage_summary(self) -> str:
+        """Stage durations of a root span, e.g. `milvus.search=0.120 llm.generate=2.310`."""
+        with self._lock:
+            stages = sorted(self.stages.items(), key=lambda x: -x[1])
+        return ' '.join(f'{name}={cost:.3f}' for name, cost in stages)
+
+
+def _otel_value(value: Any) -> Any:
+    return value if isinstance(value, (str, bool, int, float)) else str(value)
+
+
+def current_span() -> Optional[Span]:
+    return _current.get()
+
+
+def add_span_processor(processor: SpanProcessor) -> None:
+    if processor not in _processors:
+        _processors.append(processor)
+
+
+def _emit(s: Span) -> None:
+    for processor in _processors:
+        try:
+            processor(s)
+        except Exception as e:
+            logger.warning('span_processor_error span=%s err=%s', s.name, e)
+
+
+@contextmanager
+def span(name: str, trace_id: Optional[str] = None, **attributes: Any) -> Iterator[Span]:
+    """Time a stage, trace_id only applies to root spans (no current span)."""
+    s = Span(name, parent=_current.get(), trace_id=trace_id, attributes=attributes)
+    token = _current.set(s)
+    otel_context = None
+    if _otel_tracer is not None:
+        otel_context = _otel_tracer.start_as_current_span(
+            name, attributes={k: _otel_value(v) for k, v in attributes.items()})
+        s._otel = otel_context.__enter__()
+    try:
+        yield s
+    except BaseException as e:
+        s.error = type(e).__name__
+        raise
+    finally:
+        s._finish()
+        _current.reset(token)
+        if otel_context is not None:
+            if s.error:
+                s._otel.set_attribute('error.type', s.error)
+            otel_context.__exit__(None, None, None)
+        _emit(s)
+
+
+def observe(name: str, duration: float, **attributes: Any) -> None:
+    """Report a stage timed elsewhere (e.g. queue wait) as a finished child of the current span."""
+    s = Span(name, parent=_current.get(), attributes=attributes)
+    s.start = time.perf_counter() - duration
+    s._finish()
+    _emit(s)
+
+
+def enable_opentelemetry(name: str = 'bisheng') -> bool:
+    """Mirror spans to OpenTelemetry, returns False when opentelemetry-api is not installed."""
+    global _otel_tracer
+    try:
+        from opentelemetry import trace
+    except ImportError:
+        logger.warning('opentelemetry-api is not installed, spans are not exported')
+        return False
+    _otel_tracer = trace.get_tracer(name)
+    return True
@@ -0,0 +1,111 @@
+"""Shared http transport for the chat models and other remote services.
+
+aiohttp sessions are pooled per event loop and sync calls share one
+requests.Session, so requests on one worker reuse keep-alive connections
+instead of paying TCP/TLS setup for every completion.
+"""
+import asyncio
+import atexit
+import threading
+import weakref
+from contextlib import asynccontextmanager
+from functools import partial
+from http.cookiejar import DefaultCookiePolicy
+from typing import Any, AsyncGenerator, Callable, Optional, Tuple, Union
+
+import aiohttp
+import requests
+from requests.adapters import HTTPAdapter
+
+DEFAULT_TIMEOUT = 600
+CONNECTOR_LIMIT = 100
+CONNECTOR_LIMIT_PER_HOST = 32
+DNS_CACHE_TTL = 300
+KEEPALIVE_TIMEOUT = 30
+
+_sessions: 'weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, aiohttp.ClientSession]' = (
+    weakref.WeakKeyDictionary())
+_sync_session: Optional[requests.Session] = None
+_sync_lock = threading.Lock()
+
+
+def make_timeout(request_timeout: Optional[Union[float, Tuple[float, float]]]) -> aiohttp.ClientTimeout:
+    """Same semantic as requests: a number for total timeout or (connect, total)."""
+    if not request_timeout:
+        request_timeout = DEFAULT_TIMEOUT
+    if isinstance(request_timeout, tuple):
+        return aiohttp.ClientTimeout(connect=request_timeout[0], total=request_timeout[1])
+    return aiohttp.ClientTimeout(total=request_timeout)
+
+
+def get_session() -> aiohttp.ClientSession:
+    """Return the pooled session of the running event loop."""
+    loop = asyncio.get_running_loop()
+    session = _sessions.get(loop)
+    if session is None or session.closed:
+        connector = aiohttp.TCPConnector(limit=CONNECTOR_LIMIT,
+                                         limit_per_host=CONNECTOR_LIMIT_PER_HOST,
+                                         ttl_dns_cache=DNS_CACHE_TTL,
+                                         keepalive_timeout=KEEPALIVE_TIMEOUT)
+        session = aiohttp.ClientSession(connector=connector, timeout=make_timeout(None))
+        _sessions[loop] = session
+    return session
+
+
+async def close_session() -> None:
+    """Close the pooled session of the running event loop."""
+    session = _sessions.pop(asyncio.get_running_loop(), None)
+    if session is not None and not session.closed:
+        await session.close()
+
+
+def get_sync_session() -> requests.Session:
+    """Return the process wide requests session, connections are pooled per host."""
+    global _sync_session
+    if _sync_session is None:
+        with _sync_lock:
+            if _sync_session is None:
+                session = requests.Session()
+                # 多个服务共用session, 不保存cookie避免互相影响
+                session.cookies.set_policy(DefaultCookiePolicy(allowed_domains=[]))
+                adapter = HTTPAdapter(pool_connections=CONNECTOR_LIMIT_PER_HOST,
+                                      pool_maxsize=CONNECTOR_LIMIT_PER_HOST)
+                session.mount('http://', adapter)
+                session.mount('https://', adapter)
+                _sync_session = session
+    return _sync_session
+
+
+def close_sync_session() -> None:
+    global _sync_session
+    with _sync_lock:
+        if _sync_session is not None:
+            _sync_session.close()
+            _sync_session = None
+
+
+atexit.register(close_sync_session)
+
+
+@asynccontextmanager
+async def arequest(method: str,
+                   url: str,
+                   request_timeout: Optional[Union[float, Tuple[float, float]]] = None,
+                   **kwargs: Any) -> AsyncGenerator[aiohttp.ClientResponse, None]:
+    """Send a request over the pooled session."""
+    async with get_session().request(method, url, timeout=make_timeout(request_timeout),
+                                     **kwargs) as response:
+        yield response
+
+
+async def apost(url: str,
+                request_timeout: Optional[Union[float, Tuple[float, float]]] = None,
+                **kwargs: Any) -> Tuple[int, str]:
+    """POST and return (status code, text body)."""
+    async with arequest('POST', url, request_timeout, **kwargs) as response:
+        return response.status, await response.text()
+
+
+async def run_sync(func: Callable, *args: Any, **kwargs: Any) -> Any:
+    """Run a blocking sdk call in the default executor, for providers without http api."""
+    return await asyncio.get_running_loop().run_in_executor(None, partial(func, *args, **kwargs))
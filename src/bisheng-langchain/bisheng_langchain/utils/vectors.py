@@ -0,0 +1,79 @@
+"""Compact float32 embedding helpers.
+
+Embeddings kept as python float lists cost about 8 times the memory of a
+float32 array (a boxed float plus a list slot per element). These helpers
+decode embedding payloads straight into one contiguous (n, dim) float32
+array, and run mmr on the array without converting back to lists.
+"""
+import base64
+from typing import Any, List, Sequence, Union
+
+import numpy as np
+
+Vectors = Union[np.ndarray, Sequence[Sequence[float]]]
+
+# 服务端返回的 base64 向量为小端 float32
+FLOAT32_LE = np.dtype('<f4')
+
+
+def decode_embeddings(payload: Any) -> np.ndarray:
+    """Decode embeddings returned by the embedding service into a (n, dim) float32 array.
+
+    payload is a list of float lists or a list of base64 encoded float32 buffers,
+    one per text.
+    """
+    if len(payload) == 0:
+        return np.empty((0, 0), dtype=np.float32)
+    if isinstance(payload[0], (str, bytes)):
+        buffer = b''.join(base64.b64decode(item) for item in payload)
+        return np.frombuffer(buffer, dtype=FLOAT32_LE).reshape(len(payload), -1)
+    return np.asarray(payload, dtype=np.float32)
+
+
+def as_float32(vectors: Vectors) -> np.ndarray:
+    """Return vectors as a contiguous float32 array, arrays already in that layout are not copied."""
+    return np.ascontiguousarray(vectors, dtype=np.float32)
+
+
+def _normalize(vectors: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    # 零向量与任何向量的相似度为0
+    norms[norms == 0] = 1
+    return vectors / norms
+
+
+def maximal_marginal_relevance(query_embedding: Vectors,
+                               embedding_list: Vectors,
+                               lambda_mult: float = 0.5,
+                               k: int = 4) -> List[int]:
+    """Calculate maximal marginal relevance, same result as langchain's implementation.
+
+    The pairwise similarities are computed once, each step only updates the
+    max similarity of every candidate to the selected set with the last
+    selected vector, so a step costs O(n) instead of O(n * selected * dim).
+    """
+    embeddings = as_float32(embedding_list)
+    n = embeddings.shape[0] if embeddings.ndim == 2 else 0
+    k = min(k, n)
+    if k <= 0:
+        return []
+
+    embeddings = _normalize(embeddings)
+    query = _normalize(as_float32(query_embedding).reshape(-1))
+    similarity_to_query = embeddings @ query
+    pairwise = embeddings @ embeddings.T
+
+    most_similar = int(np.argmax(similarity_to_query))
+    idxs = [most_similar]
+    redundant = pairwise[most_similar].copy()
+    selected = np.zeros(n, dtype=bool)
+    selected[most_similar] = True
+    query_scores = lambda_mult * similarity_to_query
+    while len(idxs) < k:
+        scores = query_scores - (1 - lambda_mult) * redundant
+        scores[selected] = -np.inf
+        idx = int(np.argmax(scores))
+        idxs.append(idx)
+        selected[idx] = True
+        np.maximum(redundant, pairwise[idx], out=redundant)
+    return idxs
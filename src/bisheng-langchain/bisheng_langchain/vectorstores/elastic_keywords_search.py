@@ -1,11 +1,18 @@
 """Wrapper around Elasticsearch vector database."""
 from __future__ import annotations
 
+import ast
+import threading
 import uuid
 from abc import ABC
-from typing import TYPE_CHECKING, Any, Callable, Dict, Iterable, List, Optional, Tuple
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+from typing import TYPE_CHECKING, Any, Callable, Dict, Hashable, Iterable, List, Optional, Tuple
 
+import jieba
 import jieba.analyse
+from bisheng_langchain.utils import tracing
 from langchain.chains.llm import LLMChain
 from langchain.docstore.document import Document
 from langchain.embeddings.base import Embeddings
@@ -22,6 +29,52 @@ def _default_text_mapping() -> Dict:
     return {'properties': {'text': {'type': 'text'}}}
 
 
+class _LRUCache(object):
+
+    def __init__(self, maxsize: int = 4096):
+        self.maxsize = maxsize
+        self._data: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        with self._lock:
+            value = self._data.get(key)
+            if value is not None:
+                self._data.move_to_end(key)
+            return value
+
+    def set(self, key: Hashable, value: Any) -> None:
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+
+# es major version by url, avoid calling client.info() on every request
+_es_versions: Dict[str, int] = {}
+# query -> keywords, shared by all instances in the process
+_keywords_cache = _LRUCache()
+_jieba_lock = threading.Lock()
+_jieba_user_dicts = set()
+
+
+def preload_jieba(user_dicts: Optional[List[str]] = None) -> None:
+    """Load jieba dictionaries once per process, and the custom domain dictionaries."""
+    with _jieba_lock:
+        jieba.initialize()
+        for path in user_dicts or []:
+            if path not in _jieba_user_dicts:
+                jieba.load_userdict(path)
+                _jieba_user_dicts.add(path)
+
+
+def _llm_cache_key(llm_chain: LLMChain) -> Tuple:
+    llm = llm_chain.llm
+    model_name = getattr(llm, 'model_name', None) or getattr(llm, 'model', None)
+    return (type(llm).__name__, model_name, llm_chain.prompt.template)
+
+
 DEFAULT_PROMPT = PromptTemplate(
     input_variables=['question'],
     template="""分析给定Question，提取Question中包含的KeyWords，输出列表形式
@@ -109,8 +162,19 @@ class ElasticKeywordsSearch(VectorStore, ABC):
         *,
         ssl_verify: Optional[Dict[str, Any]] = None,
         llm_chain: Optional[LLMChain] = None,
+        user_dicts: Optional[List[str]] = None,
+        bulk_thread_count: int = 4,
+        bulk_chunk_size: int = 500,
+        bulk_max_chunk_bytes: int = 10 * 1024 * 1024,
+        bulk_max_retries: int = 3,
     ):
-        """Initialize with necessary components."""
+        """Initialize with necessary components.
+
+        user_dicts: custom jieba dictionaries of the domain, loaded once per process.
+        bulk_*: add_texts sends bulk requests of at most bulk_chunk_size docs and
+            bulk_max_chunk_bytes bytes in bulk_thread_count threads, documents
+            rejected by es (429) are retried bulk_max_retries times with backoff.
+        """
         try:
             import elasticsearch
         except ImportError:
@@ -119,6 +183,12 @@ class ElasticKeywordsSearch(VectorStore, ABC):
         self.index_name = index_name
         self.llm_chain = llm_chain
         self.drop_old = drop_old
+        self.elasticsearch_url = elasticsearch_url
+        self.bulk_thread_count = bulk_thread_count
+        self.bulk_chunk_size = bulk_chunk_size
+        self.bulk_max_chunk_bytes = bulk_max_chunk_bytes
+        self.bulk_max_retries = bulk_max_retries
+        preload_jieba(user_dicts)
         _ssl_verify = ssl_verify or {}
         try:
             self.client = elasticsearch.Elasticsearch(elasticsearch_url, **_ssl_verify)
@@ -146,12 +216,9 @@ class ElasticKeywordsSearch(VectorStore, ABC):
         """
         try:
             from elasticsearch.exceptions import NotFoundError
-            from elasticsearch.helpers import bulk
         except ImportError:
             raise ImportError('Could not import elasticsearch python package. '
                               'Please install it with `pip install elasticsearch`.')
-        requests = []
-        ids = ids or [str(uuid.uuid4()) for _ in texts]
         mapping = _default_text_mapping()
 
         # check to see if the index already exists
@@ -165,21 +232,72 @@ class ElasticKeywordsSearch(VectorStore, ABC):
             # just to save expensive steps for last
             self.create_index(self.client, self.index_name, mapping)
 
+        # actions are generated lazily, memory stays flat for large uploads
+        out_ids: List[str] = []
+        with tracing.span('es.add_texts') as s:
+            self._bulk(self._iter_actions(texts, metadatas, ids, out_ids))
+            s.set_attribute('count', len(out_ids))
+
+        if refresh_indices:
+            with tracing.span('es.refresh'):
+                self.client.indices.refresh(index=self.index_name)
+        return out_ids
+
+    def _iter_actions(self, texts: Iterable[str], metadatas: Optional[List[dict]],
+                      ids: Optional[List[str]], out_ids: List[str]) -> Iterable[Dict]:
         for i, text in enumerate(texts):
-            metadata = metadatas[i] if metadatas else {}
-            request = {
+            _id = ids[i] if ids else str(uuid.uuid4())
+            out_ids.append(_id)
+            yield {
                 '_op_type': 'index',
                 '_index': self.index_name,
                 'text': text,
-                'metadata': metadata,
-                '_id': ids[i],
+                'metadata': metadatas[i] if metadatas else {},
+                '_id': _id,
             }
-            requests.append(request)
-        bulk(self.client, requests)
 
-        if refresh_indices:
-            self.client.indices.refresh(index=self.index_name)
-        return ids
+    def _bulk_chunk(self, actions: List[Dict]) -> List[Dict]:
+        """Index one chunk, return the failed items after retries."""
+        from elasticsearch.helpers import streaming_bulk
+
+        errors = []
+        for ok, item in streaming_bulk(self.client,
+                                       actions,
+                                       chunk_size=len(actions),
+                                       max_chunk_bytes=self.bulk_max_chunk_bytes,
+                                       max_retries=self.bulk_max_retries,
+                                       raise_on_error=False):
+            if not ok:
+                errors.append(item)
+        return errors
+
+    def _bulk(self, actions: Iterable[Dict]) -> None:
+        from elasticsearch.helpers import BulkIndexError
+
+        chunks = iter(lambda: list(islice(actions, self.bulk_chunk_size)), [])
+        failed, errors = 0, []
+
+        def _collect(chunk_errors: List[Dict]):
+            nonlocal failed
+            failed += len(chunk_errors)
+            # keep part of the errors for the exception message
+            errors.extend(chunk_errors[:max(0, 100 - len(errors))])
+
+        if self.bulk_thread_count <= 1:
+            for chunk in chunks:
+                _collect(self._bulk_chunk(chunk))
+        else:
+            # at most 2 * thread_count chunks in memory
+            with ThreadPoolExecutor(max_workers=self.bulk_thread_count) as executor:
+                pending = deque()
+                for chunk in chunks:
+                    pending.append(executor.submit(self._bulk_chunk, chunk))
+                    if len(pending) >= self.bulk_thread_count * 2:
+                        _collect(pending.popleft().result())
+                while pending:
+                    _collect(pending.popleft().result())
+        if failed:
+            raise BulkIndexError(f'{failed} document(s) failed to index.', errors)
 
     def similarity_search(self,
                           query: str,
@@ -209,25 +327,22 @@ class ElasticKeywordsSearch(VectorStore, ABC):
                                      k: int = 4,
                                      query_strategy: str = 'match_phrase',
                                      must_or_should: str = 'should',
+                                     filter: Optional[List[dict]] = None,
                                      **kwargs: Any) -> List[Tuple[Document, float]]:
+        """filter: es filter clauses, e.g. [{'terms': {'metadata.file_id': [1, 2]}}]"""
         assert must_or_should in ['must', 'should'], 'only support must and should.'
-        # llm or jiaba extract keywords
-        if self.llm_chain:
-            keywords_str = self.llm_chain.run(query)
-            print('keywords_str:', keywords_str)
-            try:
-                keywords = eval(keywords_str)
-                if not isinstance(keywords, list):
-                    raise ValueError('Keywords extracted by llm is not list.')
-            except Exception as e:
-                print(str(e))
-                keywords = jieba.analyse.extract_tags(query, topK=10, withWeight=False)
-        else:
-            keywords = jieba.analyse.extract_tags(query, topK=10, withWeight=False)
+        with tracing.span('es.keywords'):
+            keywords = self.extract_keywords(query)
         match_query = {'bool': {must_or_should: []}}
         for key in keywords:
             match_query['bool'][must_or_should].append({query_strategy: {'text': key}})
-        response = self.client_search(self.client, self.index_name, match_query, size=k)
+        if filter:
+            match_query['bool']['filter'] = filter
+            if must_or_should == 'should':
+                # 有filter时should默认可以不匹配
+                match_query['bool']['minimum_should_match'] = 1
+        with tracing.span('es.search', k=k):
+            response = self.client_search(self.client, self.index_name, match_query, size=k)
         hits = [hit for hit in response['hits']['hits']]
         docs_and_scores = [(
             Document(
@@ -239,6 +354,31 @@ class ElasticKeywordsSearch(VectorStore, ABC):
 
         return docs_and_scores
 
+    def extract_keywords(self, query: str) -> List[str]:
+        """llm or jieba extract keywords, results are cached by query."""
+        if self.llm_chain:
+            cache_key = (_llm_cache_key(self.llm_chain), query)
+            keywords = _keywords_cache.get(cache_key)
+            if keywords is not None:
+                return list(keywords)
+            keywords_str = self.llm_chain.run(query)
+            print('keywords_str:', keywords_str)
+            try:
+                keywords = ast.literal_eval(keywords_str.strip())
+                if not isinstance(keywords, list):
+                    raise ValueError('Keywords extracted by llm is not list.')
+                _keywords_cache.set(cache_key, tuple(keywords))
+                return keywords
+            except Exception as e:
+                print(str(e))
+
+        cache_key = ('jieba', query)
+        keywords = _keywords_cache.get(cache_key)
+        if keywords is None:
+            keywords = tuple(jieba.analyse.extract_tags(query, topK=10, withWeight=False))
+            _keywords_cache.set(cache_key, keywords)
+        return list(keywords)
+
     @classmethod
     def from_texts(
         cls,
@@ -288,17 +428,25 @@ class ElasticKeywordsSearch(VectorStore, ABC):
                                refresh_indices=refresh_indices)
         return vectorsearch
 
+    def es_version(self, client: Any) -> int:
+        """Major version of the es server, cached by url."""
+        if client is not self.client:
+            return int(client.info()['version']['number'].split('.')[0])
+        version_num = _es_versions.get(self.elasticsearch_url)
+        if version_num is None:
+            version_num = int(client.info()['version']['number'].split('.')[0])
+            _es_versions[self.elasticsearch_url] = version_num
+        return version_num
+
     def create_index(self, client: Any, index_name: str, mapping: Dict) -> None:
-        version_num = client.info()['version']['number'][0]
-        version_num = int(version_num)
+        version_num = self.es_version(client)
         if version_num >= 8:
             client.indices.create(index=index_name, mappings=mapping)
         else:
             client.indices.create(index=index_name, body={'mappings': mapping})
 
     def client_search(self, client: Any, index_name: str, script_query: Dict, size: int) -> Any:
-        version_num = client.info()['version']['number'][0]
-        version_num = int(version_num)
+        version_num = self.es_version(client)
         if version_num >= 8:
             response = client.search(index=index_name, query=script_query, size=size)
         else:
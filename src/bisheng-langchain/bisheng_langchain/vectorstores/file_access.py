@@ -0,0 +1,91 @@
+"""Cached file access decisions for knowledge retrieval.
+
+The file access service answers, for one user (the username is part of the
+access url), which of the given file ids can be read. Decisions are cached
+per (access url, file id) for ttl seconds, so a retrieval only asks the
+service for files it has not seen recently.
+"""
+import json
+import logging
+import threading
+import time
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from bisheng_langchain.utils import transport
+
+logger = logging.getLogger(__name__)
+
+
+class FileAccessError(Exception):
+    """The file access service did not return the decisions."""
+
+
+class FileAccessCache(object):
+
+    def __init__(self, ttl: float = 60, timeout: float = 5, max_users: int = 1024):
+        self.ttl = ttl
+        self.timeout = timeout
+        self.max_users = max_users
+        # access_url -> {file_id: (allowed, checked_at)}
+        self._decisions: Dict[str, Dict[int, Tuple[bool, float]]] = {}
+        self._lock = threading.Lock()
+
+    def _split(self, access_url: str, file_ids: Iterable[int]) -> Tuple[Dict[int, bool], List[int]]:
+        """Return (cached decisions, file ids to ask the service for)."""
+        now = time.monotonic()
+        cached, missing = {}, []
+        decisions = self._decisions.get(access_url) or {}
+        for file_id in dict.fromkeys(file_ids):
+            item = decisions.get(file_id)
+            if item is not None and now - item[1] < self.ttl:
+                cached[file_id] = item[0]
+            else:
+                missing.append(file_id)
+        return cached, missing
+
+    def _store(self, access_url: str, file_ids: List[int], status_code: int, text: str) -> Dict[int, bool]:
+        if status_code != 200:
+            logger.error(f'query_file_access_fail url={access_url} res={text}')
+            raise FileAccessError(f'query file access failed status_code={status_code}')
+        doc_res = json.loads(text).get('data') or []
+        doc_right = {doc.get('docid') for doc in doc_res if doc.get('result') == 1}
+        now = time.monotonic()
+        result = {file_id: file_id in doc_right for file_id in file_ids}
+        with self._lock:
+            decisions = self._decisions.get(access_url)
+            if decisions is None:
+                if len(self._decisions) >= self.max_users:
+                    # 用户数超过上限时丢弃最早的用户
+                    self._decisions.pop(next(iter(self._decisions)))
+                decisions = self._decisions[access_url] = {}
+            for file_id, allowed in result.items():
+                decisions[file_id] = (allowed, now)
+        return result
+
+    def check(self, access_url: str, file_ids: Iterable[int]) -> Dict[int, bool]:
+        """Return {file_id: allowed}, only the uncached file ids are sent to the service."""
+        cached, missing = self._split(access_url, file_ids)
+        if missing:
+            res = transport.get_sync_session().get(access_url, json=missing, timeout=self.timeout)
+            cached.update(self._store(access_url, missing, res.status_code, res.text))
+        return cached
+
+    async def acheck(self, access_url: str, file_ids: Iterable[int]) -> Dict[int, bool]:
+        """Async version of check."""
+        cached, missing = self._split(access_url, file_ids)
+        if missing:
+            async with transport.arequest('GET', access_url, self.timeout, json=missing) as res:
+                status_code, text = res.status, await res.text()
+            cached.update(self._store(access_url, missing, status_code, text))
+        return cached
+
+    def invalidate(self, access_url: Optional[str] = None) -> None:
+        """Drop the decisions of one user, or of all users when access_url is None."""
+        with self._lock:
+            if access_url is None:
+                self._decisions.clear()
+            else:
+                self._decisions.pop(access_url, None)
+
+
+file_access_cache = FileAccessCache()
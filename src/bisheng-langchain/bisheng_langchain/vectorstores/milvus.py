@@ -1,15 +1,18 @@
 """Wrapper around the Milvus vector database."""
 from __future__ import annotations
 
+import contextvars
 import logging
-from typing import Any, Callable, Iterable, List, Optional, Tuple, Union
+from concurrent.futures import Future, ThreadPoolExecutor
+from itertools import islice
+from typing import Any, Callable, Iterable, Iterator, List, Optional, Tuple, Union
 from uuid import uuid4
 
-import numpy as np
+from bisheng_langchain.utils import tracing
+from bisheng_langchain.utils.vectors import Vectors, as_float32, maximal_marginal_relevance
 from langchain.docstore.document import Document
 from langchain.embeddings.base import Embeddings
 from langchain.vectorstores.milvus import Milvus as MilvusLangchain
-from langchain.vectorstores.utils import maximal_marginal_relevance
 
 logger = logging.getLogger(__name__)
 
@@ -427,9 +430,11 @@ class Milvus(MilvusLangchain):
     def add_texts(
         self,
         texts: Iterable[str],
-        metadatas: Optional[List[dict]] = None,
+        metadatas: Optional[Iterable[dict]] = None,
         timeout: Optional[int] = None,
         batch_size: int = 1000,
+        flush: bool = False,
+        progress_callback: Optional[Callable[[int], None]] = None,
         **kwargs: Any,
     ) -> List[str]:
         """Insert text data into Milvus.
@@ -441,15 +446,22 @@ class Milvus(MilvusLangchain):
         Metada keys will need to be present for all inserted values. At
         the moment there is no None equivalent in Milvus.
 
+        Texts are consumed in windows of batch_size, the next window is
+        embedded while the previous one is being inserted, so at most two
+        windows are held in memory.
+
         Args:
-            texts (Iterable[str]): The texts to embed, it is assumed
-                that they all fit in memory.
-            metadatas (Optional[List[dict]]): Metadata dicts attached to each of
+            texts (Iterable[str]): The texts to embed, may be a generator.
+            metadatas (Optional[Iterable[dict]]): Metadata dicts attached to each of
                 the texts. Defaults to None.
             timeout (Optional[int]): Timeout for each batch insert. Defaults
                 to None.
-            batch_size (int, optional): Batch size to use for insertion.
-                Defaults to 1000.
+            batch_size (int, optional): Batch size to use for embedding and
+                insertion. Defaults to 1000.
+            flush (bool): Flush the collection after all batches are inserted.
+                Defaults to False.
+            progress_callback (Optional[Callable[[int], None]]): Called with the
+                number of inserted texts after each batch. Defaults to None.
 
         Raises:
             MilvusException: Failure to add texts
@@ -457,23 +469,67 @@ class Milvus(MilvusLangchain):
         Returns:
             List[str]: The resulting keys for each inserted element.
         """
-        from pymilvus import Collection, MilvusException
-
-        texts = list(texts)
-
-        try:
-            embeddings = self.embedding_func.embed_documents(texts)
-        except NotImplementedError:
-            embeddings = [self.embedding_func.embed_query(x) for x in texts]
+        from pymilvus import Collection
 
-        if len(embeddings) == 0:
+        pks: list[str] = []
+        inserted = 0
+        # 写入中的批次 (future, 起始位置, 条数)
+        pending = None
+        with tracing.span('milvus.add_texts') as add_span, \
+                ThreadPoolExecutor(max_workers=1, thread_name_prefix='milvus_insert') as executor:
+            for start, batch_texts, batch_metadatas in self._iter_batches(texts, metadatas, batch_size):
+                embeddings = self._embed_batch(batch_texts)
+                # If the collection hasn't been initialized yet, perform all steps to do so
+                if not isinstance(self.col, Collection):
+                    self._init(embeddings, batch_metadatas)
+                insert_list = self._insert_columns(batch_texts, embeddings, batch_metadatas)
+                del embeddings
+                # 上一批写入完成后再提交，内存中最多保留两批数据
+                if pending is not None:
+                    inserted += self._wait_insert(pending, pks)
+                    if progress_callback:
+                        progress_callback(inserted)
+                # 复制上下文，写入的span挂在 milvus.add_texts 下
+                future = executor.submit(contextvars.copy_context().run, self._insert_batch, insert_list,
+                                         timeout, kwargs)
+                pending = (future, start, len(batch_texts))
+                del insert_list
+            if pending is not None:
+                inserted += self._wait_insert(pending, pks)
+                if progress_callback:
+                    progress_callback(inserted)
+            add_span.set_attribute('count', inserted)
+
+        if inserted == 0:
             logger.debug('Nothing to insert, skipping.')
             return []
+        if flush:
+            self.col.flush(timeout=timeout)
+        return pks
 
-        # If the collection hasn't been initialized yet, perform all steps to do so
-        if not isinstance(self.col, Collection):
-            self._init(embeddings, metadatas)
+    @staticmethod
+    def _iter_batches(texts: Iterable[str], metadatas: Optional[Iterable[dict]],
+                      batch_size: int) -> Iterator[Tuple[int, List[str], Optional[List[dict]]]]:
+        """Yield (start, texts, metadatas) windows without materializing the input."""
+        texts = iter(texts)
+        metadatas = iter(metadatas) if metadatas is not None else None
+        start = 0
+        while True:
+            batch_texts = list(islice(texts, batch_size))
+            if not batch_texts:
+                return
+            batch_metadatas = list(islice(metadatas, len(batch_texts))) if metadatas is not None else None
+            yield start, batch_texts, batch_metadatas
+            start += len(batch_texts)
+
+    def _embed_batch(self, texts: List[str]) -> Vectors:
+        try:
+            return self.embedding_func.embed_documents(texts)
+        except NotImplementedError:
+            return [self.embedding_func.embed_query(x) for x in texts]
 
+    def _insert_columns(self, texts: List[str], embeddings: Vectors,
+                        metadatas: Optional[List[dict]]) -> List[list]:
         # Dict to hold all insert columns
         insert_dict: dict[str, list] = {
             self._text_field: texts,
@@ -487,27 +543,25 @@ class Milvus(MilvusLangchain):
                     if key in self.fields:
                         insert_dict.setdefault(key, []).append(value)
 
-        # Total insert count
-        vectors: list = insert_dict[self._vector_field]
-        total_count = len(vectors)
+        # Convert dict to list of lists for insertion
+        return [insert_dict[x] for x in self.fields if x in insert_dict]
 
-        pks: list[str] = []
+    def _insert_batch(self, insert_list: List[list], timeout: Optional[int], kwargs: dict):
+        with tracing.span('milvus.insert', count=len(insert_list[0]) if insert_list else 0):
+            return self.col.insert(insert_list, timeout=timeout, **kwargs)
 
-        assert isinstance(self.col, Collection)
-        for i in range(0, total_count, batch_size):
-            # Grab end index
-            end = min(i + batch_size, total_count)
-            # Convert dict to list of lists batch for insertion
-            insert_list = [insert_dict[x][i:end] for x in self.fields if x in insert_dict]
-            # Insert into the collection.
-            try:
-                res: Collection
-                res = self.col.insert(insert_list, timeout=timeout, **kwargs)
-                pks.extend(res.primary_keys)
-            except MilvusException as e:
-                logger.error('Failed to insert batch starting at entity: %s/%s', i, total_count)
-                raise e
-        return pks
+    @staticmethod
+    def _wait_insert(pending: Tuple[Future, int, int], pks: List[str]) -> int:
+        from pymilvus import MilvusException
+
+        future, start, count = pending
+        try:
+            res = future.result()
+        except MilvusException as e:
+            logger.error('Failed to insert batch starting at entity: %s, size: %s', start, count)
+            raise e
+        pks.extend(res.primary_keys)
+        return count
 
     def similarity_search(
         self,
@@ -669,16 +723,17 @@ class Milvus(MilvusLangchain):
                 expr = f"{self._partition_field}==\"{kwargs['partition_key']}\""
 
         # Perform the search.
-        res = self.col.search(
-            data=[embedding],
-            anns_field=self._vector_field,
-            param=param,
-            limit=k,
-            expr=expr,
-            output_fields=output_fields,
-            timeout=timeout,
-            **kwargs,
-        )
+        with tracing.span('milvus.search', k=k):
+            res = self.col.search(
+                data=[embedding],
+                anns_field=self._vector_field,
+                param=param,
+                limit=k,
+                expr=expr,
+                output_fields=output_fields,
+                timeout=timeout,
+                **kwargs,
+            )
         # Organize results.
         ret = []
         for result in res[0]:
@@ -783,16 +838,17 @@ class Milvus(MilvusLangchain):
         output_fields.remove(self._vector_field)
 
         # Perform the search.
-        res = self.col.search(
-            data=[embedding],
-            anns_field=self._vector_field,
-            param=param,
-            limit=fetch_k,
-            expr=expr,
-            output_fields=output_fields,
-            timeout=timeout,
-            **kwargs,
-        )
+        with tracing.span('milvus.search', k=fetch_k, mmr=True):
+            res = self.col.search(
+                data=[embedding],
+                anns_field=self._vector_field,
+                param=param,
+                limit=fetch_k,
+                expr=expr,
+                output_fields=output_fields,
+                timeout=timeout,
+                **kwargs,
+            )
         # Organize results.
         ids = []
         documents = []
@@ -804,18 +860,20 @@ class Milvus(MilvusLangchain):
             scores.append(result.score)
             ids.append(result.id)
 
-        vectors = self.col.query(
-            expr=f'{self._primary_field} in {ids}',
-            output_fields=[self._primary_field, self._vector_field],
-            timeout=timeout,
-        )
+        with tracing.span('milvus.query', count=len(ids)):
+            vectors = self.col.query(
+                expr=f'{self._primary_field} in {ids}',
+                output_fields=[self._primary_field, self._vector_field],
+                timeout=timeout,
+            )
         # Reorganize the results from query to match search order.
         vectors = {x[self._primary_field]: x[self._vector_field] for x in vectors}
 
-        ordered_result_embeddings = [vectors[x] for x in ids]
+        ordered_result_embeddings = as_float32([vectors[x] for x in ids])
+        del vectors
 
         # Get the new order of results.
-        new_ordering = maximal_marginal_relevance(np.array(embedding),
+        new_ordering = maximal_marginal_relevance(embedding,
                                                   ordered_result_embeddings,
                                                   k=k,
                                                   lambda_mult=lambda_mult)
@@ -1,11 +1,14 @@
 from __future__ import annotations
 
-from typing import TYPE_CHECKING, ClassVar, Collection, Dict, List
-from venv import logger
+import logging
+from typing import TYPE_CHECKING, Callable, ClassVar, Collection, Dict, List, Optional, Tuple
 
-import requests
+from bisheng_langchain.utils import transport
+from bisheng_langchain.vectorstores.elastic_keywords_search import ElasticKeywordsSearch
+from bisheng_langchain.vectorstores.file_access import FileAccessError, file_access_cache
 from langchain.schema.document import Document
 from langchain.vectorstores.base import VectorStore, VectorStoreRetriever
+from langchain.vectorstores.milvus import Milvus as MilvusLangchain
 from langchain_core.pydantic_v1 import Field, root_validator
 
 if TYPE_CHECKING:
@@ -14,6 +17,8 @@ if TYPE_CHECKING:
         CallbackManagerForRetrieverRun,
     )
 
+logger = logging.getLogger(__name__)
+
 
 class VectorStoreFilterRetriever(VectorStoreRetriever):
     vectorstore: VectorStore
@@ -25,6 +30,11 @@ class VectorStoreFilterRetriever(VectorStoreRetriever):
         'mmr',
     )
     access_url: str = None
+    file_ids_getter: Optional[Callable[[], List[int]]] = None
+    """Returns the file ids of the searched knowledge, used to push the allow-list into the query."""
+    max_filter_ids: int = 1000
+    """Knowledge with more files is not pre-filtered, results are over-fetched and filtered."""
+    overfetch_factor: int = 3
 
     class Config:
         """Configuration for this pydantic object."""
@@ -45,53 +55,150 @@ class VectorStoreFilterRetriever(VectorStoreRetriever):
                                  'in `search_kwargs`.')
         return values
 
-    def _get_relevant_documents(self, query: str, *,
-                                run_manager: CallbackManagerForRetrieverRun) -> List[Document]:
+    def _search(self, query: str, search_kwargs: dict) -> List[Document]:
         if self.search_type == 'similarity':
-            docs = self.vectorstore.similarity_search(query, **self.search_kwargs)
+            docs = self.vectorstore.similarity_search(query, **search_kwargs)
         elif self.search_type == 'similarity_score_threshold':
             docs_and_similarities = (self.vectorstore.similarity_search_with_relevance_scores(
-                query, **self.search_kwargs))
+                query, **search_kwargs))
             docs = [doc for doc, _ in docs_and_similarities]
         elif self.search_type == 'mmr':
-            docs = self.vectorstore.max_marginal_relevance_search(query, **self.search_kwargs)
+            docs = self.vectorstore.max_marginal_relevance_search(query, **search_kwargs)
         else:
             raise ValueError(f'search_type of {self.search_type} not allowed.')
+        return docs
 
-        return self.get_file_access(docs)
-
-    async def _aget_relevant_documents(
-            self, query: str, *,
-            run_manager: AsyncCallbackManagerForRetrieverRun) -> List[Document]:
+    async def _asearch(self, query: str, search_kwargs: dict) -> List[Document]:
         if self.search_type == 'similarity':
-            docs = await self.vectorstore.asimilarity_search(query, **self.search_kwargs)
+            docs = await self.vectorstore.asimilarity_search(query, **search_kwargs)
         elif self.search_type == 'similarity_score_threshold':
             docs_and_similarities = (await
                                      self.vectorstore.asimilarity_search_with_relevance_scores(
-                                         query, **self.search_kwargs))
+                                         query, **search_kwargs))
             docs = [doc for doc, _ in docs_and_similarities]
         elif self.search_type == 'mmr':
             docs = await self.vectorstore.amax_marginal_relevance_search(
-                query, **self.search_kwargs)
+                query, **search_kwargs)
         else:
             raise ValueError(f'search_type of {self.search_type} not allowed.')
-        return self.get_file_access(docs)
+        return docs
 
-    def get_file_access(self, docs: List[Document]):
-        file_ids = [doc.metadata.get('file_id') for doc in docs if 'file_id' in doc.metadata]
-        if file_ids:
-            res = requests.get(self.access_url, json=file_ids)
-            if res.status_code == 200:
-                doc_res = res.json().get('data') or []
-                doc_right = {doc.get('docid') for doc in doc_res if doc.get('result') == 1}
-                for doc in docs:
-                    if doc.metadata.get('file_id') and doc.metadata.get(
-                            'file_id') not in doc_right:
-                        doc.page_content = ''
-                        doc.metadata['right'] = False
-                return docs
-            else:
-                logger.error(f'query_file_access_fail url={self.access_url} res={res.text}')
-                return [Document(page_content='', metadata={})]
+    def _get_relevant_documents(self, query: str, *,
+                                run_manager: CallbackManagerForRetrieverRun) -> List[Document]:
+        try:
+            if self._can_prefilter():
+                file_ids = self._prefilter_file_ids(self.file_ids_getter())
+                if file_ids is not None:
+                    allowed = self._allowed_file_ids(file_access_cache.check(self.access_url, file_ids))
+                    return self._search(query, self._prefilter_kwargs(allowed))
+            search_kwargs, k = self._overfetch_kwargs()
+            docs = self._search(query, search_kwargs)
+            decisions = file_access_cache.check(self.access_url, self._file_ids(docs))
+        except FileAccessError:
+            return [Document(page_content='', metadata={})]
+        return self._post_filter(docs, decisions, k)
+
+    async def _aget_relevant_documents(
+            self, query: str, *,
+            run_manager: AsyncCallbackManagerForRetrieverRun) -> List[Document]:
+        try:
+            if self._can_prefilter():
+                file_ids = self._prefilter_file_ids(await transport.run_sync(self.file_ids_getter))
+                if file_ids is not None:
+                    allowed = self._allowed_file_ids(await file_access_cache.acheck(self.access_url, file_ids))
+                    return await self._asearch(query, self._prefilter_kwargs(allowed))
+            search_kwargs, k = self._overfetch_kwargs()
+            docs = await self._asearch(query, search_kwargs)
+            decisions = await file_access_cache.acheck(self.access_url, self._file_ids(docs))
+        except FileAccessError:
+            return [Document(page_content='', metadata={})]
+        return self._post_filter(docs, decisions, k)
+
+    def _can_prefilter(self) -> bool:
+        if self.file_ids_getter is None:
+            return False
+        if isinstance(self.vectorstore, MilvusLangchain):
+            # collection 没有 file_id 字段时无法按文件过滤
+            return 'file_id' in (getattr(self.vectorstore, 'fields', None) or [])
+        return isinstance(self.vectorstore, ElasticKeywordsSearch)
+
+    def _prefilter_file_ids(self, file_ids: List[int]) -> Optional[List[int]]:
+        """ 知识库文件太多时不做预过滤，也不向权限服务查询全部文件 """
+        if len(file_ids) > self.max_filter_ids:
+            logger.info(f'file_access file_ids={len(file_ids)} too large, over fetch instead')
+            return None
+        return file_ids
+
+    @staticmethod
+    def _allowed_file_ids(decisions: Dict[int, bool]) -> List[int]:
+        # 没有 file_id 的 chunk 不做权限校验，Milvus 中以 0 保存
+        return [0] + [file_id for file_id, right in decisions.items() if right]
+
+    def _prefilter_kwargs(self, allowed: List[int]) -> dict:
+        search_kwargs = dict(self.search_kwargs)
+        if isinstance(self.vectorstore, ElasticKeywordsSearch):
+            search_kwargs['filter'] = [{
+                'bool': {
+                    'should': [{
+                        'terms': {
+                            'metadata.file_id': allowed
+                        }
+                    }, {
+                        'bool': {
+                            'must_not': {
+                                'exists': {
+                                    'field': 'metadata.file_id'
+                                }
+                            }
+                        }
+                    }],
+                    'minimum_should_match': 1
+                }
+            }]
         else:
+            expr = f'file_id in {allowed}'
+            search_kwargs['expr'] = f"({search_kwargs['expr']}) and {expr}" if search_kwargs.get(
+                'expr') else expr
+        return search_kwargs
+
+    def _overfetch_kwargs(self) -> Tuple[dict, int]:
+        """ 无法预过滤时多召回一些，过滤掉无权限的文档后仍有k个结果 """
+        search_kwargs = dict(self.search_kwargs)
+        k = search_kwargs.get('k', 4)
+        search_kwargs['k'] = k * self.overfetch_factor
+        if self.search_type == 'mmr':
+            search_kwargs['fetch_k'] = max(search_kwargs.get('fetch_k', 20), search_kwargs['k'])
+        return search_kwargs, k
+
+    @staticmethod
+    def _file_ids(docs: List[Document]) -> List[int]:
+        return [doc.metadata['file_id'] for doc in docs if doc.metadata.get('file_id')]
+
+    @staticmethod
+    def _post_filter(docs: List[Document], decisions: Dict[int, bool], k: int) -> List[Document]:
+        """ 返回前k个有权限的文档，原本排在前k的无权限文档内容置空并标记 right=False """
+        allowed, denied = [], []
+        for index, doc in enumerate(docs):
+            if not doc.metadata.get('file_id') or decisions.get(doc.metadata['file_id']):
+                if len(allowed) < k:
+                    allowed.append(doc)
+            elif index < k:
+                doc.page_content = ''
+                doc.metadata['right'] = False
+                denied.append(doc)
+        return allowed + denied
+
+    def get_file_access(self, docs: List[Document]):
+        """ 检索后校验文件权限，无权限的文档内容置空 """
+        file_ids = self._file_ids(docs)
+        if not file_ids:
             return docs
+        try:
+            decisions = file_access_cache.check(self.access_url, file_ids)
+        except FileAccessError:
+            return [Document(page_content='', metadata={})]
+        for doc in docs:
+            if doc.metadata.get('file_id') and not decisions.get(doc.metadata['file_id']):
+                doc.page_content = ''
+                doc.metadata['right'] = False
+        return docs
@@ -0,0 +1,56 @@
+"""
+pdf 抽取吞吐评测
+
+python benchmark_extract.py <pdf_folder> [ellm_api_url] [schema]
+不传 ellm_api_url 时只评测页面渲染；传入时对比串行和并发抽取的 页/秒。
+"""
+import os
+import sys
+import time
+
+from ellm_extract import EllmExtract, transpdf2png
+from llm_extract import init_logger
+from bisheng_langchain.document_loaders.parsers.pdf_pages import iter_pdf_pages, pdf_page_count
+
+logger = init_logger(__name__)
+
+
+def list_pdfs(pdf_folder):
+    return [os.path.join(pdf_folder, name) for name in sorted(os.listdir(pdf_folder)) if name.endswith('.pdf')]
+
+
+def report(name, pages, cost):
+    logger.info(f'{name}: pages={pages} cost={cost:.2f}s throughput={pages / max(cost, 1e-6):.2f} pages/s')
+
+
+def bench_render(pdf_paths, render_workers):
+    start = time.time()
+    pages = 0
+    for pdf_path in pdf_paths:
+        if render_workers is None:
+            pages += len(transpdf2png(pdf_path))
+        else:
+            pages += sum(1 for _ in iter_pdf_pages(pdf_path, min_side=2560, render_workers=render_workers))
+    report(f'render workers={render_workers}', pages, time.time() - start)
+
+
+def bench_extract(pdf_paths, api_url, schema, max_concurrency, render_workers):
+    client = EllmExtract(api_base_url=api_url, max_concurrency=max_concurrency, render_workers=render_workers)
+    pages = sum(pdf_page_count(pdf_path) for pdf_path in pdf_paths)
+    start = time.time()
+    for pdf_path in pdf_paths:
+        client.predict(pdf_path, schema)
+    report(f'extract concurrency={max_concurrency} render_workers={render_workers}', pages, time.time() - start)
+
+
+if __name__ == '__main__':
+    pdf_paths = list_pdfs(sys.argv[1])
+    # None 表示原来的整本渲染方式
+    for render_workers in [None, 0, 2, 4]:
+        bench_render(pdf_paths, render_workers)
+
+    if len(sys.argv) > 2:
+        api_url = sys.argv[2]
+        schema = sys.argv[3] if len(sys.argv) > 3 else '合同标题|合同编号|借款人|贷款人|借款金额'
+        for max_concurrency, render_workers in [(1, 0), (4, 2), (8, 4)]:
+            bench_extract(pdf_paths, api_url, schema, max_concurrency, render_workers)
@@ -1,5 +1,6 @@
 import os
 import json
+from concurrent.futures import ThreadPoolExecutor
 from tqdm import tqdm
 from ellm_extract import EllmExtract
 from llm_extract import LlmExtract
@@ -98,15 +99,27 @@ class DocumentExtract(object):
 
         return ellm_kv_results, llm_kv_results, final_kv_results
 
-    def predict_all_pdf(self, pdf_folder, schema, save_folder):
+    def predict_all_pdf(self, pdf_folder, schema, save_folder, max_workers=1):
+        """
+        max_workers > 1 时多个pdf并行处理，每个pdf内部的页面本身也是并发请求的
+        """
         if not os.path.exists(save_folder):
             os.makedirs(save_folder)
         pdf_names = os.listdir(pdf_folder)
-        for pdf_name in tqdm(pdf_names):
+
+        def process(pdf_name):
             logger.info(f'process pdf: {pdf_name}')
             pdf_path = os.path.join(pdf_folder, pdf_name)
-            ellm_kv_results, llm_kv_results, final_kv_results = self.predict_one_pdf(
-                pdf_path, schema, save_folder)
+            return self.predict_one_pdf(pdf_path, schema, save_folder)
+
+        if max_workers <= 1:
+            for pdf_name in tqdm(pdf_names):
+                process(pdf_name)
+            return
+
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            for _ in tqdm(executor.map(process, pdf_names), total=len(pdf_names)):
+                pass
 
 
 if __name__ == '__main__':
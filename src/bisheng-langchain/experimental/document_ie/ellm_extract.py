@@ -7,9 +7,12 @@ import numpy as np
 import cv2
 import filetype
 from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from requests.adapters import HTTPAdapter
 from PIL import Image
 from typing import Any, Iterator, List, Mapping, Optional, Union
 from llm_extract import init_logger
+from bisheng_langchain.document_loaders.parsers.pdf_pages import iter_pdf_pages, map_ordered
 
 
 logger = init_logger(__name__)
@@ -44,9 +47,18 @@ def transpdf2png(pdf_file):
 
 
 class EllmExtract(object):
-    def __init__(self, api_base_url: str = 'http://192.168.106.20:3502/v2/idp/idp_app/infer'):
+    def __init__(self,
+                 api_base_url: str = 'http://192.168.106.20:3502/v2/idp/idp_app/infer',
+                 max_concurrency: int = 4,
+                 render_workers: Optional[int] = None):
         self.ep = api_base_url
+        # 并发请求的页数上限，以及渲染pdf页面的进程数(0表示在当前进程渲染)
+        self.max_concurrency = max_concurrency
+        self.render_workers = render_workers
         self.client = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max(1, max_concurrency))
+        self.client.mount('http://', adapter)
+        self.client.mount('https://', adapter)
         self.timeout = 10000
         self.params = {
             'sort_filter_boxes': True,
@@ -114,27 +126,32 @@ class EllmExtract(object):
                 kv_results[key] = value['text']
 
         elif file_type == 'pdf':
-            pdf_images = transpdf2png(file_path)
-            kv_results = defaultdict(list)
-            for pdf_name in pdf_images:
-                page = int(pdf_name.split('page_')[-1])
+            pages = iter_pdf_pages(file_path,
+                                   min_side=2560,
+                                   render_workers=self.render_workers,
+                                   prefetch=self.max_concurrency * 2)
 
-                b64data = convert_base64(pdf_images[pdf_name])
+            def predict_page(page):
+                page_number, b64data = page
                 payload = {'b64_image': b64data, 'keys': schema}
-                resp = self.predict_single_img(payload)
-
-                if 'code' in resp and resp['code'] == 200:
-                    key_values = resp['result']['ellm_result']
-                else:
-                    raise ValueError(f"ellm kv extract failed: {resp}")
+                return page_number, self.predict_single_img(payload)
 
-                for key, value in key_values.items():
-                    # text_info = [{'value': text, 'page': int(page)} for text in value['text']]
-                    # kv_results[key].extend(text_info)
-
-                    for text in value['text']:
-                        if text not in kv_results[key]:
-                            kv_results[key].append(text)
+            kv_results = defaultdict(list)
+            with ThreadPoolExecutor(max_workers=max(1, self.max_concurrency)) as executor:
+                # 按页码顺序合并结果，保证去重后的顺序和串行时一致
+                for page, resp in map_ordered(executor, predict_page, pages, self.max_concurrency):
+                    if 'code' in resp and resp['code'] == 200:
+                        key_values = resp['result']['ellm_result']
+                    else:
+                        raise ValueError(f"ellm kv extract failed: page={page} {resp}")
+
+                    for key, value in key_values.items():
+                        # text_info = [{'value': text, 'page': int(page)} for text in value['text']]
+                        # kv_results[key].extend(text_info)
+
+                        for text in value['text']:
+                            if text not in kv_results[key]:
+                                kv_results[key].append(text)
 
         logger.info(f'ellm kv results: {kv_results}')
         return kv_results
@@ -1,23 +1,37 @@
 import re
 import json
 import time
+import hashlib
+from collections import defaultdict
 from loguru import logger
 import os
+from langchain.embeddings import CacheBackedEmbeddings
 from langchain.embeddings.openai import OpenAIEmbeddings
 from langchain.schema import Document
+from langchain.storage import LocalFileStore
 from langchain.vectorstores import FAISS
 os.environ['OPENAI_API_KEY'] = ''
 os.environ['OPENAI_PROXY'] = ''
 
+# 跨查询复用的缓存, 批量评测时同一份年报只解析一次、同一批候选文本只建一次向量库
+# txt路径 -> DocTree
+DOC_TREE_CACHE = {}
+# 向量库缓存key -> FAISS store
+VECTOR_STORE_CACHE = {}
+
+
 def transform2dt(inputs: dict) -> dict:
     tables_pattern = inputs["tables_pattern"]
     dirty_patterns = inputs["dirty_patterns"]
     patterns = inputs["patterns"]
     comp_title_dict = inputs["comp_title_dict"]
+    vector_cache_path = inputs.get("VECTOR_CACHE_PATH", "./vector_cache")
     
     # encode_kwargs = {'normalize_embeddings': inputs['ENCODER_NORMALIZE_EMBEDDINGS'], 'device': 'cuda'}
     #  encoder = HuggingFaceEmbeddings(model_name=inputs['ENCODER_MODEL_PATH'], encode_kwargs=encode_kwargs)
-    encoder = OpenAIEmbeddings()
+    # 文本的embedding落盘缓存，不同查询命中相同文本时不再重复计算
+    encoder = CacheBackedEmbeddings.from_bytes_store(
+        OpenAIEmbeddings(), LocalFileStore(os.path.join(vector_cache_path, "embeddings")), namespace="doc_tree")
     def vector_search(docs, query, store_name, k=3, rel_thres=inputs['VECTOR_SEARCH_THRESHOLD_2']):
         start = time.time()
         store = build_vector_store([str(i) for i in docs], store_name)
@@ -28,8 +42,19 @@ def transform2dt(inputs: dict) -> dict:
         return [(docs[i[0].metadata["id"]], i[1]) for i in searched]
     
     def build_vector_store(lines, idx_name, read_cache=True, engine=FAISS, encoder=encoder):
-        documents = [Document(page_content=line, metadata={"id": id}) for id, line in enumerate(lines)] 
-        store = engine.from_documents(documents, embedding=encoder)
+        # idx_name 由 年报txt路径(公司、年份) + 节点 组成，再加上候选文本内容，保证txt变化后缓存失效
+        cache_key = hashlib.md5((idx_name + "\n" + "\n".join(lines)).encode("utf-8")).hexdigest()
+        if read_cache and cache_key in VECTOR_STORE_CACHE:
+            return VECTOR_STORE_CACHE[cache_key]
+
+        store_path = os.path.join(vector_cache_path, "faiss", cache_key)
+        if read_cache and os.path.exists(store_path):
+            store = engine.load_local(store_path, encoder)
+        else:
+            documents = [Document(page_content=line, metadata={"id": id}) for id, line in enumerate(lines)] 
+            store = engine.from_documents(documents, embedding=encoder)
+            store.save_local(store_path)
+        VECTOR_STORE_CACHE[cache_key] = store
         return store
     
     def is_number(string): return string in '1234567890' or re.fullmatch("-{0,1}[\d]+\.{0,1}[\d]+", strip_comma(string)) != None
@@ -193,6 +218,10 @@ def transform2dt(inputs: dict) -> dict:
             self.root = DocTreeNode("@root", type_=-1)
             self.root.path = self.path
             self.build_tree()
+            # 叶节点的倒排索引: 单字/双字 -> 叶节点下标，第一次检索时构建
+            self.leaf_index = None
+            # 查询词 -> 包含该词的叶节点下标
+            self.word_hits_cache = {}
 
         def json_loads(self):
             for line in self.lines:
@@ -295,44 +324,49 @@ def transform2dt(inputs: dict) -> dict:
                     # for debug
                     # print(f"#{type_}#", text)
 
-        def search_leaf(self, query, k=1, only_excel_node=True):
-            query_words = query.split(" ")
-            nodes = []
-            hit_lens = []
-            for node in self.leaves:
-                if only_excel_node and not node.is_excel:
+        def build_leaf_index(self):
+            """ 对所有叶节点建立单字和双字的倒排索引，整棵树只建一次 """
+            self.leaf_index = defaultdict(set)
+            for idx, node in enumerate(self.leaves):
+                text = str(node)
+                for i in range(len(text)):
+                    self.leaf_index[text[i]].add(idx)
+                    self.leaf_index[text[i:i + 2]].add(idx)
+
+        def word_hits(self, word):
+            """ 返回包含word的叶节点下标，先用倒排索引取候选，再做子串校验 """
+            if word in self.word_hits_cache:
+                return self.word_hits_cache[word]
+            if self.leaf_index is None:
+                self.build_leaf_index()
+
+            grams = [word] if len(word) == 1 else [word[i:i + 2] for i in range(len(word) - 1)]
+            postings = sorted((self.leaf_index.get(gram, set()) for gram in grams), key=len)
+            candidates = set.intersection(*postings) if postings else set()
+            hits = [idx for idx in sorted(candidates) if word in str(self.leaves[idx])]
+            self.word_hits_cache[word] = hits
+            return hits
+
+        def rank_leaves(self, query, k=1, only_excel_node=True):
+            """ 按命中的查询词总长度排序叶节点，同分时保持叶节点原有顺序 """
+            hit_lens = defaultdict(int)
+            for word in query.split(" "):
+                if not word:
                     continue
-                
-                nodes.append(node)
-                hit_len = 0
-                for word in query_words:
-                    if word in str(node):
-                        hit_len += len(word)
+                for idx in self.word_hits(word):
+                    if only_excel_node and not self.leaves[idx].is_excel:
+                        continue
+                    hit_lens[idx] += len(word)
+            ranked = sorted(hit_lens.items(), key=lambda x: (-x[1], x[0]))
+            return [self.leaves[idx] for idx, _ in ranked[:k]]
 
-                hit_lens.append(hit_len)
-            node_hit_zips = [(n, h) for n, h in zip(nodes, hit_lens)]
-            sorted_node_hit_zips = sorted(node_hit_zips, key=lambda x: x[1], reverse=True)
-            return [i[0] for i in sorted_node_hit_zips[:k] if i[1] > 0]
+        def search_leaf(self, query, k=1, only_excel_node=True):
+            return self.rank_leaves(query, k=k, only_excel_node=only_excel_node)
 
         def regular_search(self, query, k=1, only_excel_node=True):
             query_words = query.split(" ")
             print("#regular search", query_words)
-            nodes = []
-            hit_lens = []
-            for node in self.leaves:
-                if only_excel_node and not node.is_excel:
-                    continue
-                
-                nodes.append(node)
-                hit_len = 0
-                for word in query_words:
-                    if word in str(node):
-                        hit_len += len(word)
-
-                hit_lens.append(hit_len)
-            node_hit_zips = [(n, h) for n, h in zip(nodes, hit_lens)]
-            sorted_node_hit_zips = sorted(node_hit_zips, key=lambda x: x[1], reverse=True)
-            return [str(i[0]) for i in sorted_node_hit_zips[:k] if i[1] > 0]
+            return [str(i) for i in self.rank_leaves(query, k=k, only_excel_node=only_excel_node)]
             
         def search_node(self, query):
             nodes = []
@@ -352,7 +386,10 @@ def transform2dt(inputs: dict) -> dict:
     if pdf == None:
         path= None
     path = get_txt_path(pdf)
-    dt = DocTree(path)
+    dt = DOC_TREE_CACHE.get(path)
+    if dt is None:
+        dt = DocTree(path)
+        DOC_TREE_CACHE[path] = dt
     return {"doc_tree": dt}
 
         
@@ -0,0 +1,84 @@
+"""
+批量评测 DocTree 检索的单条耗时
+
+python test/test_doc_tree_latency.py C-list-question.json [limit]
+输出每条问题的 建树、叶节点检索、向量检索 耗时，以及整体的平均值/分位数。
+同一份年报的 DocTree 和向量库会在查询间复用，第二次命中同一公司同一年份时建树耗时应接近0。
+"""
+import json
+import os
+import re
+import sys
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from all_variables import all_variables  # noqa: E402
+from doc_tree import transform2dt  # noqa: E402
+from keywords import trans_extract_keywords  # noqa: E402
+from loguru import logger  # noqa: E402
+
+
+def analyze_query(inputs: dict) -> dict:
+    """ 与 preprocess.query_analyze 相同的公司名和年份抽取 """
+    jieba = inputs['_jieba']
+    query = re.sub("[(（）)]", "", inputs['query'])
+    comp_names = []
+    for qword in jieba.cut(query):
+        if qword in inputs['comps'] and qword not in comp_names:
+            comp_names.append(qword)
+        elif qword in inputs['comps_short'] and inputs['short_comp_dict'][qword] not in comp_names:
+            comp_names.append(inputs['short_comp_dict'][qword])
+    return {"comps_and_years": {"years": re.findall(r"\d{4}年", query), "comps": comp_names}}
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p))]
+
+
+def run(question_file: str, limit: int = None):
+    variables = all_variables({})
+    costs = {'build': [], 'leaf': [], 'vector': [], 'total': []}
+    with open(question_file, 'r') as f:
+        for idx, line in enumerate(f):
+            if limit is not None and idx >= limit:
+                break
+            query = json.loads(line)['question']
+            inputs = dict(variables, query=query)
+            inputs.update(analyze_query(inputs))
+            inputs.update(trans_extract_keywords(inputs))
+            result = inputs['query_analyze_result']
+            if not result['comps'] or not result['years']:
+                continue
+
+            start = time.time()
+            try:
+                dt = transform2dt(inputs)['doc_tree']
+            except Exception as e:
+                logger.warning(f'skip query={query} error={e}')
+                continue
+            build_end = time.time()
+            dt.search_leaf(' '.join([i.word for i in result['keywords']]), k=5, only_excel_node=False)
+            leaf_end = time.time()
+            dt.vector_search_node(query)
+            vector_end = time.time()
+
+            costs['build'].append(build_end - start)
+            costs['leaf'].append(leaf_end - build_end)
+            costs['vector'].append(vector_end - leaf_end)
+            costs['total'].append(vector_end - start)
+            logger.info(f'#{idx} build={build_end - start:.4f}s leaf={leaf_end - build_end:.4f}s '
+                        f'vector={vector_end - leaf_end:.4f}s query={query}')
+
+    if not costs['total']:
+        logger.info('no query evaluated')
+        return
+    for name, values in costs.items():
+        logger.info(f'{name}: n={len(values)} mean={sum(values) / len(values):.4f}s '
+                    f'p50={percentile(values, 0.5):.4f}s p95={percentile(values, 0.95):.4f}s '
+                    f'max={max(values):.4f}s')
+
+
+if __name__ == '__main__':
+    run(sys.argv[1], int(sys.argv[2]) if len(sys.argv) > 2 else None)
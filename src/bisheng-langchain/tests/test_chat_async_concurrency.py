@@ -0,0 +1,74 @@
+"""
+并发调用 provider chat model 的 agenerate, 验证异步路径不会阻塞事件循环
+
+python tests/test_chat_async_concurrency.py [并发数] [服务端延迟秒]
+本地起一个返回 minimax 格式的 mock 服务, 并发请求 ChatMinimaxAI.agenerate,
+输出总耗时以及事件循环的最大卡顿。异步路径下总耗时应接近单次延迟, 卡顿应在毫秒级。
+"""
+import asyncio
+import sys
+import time
+
+from aiohttp import web
+from bisheng_langchain.chat_models import ChatMinimaxAI
+from bisheng_langchain.utils import transport
+from langchain.schema.messages import HumanMessage
+
+
+def mock_app(delay: float) -> web.Application:
+
+    async def chatcompletion(request: web.Request) -> web.Response:
+        await asyncio.sleep(delay)
+        return web.json_response({
+            'created': int(time.time()),
+            'choices': [{'index': 0, 'finish_reason': 'stop', 'text': 'ok'}],
+            'usage': {'total_tokens': 10},
+            'base_resp': {'status_code': 0, 'status_msg': ''}
+        })
+
+    app = web.Application()
+    app.router.add_post('/v1/text/chatcompletion', chatcompletion)
+    return app
+
+
+async def monitor_lag(interval: float, lags: list, stop: asyncio.Event):
+    while not stop.is_set():
+        start = time.perf_counter()
+        await asyncio.sleep(interval)
+        lags.append(time.perf_counter() - start - interval)
+
+
+async def test_minimax_concurrency(concurrency: int = 50, delay: float = 0.5):
+    runner = web.AppRunner(mock_app(delay))
+    await runner.setup()
+    site = web.TCPSite(runner, '127.0.0.1', 0)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+
+    chat = ChatMinimaxAI(minimaxai_api_key='fake', minimaxai_group_id='fake')
+    chat.client.endpoint = f'http://127.0.0.1:{port}/v1/text/chatcompletion'
+
+    lags = []
+    stop = asyncio.Event()
+    lag_task = asyncio.create_task(monitor_lag(0.01, lags, stop))
+    start = time.perf_counter()
+    results = await asyncio.gather(
+        *[chat.agenerate([[HumanMessage(content=f'问题{i}')]]) for i in range(concurrency)])
+    cost = time.perf_counter() - start
+    stop.set()
+    await lag_task
+
+    assert all(r.generations[0][0].text == 'ok' for r in results)
+    print(f'concurrency={concurrency} delay={delay}s total={cost:.3f}s '
+          f'max_loop_lag={max(lags) * 1000:.1f}ms')
+    # 串行需要 concurrency * delay 秒
+    assert cost < delay * concurrency / 4
+
+    await transport.close_session()
+    await runner.cleanup()
+
+
+if __name__ == '__main__':
+    asyncio.run(
+        test_minimax_concurrency(int(sys.argv[1]) if len(sys.argv) > 1 else 50,
+                                 float(sys.argv[2]) if len(sys.argv) > 2 else 0.5))
@@ -0,0 +1,104 @@
+"""
+ElemCharacterTextSplitter 切分耗时评测
+
+python tests/test_elem_splitter_benchmark.py [页数] [chunk_size] [chunk_overlap]
+构造与 ElemUnstructuredLoader 输出相同结构的长文档(默认1000页, 每页含大量重复段落),
+对比 原方式(正则逐层切分, text.find 回查位置 + IntervalSearch) 与 切分时携带偏移量 的耗时，
+并统计两种方式 chunk_bboxes 不一致的 chunk 数(原方式遇到重复内容时可能定位到更早的位置)。
+"""
+import random
+import sys
+import time
+from collections import Counter
+
+from bisheng_langchain.document_loaders.elem_unstrcutured_loader import merge_partitions
+from bisheng_langchain.text_splitter import ElemCharacterTextSplitter, IntervalSearch
+from langchain.docstore.document import Document
+from langchain.text_splitter import RecursiveCharacterTextSplitter
+
+SENTENCES = [
+    '本公司主要从事数据库管理系统的研发、销售和服务。',
+    '报告期内，公司营业收入分别为 22,336.05 万元、44,211.08 万元和 74,383.00 万元。',
+    '公司所聘请的会计师事务所为天健会计师事务所（特殊普通合伙）。',
+    '本次发行前，公司的控股股东为中国软件与技术服务股份有限公司。',
+    '请投资者认真阅读本招股说明书正文内容。',
+]
+
+
+def build_document(pages: int, seed: int = 0) -> Document:
+    rng = random.Random(seed)
+    partitions = []
+    offset = 0
+    for page in range(1, pages + 1):
+        for i in range(rng.randint(8, 14)):
+            label = 'Title' if i == 0 else rng.choice(['Text', 'Text', 'Text', 'Table'])
+            text = ''.join(rng.choice(SENTENCES) for _ in range(rng.randint(1, 6)))
+            partitions.append({
+                'type': label,
+                'text': text,
+                'metadata': {
+                    'extra_data': {
+                        'bboxes': [[offset, 0, offset + 1, 1]],
+                        'pages': [page],
+                        'types': [label],
+                        'indexes': [[0, len(text) - 1]],
+                    }
+                }
+            })
+            offset += 1
+    content, metadata = merge_partitions(partitions)
+    metadata['source'] = 'bench.pdf'
+    return Document(page_content=content, metadata=metadata)
+
+
+def legacy_split(splitter: ElemCharacterTextSplitter, doc: Document):
+    """ 原实现: 正则逐层切分, text.find 回查 chunk 位置 """
+    text, metadata = doc.page_content, doc.metadata
+    pages, types, bboxes = metadata['pages'], metadata['types'], metadata['bboxes']
+    searcher = IntervalSearch(metadata['indexes'])
+    documents = []
+    index = -1
+    for chunk in RecursiveCharacterTextSplitter._split_text(splitter, text, splitter._separators):
+        index = text.find(chunk, index + 1)
+        norm_inter = searcher.find([index, index + len(chunk) - 1])
+        chunk_bboxes = [{'page': pages[j], 'bbox': bboxes[j]} for j in range(norm_inter[0], norm_inter[1] + 1)]
+        chunk_type = Counter([types[j] for j in norm_inter]).most_common(1)[0][0]
+        documents.append(
+            Document(page_content=chunk,
+                     metadata={
+                         'chunk_bboxes': chunk_bboxes,
+                         'chunk_type': chunk_type,
+                         'source': metadata.get('source', '')
+                     }))
+    return documents
+
+
+def main(pages, chunk_size, chunk_overlap):
+    doc = build_document(pages)
+    print(f'pages={pages} chars={len(doc.page_content)} elements={len(doc.metadata["indexes"])}')
+    splitter = ElemCharacterTextSplitter(chunk_size=chunk_size, chunk_overlap=chunk_overlap)
+
+    start = time.perf_counter()
+    legacy = legacy_split(splitter, doc)
+    legacy_cost = time.perf_counter() - start
+
+    start = time.perf_counter()
+    first_chunk = None
+    chunks = []
+    for chunk in splitter.iter_split_documents([doc]):
+        if first_chunk is None:
+            first_chunk = time.perf_counter() - start
+        chunks.append(chunk)
+    cost = time.perf_counter() - start
+
+    assert [c.page_content for c in chunks] == [c.page_content for c in legacy]
+    mismatch = sum(1 for a, b in zip(chunks, legacy) if a.metadata != b.metadata)
+    print(f'legacy: chunks={len(legacy)} cost={legacy_cost:.2f}s')
+    print(f'offset: chunks={len(chunks)} cost={cost:.2f}s first_chunk={first_chunk:.2f}s '
+          f'speedup={legacy_cost / cost:.1f}x bbox_mismatch={mismatch}')
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 1000,
+         int(sys.argv[2]) if len(sys.argv) > 2 else 500,
+         int(sys.argv[3]) if len(sys.argv) > 3 else 50)
@@ -0,0 +1,79 @@
+"""
+ElasticKeywordsSearch.add_texts 批量写入的吞吐和内存评测
+
+ES_URL=http://127.0.0.1:9200 python tests/test_es_bulk_index.py [chunk数] [线程数...]
+默认写入100万个chunk, 对比原来一次性构造全部action调用 bulk 的方式和分批并发写入的 docs/s 及内存峰值。
+"""
+import os
+import sys
+import time
+import tracemalloc
+import uuid
+
+from bisheng_langchain.vectorstores import ElasticKeywordsSearch
+
+ES_URL = os.environ.get('ES_URL', 'http://127.0.0.1:9200')
+SSL_VERIFY = {'basic_auth': ('elastic', os.environ.get('ES_PASSWORD', ''))} if os.environ.get('ES_PASSWORD') else {}
+INDEX_NAME = 'bench_bulk_index'
+TEXT = '达梦公司在过去三年中的流动比率如下：2021年：3.74倍；2020年：2.82倍；2019年：2.05倍。' * 5
+
+
+def iter_texts(n):
+    for i in range(n):
+        yield f'{i} {TEXT}'
+
+
+def iter_metadatas(n):
+    for i in range(n):
+        yield {'source': 'bench.pdf', 'chunk_index': i, 'file_id': i // 1000}
+
+
+def legacy_add_texts(es_store, n):
+    """原来的实现: 全部action放在一个列表中单线程bulk"""
+    from elasticsearch.helpers import bulk
+    texts = list(iter_texts(n))
+    metadatas = list(iter_metadatas(n))
+    ids = [str(uuid.uuid4()) for _ in texts]
+    requests = []
+    for i, text in enumerate(texts):
+        requests.append({
+            '_op_type': 'index',
+            '_index': INDEX_NAME,
+            'text': text,
+            'metadata': metadatas[i],
+            '_id': ids[i],
+        })
+    bulk(es_store.client, requests)
+
+
+def run(fn):
+    tracemalloc.start()
+    start = time.time()
+    fn()
+    cost = time.time() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return cost, peak
+
+
+def main(n, thread_counts):
+    es_store = ElasticKeywordsSearch(ES_URL, INDEX_NAME, ssl_verify=SSL_VERIFY)
+    es_store.add_texts(['init'], refresh_indices=False)
+
+    results = [('legacy', *run(lambda: legacy_add_texts(es_store, n)))]
+    for thread_count in thread_counts:
+        es_store.bulk_thread_count = thread_count
+        # metadatas 需要按下标访问, 这里只保留文本为生成器
+        metadatas = list(iter_metadatas(n))
+        results.append((f'threads={thread_count}',
+                        *run(lambda: es_store.add_texts(iter_texts(n), metadatas, refresh_indices=False))))
+
+    for name, cost, peak in results:
+        print(f'{name}: docs={n} cost={cost:.1f}s throughput={n / cost:.0f} docs/s '
+              f'peak_memory={peak / 1024 / 1024:.1f}MB')
+    es_store.delete()
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 1000000,
+         [int(i) for i in sys.argv[2:]] or [1, 4, 8])
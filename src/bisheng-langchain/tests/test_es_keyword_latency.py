@@ -0,0 +1,67 @@
+"""
+关键词检索耗时评测
+
+ES_URL=http://127.0.0.1:9200 python tests/test_es_keyword_latency.py [查询次数]
+对比每次查询都获取es版本、重新抽取关键词(原方式) 与 版本缓存+关键词缓存 的单次检索耗时。
+"""
+import os
+import sys
+import time
+
+from bisheng_langchain.vectorstores import ElasticKeywordsSearch
+from bisheng_langchain.vectorstores import elastic_keywords_search as eks
+from langchain.docstore.document import Document
+
+ES_URL = os.environ.get('ES_URL', 'http://127.0.0.1:9200')
+SSL_VERIFY = {'basic_auth': ('elastic', os.environ.get('ES_PASSWORD', ''))} if os.environ.get('ES_PASSWORD') else {}
+
+QUERIES = [
+    '达梦公司聘请了哪些券商作为主要保荐机构?',
+    '公司所聘请的会计师事务所是哪家？该会计师事务所是否具有丰富的上市公司审计经验?',
+    '公司是否有债务或其他财务义务?',
+    '达梦公司在过去三年中的流动比率是多少?',
+]
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p))]
+
+
+def report(name, costs):
+    print(f'{name}: n={len(costs)} mean={sum(costs) / len(costs) * 1000:.2f}ms '
+          f'p50={percentile(costs, 0.5) * 1000:.2f}ms p95={percentile(costs, 0.95) * 1000:.2f}ms')
+
+
+def bench(es_store, rounds, cached):
+    costs = []
+    for i in range(rounds):
+        if not cached:
+            eks._es_versions.clear()
+            eks._keywords_cache = eks._LRUCache()
+        start = time.perf_counter()
+        es_store.similarity_search(QUERIES[i % len(QUERIES)], k=4)
+        costs.append(time.perf_counter() - start)
+    report('cached' if cached else 'uncached', costs)
+
+
+def main(rounds):
+    start = time.perf_counter()
+    eks.preload_jieba()
+    print(f'preload jieba: {time.perf_counter() - start:.2f}s')
+
+    docs = [Document(page_content=f'{q} 相关内容{i}', metadata={'source': 'bench'}) for i, q in enumerate(QUERIES * 10)]
+    es_store = ElasticKeywordsSearch.from_documents(docs,
+                                                    embedding=None,
+                                                    elasticsearch_url=ES_URL,
+                                                    index_name='bench_keyword_latency',
+                                                    ssl_verify=SSL_VERIFY)
+    try:
+        bench(es_store, rounds, cached=False)
+        bench(es_store, rounds, cached=True)
+    finally:
+        es_store.delete()
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 200)
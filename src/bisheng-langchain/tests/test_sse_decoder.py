@@ -0,0 +1,77 @@
+"""
+流式响应解码的正确性和吞吐评测
+
+python tests/test_sse_decoder.py [token数] [chunk大小]
+构造 openai 格式的 sse 响应，按固定大小切分模拟 tcp 分包，
+对比原来按 chunk split 的解码方式和 StreamDecoder 的 tokens/s，
+同时统计原方式因事件被切分而丢失的 token 数。
+"""
+import json
+import random
+import sys
+import time
+
+from bisheng_langchain.utils.sse import StreamDecoder, iter_events
+
+
+def build_body(n_tokens: int) -> bytes:
+    lines = []
+    for i in range(n_tokens):
+        chunk = {'id': 'chatcmpl', 'choices': [{'index': 0, 'delta': {'content': f'词{i}'}}]}
+        lines.append(f'data: {json.dumps(chunk, ensure_ascii=False)}\n\n')
+    lines.append('data: [DONE]\n\n')
+    return ''.join(lines).encode('utf-8')
+
+
+def split_chunks(body: bytes, size: int):
+    return [body[i:i + size] for i in range(0, len(body), size)]
+
+
+def legacy_decode(chunks):
+    """原来 host_llm 中的解码方式"""
+    tokens = []
+    for txt in chunks:
+        parts = txt.split(b'\n') if b'\n' in txt else [txt]
+        for part in parts:
+            try:
+                line = part.decode('utf-8').strip()
+            except UnicodeDecodeError:
+                continue
+            if line.startswith('data:') and line[len('data:'):].strip().startswith('{'):
+                try:
+                    tokens.append(json.loads(line[len('data:'):])['choices'][0]['delta']['content'])
+                except json.JSONDecodeError:
+                    continue
+    return tokens
+
+
+def decoder_decode(chunks):
+    return [event.json()['choices'][0]['delta']['content'] for event in iter_events(chunks) if event.is_json]
+
+
+def test_split_anywhere():
+    body = b'event: message\r\ndata: {"a": "\xe4\xbd\xa0"}\r\n\r\n: ping\ndata: [DONE]\n{"b": 1}\nevent: error\ndata: {"c": 1}\n\n{"d": 1}'
+    expected = list(iter_events([body]))
+    assert [e.event for e in expected] == ['message', None, None, 'error', None]
+    for _ in range(1000):
+        cuts = sorted(random.sample(range(1, len(body)), random.randint(1, 30)))
+        chunks = [body[i:j] for i, j in zip([0] + cuts, cuts + [len(body)])]
+        decoder = StreamDecoder()
+        events = [e for chunk in chunks for e in decoder.feed(chunk)] + decoder.flush()
+        assert events == expected
+
+
+def bench(n_tokens: int = 100000, chunk_size: int = 256):
+    body = build_body(n_tokens)
+    chunks = split_chunks(body, chunk_size)
+    for name, decode in [('legacy', legacy_decode), ('decoder', decoder_decode)]:
+        start = time.perf_counter()
+        tokens = decode(chunks)
+        cost = time.perf_counter() - start
+        print(f'{name}: tokens={len(tokens)}/{n_tokens} lost={n_tokens - len(tokens)} '
+              f'cost={cost:.3f}s throughput={len(tokens) / cost:.0f} tokens/s')
+
+
+if __name__ == '__main__':
+    test_split_anywhere()
+    bench(int(sys.argv[1]) if len(sys.argv) > 1 else 100000, int(sys.argv[2]) if len(sys.argv) > 2 else 256)
@@ -0,0 +1,69 @@
+"""
+对比向量以 float 列表和 float32 数组表示时的内存、解码速度以及 MMR 耗时
+
+python tests/test_vector_float32.py [向量条数] [维度]
+1. 内存: tracemalloc 统计 n 条向量分别以 List[List[float]] 和 np.ndarray(float32) 保存的占用
+2. 解码: embedding 服务返回 json 列表与 base64 float32 时, 解析为向量的耗时
+3. MMR: langchain 的 maximal_marginal_relevance 与向量化实现的耗时, 并校验排序一致
+"""
+import base64
+import json
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+from bisheng_langchain.utils.vectors import decode_embeddings, maximal_marginal_relevance
+from langchain.vectorstores.utils import maximal_marginal_relevance as langchain_mmr
+
+
+def measure(func):
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = func()
+    cost = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, cost, peak
+
+
+def test_memory_and_decode(n: int = 50000, dim: int = 768):
+    vectors = np.random.rand(n, dim).astype(np.float32)
+    list_body = json.dumps({'embeddings': vectors.tolist()})
+    base64_body = json.dumps({'embeddings': [base64.b64encode(v.tobytes()).decode() for v in vectors]})
+
+    as_list, list_cost, list_peak = measure(lambda: json.loads(list_body)['embeddings'])
+    as_array, array_cost, array_peak = measure(lambda: decode_embeddings(json.loads(base64_body)['embeddings']))
+    assert np.array_equal(np.asarray(as_list, dtype=np.float32), as_array)
+
+    print(f'n={n} dim={dim} body list={len(list_body) / 2**20:.1f}MB base64={len(base64_body) / 2**20:.1f}MB')
+    print(f'list  decode={list_cost:.2f}s peak={list_peak / 2**20:.1f}MB')
+    print(f'array decode={array_cost:.2f}s peak={array_peak / 2**20:.1f}MB '
+          f'nbytes={as_array.nbytes / 2**20:.1f}MB')
+
+
+def test_mmr(fetch_k: int = 100, k: int = 20, dim: int = 768, rounds: int = 20):
+    query = np.random.rand(dim).astype(np.float32)
+    embeddings = np.random.rand(fetch_k, dim).astype(np.float32)
+    embedding_list = embeddings.tolist()
+
+    start = time.perf_counter()
+    for _ in range(rounds):
+        expected = langchain_mmr(np.array(query.tolist()), embedding_list, k=k, lambda_mult=0.5)
+    list_cost = (time.perf_counter() - start) / rounds
+
+    start = time.perf_counter()
+    for _ in range(rounds):
+        result = maximal_marginal_relevance(query, embeddings, k=k, lambda_mult=0.5)
+    array_cost = (time.perf_counter() - start) / rounds
+
+    assert result == expected, (result, expected)
+    print(f'mmr fetch_k={fetch_k} k={k} langchain={list_cost * 1000:.2f}ms '
+          f'vectorized={array_cost * 1000:.2f}ms')
+
+
+if __name__ == '__main__':
+    num = int(sys.argv[1]) if len(sys.argv) > 1 else 50000
+    dimension = int(sys.argv[2]) if len(sys.argv) > 2 else 768
+    test_memory_and_decode(num, dimension)
+    test_mmr(dim=dimension)